@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Compares request latency and event loop stalls between calling the
+synchronous Shove API from coroutines and using AsyncShove, with many
+concurrent clients.
+
+python benchmarks/bench_async.py [clients] [requests per client]
+'''
+
+from __future__ import print_function
+
+import sys
+import asyncio
+import random
+from timeit import default_timer
+
+from common import tempdir
+
+STORES = ('lite://async.db', 'file://files', 'dbm://async.dbm')
+KEYS = 2000
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def heartbeat(stalls, done, interval=0.001):
+    # measures how late the loop wakes a sleeping task
+    while not done:
+        start = default_timer()
+        await asyncio.sleep(interval)
+        stalls.append(default_timer() - start - interval)
+
+
+async def client(call, latencies, requests):
+    for _ in range(requests):
+        key = 'key{0}'.format(random.randrange(KEYS))
+        start = default_timer()
+        if random.random() < 0.1:
+            await call('set', key, {'value': key})
+        else:
+            await call('get', key)
+        latencies.append(default_timer() - start)
+
+
+async def workload(call, clients, requests):
+    latencies, stalls, done = [], [], []
+    beat = asyncio.ensure_future(heartbeat(stalls, done))
+    start = default_timer()
+    await asyncio.gather(*[
+        client(call, latencies, requests) for _ in range(clients)
+    ])
+    elapsed = default_timer() - start
+    done.append(True)
+    await beat
+    return elapsed, latencies, stalls
+
+
+def sync_caller(store):
+    async def call(op, key, value=None):
+        # blocks the event loop for the whole store operation
+        if op == 'set':
+            store[key] = value
+        else:
+            store.get(key)
+    return call
+
+
+def async_caller(store):
+    async def call(op, key, value=None):
+        if op == 'set':
+            await store.set(key, value)
+        else:
+            await store.get(key)
+    return call
+
+
+def show(name, elapsed, latencies, stalls):
+    print('  {0:<10} {1:>8.3f}s total  p50 {2:>7.2f}ms  p99 {3:>7.2f}ms  '
+          'max loop stall {4:>7.2f}ms'.format(
+              name, elapsed, percentile(latencies, 0.5) * 1000,
+              percentile(latencies, 0.99) * 1000,
+              max(stalls or [0]) * 1000,
+          ))
+
+
+def main(clients=50, requests=40):
+    from shove import Shove
+    from shove.aio import AsyncShove
+    data = dict(('key{0}'.format(i), {'value': i}) for i in range(KEYS))
+    for uri in STORES:
+        print('{0} ({1} clients x {2} requests, no cache)'.format(
+            uri, clients, requests,
+        ))
+        with tempdir():
+            store = Shove(uri, 'null://', sync=1)
+            store.set_many(data)
+            store.sync()
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            show('sync', *loop.run_until_complete(
+                workload(sync_caller(store), clients, requests)
+            ))
+            store.close()
+            store = AsyncShove(uri, 'null://', sync=1)
+            show('AsyncShove', *loop.run_until_complete(
+                workload(async_caller(store), clients, requests)
+            ))
+            loop.run_until_complete(store.close())
+            loop.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
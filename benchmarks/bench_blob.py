@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+'''
+Measures peak memory and time for writing and reading one large value
+through sqlite, whole and in chunks (chunks need Python 3.11 or later).
+
+python benchmarks/bench_blob.py [value size in MiB]
+'''
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+from common import tempdir
+
+WHOLE = 1 << 40
+CHUNKED = 1 << 20
+
+
+def run(threshold, op, size):
+    # one process per measurement so peak memory is not shared
+    import resource
+    from timeit import default_timer
+    from shove._imports import store_backend
+    store = store_backend('lite://blob.db', blob_threshold=threshold)
+    if op == 'write':
+        value = os.urandom(size << 20)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = default_timer()
+    if op == 'write':
+        store['big'] = value
+    else:
+        value = store['big']
+    seconds = default_timer() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    store.close()
+    print('  {0:<6} {1:<8} {2:>6}MiB extra peak {3:>8.3f}s'.format(
+        op, 'whole' if threshold == WHOLE else 'chunked', peak // 1024,
+        seconds,
+    ))
+
+
+def main(size=64):
+    from shove.base import SQLITE_BLOBOPEN
+    print('{0}MiB value, incremental blob I/O {1}'.format(
+        size, 'available' if SQLITE_BLOBOPEN else 'not available',
+    ))
+    here = os.path.abspath(__file__)
+    with tempdir():
+        for threshold in (WHOLE, CHUNKED):
+            for op in ('write', 'read'):
+                subprocess.check_call([
+                    sys.executable, here, 'run', str(threshold), op, str(size),
+                ])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['run']:
+        run(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+    else:
+        main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+'''
+Times writes of mixed small and large values to caches bounded by entry
+count alone and by a byte budget, and reports the bytes each ends up
+holding.
+
+python benchmarks/bench_budget.py [writes]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+
+from common import timed, tempdir, report
+
+
+def fill(cache, count):
+    for i in range(count):
+        # one value in ten is a 64 KiB blob
+        cache['k{0}'.format(i % 2000)] = (
+            'x' * 65536 if not i % 10 else 'x' * 64
+        )
+
+
+def held(cache):
+    # bytes of the entries in memory or of the files in the directory
+    if hasattr(cache, '_store') and isinstance(cache._store, dict):
+        from shove.base import sizeof
+        return sum(
+            sizeof(key) + sizeof(value) for key, value in cache._store.items()
+        )
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk('.') for name in names
+    )
+
+
+def main(count=20000):
+    from shove._imports import cache_backend
+    for uri in ('memory://', 'memlru://', 'file://cache', 'lite://c.db'):
+        rows, sizes = [], []
+        baseline = None
+        for name, kw in (
+            ('max_entries=1000', {}),
+            ('max_bytes=4MiB', dict(max_bytes=4 << 20)),
+        ):
+            with tempdir():
+                cache = cache_backend(uri, max_entries=1000, **kw)
+                seconds = timed(fill, cache, count)
+                sizes.append((name, held(cache) / 1048576.0))
+                getattr(cache, 'close', lambda: None)()
+            baseline = baseline or seconds
+            rows.append((name, seconds, baseline))
+        report('{0} ({1} writes)'.format(uri, count), rows)
+        for name, size in sizes:
+            print('  {0:<24} {1:>9.1f} MiB held'.format(name, size))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+'''
+Compares batch calls (get_many/set_many/delete_many) with loops of single
+key calls on every store.
+
+python benchmarks/bench_bulk.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir, report
+
+STORES = (
+    'simple://', 'memory://', 'file://files', 'dbm://bulk.dbm',
+    'lite://bulk.db', 'lite://:memory:',
+)
+
+
+def single(store, data):
+    for key, value in data.items():
+        store[key] = value
+    for key in data:
+        store[key]
+    for key in data:
+        del store[key]
+
+
+def batch(store, data):
+    store.set_many(data)
+    store.get_many(data)
+    store.delete_many(data)
+
+
+def main(count=2000):
+    from shove._imports import store_backend
+    data = dict(('key{0}'.format(i), {'value': i}) for i in range(count))
+    for uri in STORES:
+        with tempdir():
+            store = store_backend(uri)
+            one = timed(single, store, data)
+            many = timed(batch, store, data)
+            store.close()
+        report('{0} ({1} keys)'.format(uri, count), [
+            ('single key calls', one, one), ('batch calls', many, one),
+        ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+'''
+Counts store reads when many threads miss the same keys at once, with and
+without coalescing.
+
+python benchmarks/bench_coalesce.py [threads] [keys] [store latency in ms]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+from threading import Thread
+
+from common import timed, tempdir, report
+
+
+def herd(shove, keys, threads):
+    workers = [
+        Thread(target=lambda: [shove.get(key) for key in keys])
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def run(coalesce, keys, threads, latency):
+    from shove import Shove
+    shove = Shove('lite://herd.db', 'memory://', coalesce=coalesce)
+    shove.set_many((key, {'value': key}) for key in keys)
+    shove.sync()
+    shove._cache.delete_many(keys)
+    reads = []
+    fetch = shove._fetch
+
+    def counted(key):
+        reads.append(key)
+        # stands in for a store behind a network
+        time.sleep(latency)
+        return fetch(key)
+    shove._fetch = counted
+    seconds = timed(herd, shove, keys, threads)
+    shove.close()
+    return seconds, len(reads)
+
+
+def main(threads=16, count=200, latency=0):
+    keys = ['key{0}'.format(i) for i in range(count)]
+    with tempdir():
+        base, plain = run(False, keys, threads, latency / 1000.0)
+        seconds, coalesced = run(True, keys, threads, latency / 1000.0)
+    report('lite:// ({0} threads x {1} keys, {2}ms)'.format(
+        threads, count, latency,
+    ), [
+        ('no coalescing', base, base), ('coalescing', seconds, base),
+    ])
+    print('  store reads: {0} -> {1}'.format(plain, coalesced))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+'''
+Compares the copy modes of the memory store and LRU cache for reads of a
+nested value, from one thread and from several.
+
+python benchmarks/bench_copy.py [number of reads] [threads]
+'''
+
+from __future__ import print_function
+
+import sys
+from threading import Thread
+
+from common import timed, report
+
+MODES = ('deep', 'serialized', 'frozen', 'none')
+VALUE = dict(
+    ('field{0}'.format(i), {'items': list(range(20)), 'name': 'x' * 20})
+    for i in range(20)
+)
+
+
+def reads(store, count):
+    for _ in range(count):
+        store['key']
+
+
+def threaded(store, count, threads):
+    workers = [
+        Thread(target=reads, args=(store, count // threads))
+        for _ in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(count=5000, threads=4):
+    from shove._imports import store_backend, cache_backend
+    for title, backend, uri in (
+        ('memory store', store_backend, 'memory://'),
+        ('memlru cache', cache_backend, 'memlru://'),
+    ):
+        single, several = [], []
+        for mode in MODES:
+            store = backend(uri, copy=mode)
+            store['key'] = VALUE
+            single.append((mode, timed(reads, store, count)))
+            several.append((mode, timed(threaded, store, count, threads)))
+        for name, rows in (
+            ('{0}, {1} reads'.format(title, count), single),
+            ('{0}, {1} threads'.format(title, threads), several),
+        ):
+            report(name, [
+                (mode, seconds, rows[0][1]) for mode, seconds in rows
+            ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+'''
+Compares dbm sync policies for a load of single key writes.
+
+python benchmarks/bench_dbm.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir, report
+
+SETTINGS = (
+    ('sync every write', 'dbm://bench.dbm'),
+    ('sync_every=100', 'dbm://bench.dbm?sync_every=100'),
+    ('sync_every=1000', 'dbm://bench.dbm?sync_every=1000'),
+    ('sync_interval=1', 'dbm://bench.dbm?sync_every=1000000&sync_interval=1'),
+)
+
+
+def load(store, data):
+    for key, value in data.items():
+        store[key] = value
+    store.close()
+
+
+def main(count=5000):
+    from shove._imports import store_backend
+    from shove._compat import anydbm
+    data = dict(('key{0}'.format(i), {'value': i}) for i in range(count))
+    rows = []
+    for name, uri in SETTINGS:
+        with tempdir():
+            store = store_backend(uri)
+            rows.append((name, timed(load, store, data)))
+    print('dbm module {0}'.format(anydbm._defaultmod.__name__))
+    report('{0} single writes'.format(count), [
+        (name, seconds, rows[0][1]) for name, seconds in rows
+    ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
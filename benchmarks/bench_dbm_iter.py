@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+'''
+Times iterating a dbm store's keys and items, and len() between writes.
+Peak memory is reported where tracemalloc is available.
+
+python benchmarks/bench_dbm_iter.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def keys(store):
+    for _ in store:
+        pass
+
+
+def items(store):
+    for _ in store.iteritems():
+        pass
+
+
+def lengths(store, count):
+    # a write, then a len(), a thousand times
+    for i in range(1000):
+        store['extra{0}'.format(i % 10)] = i
+        len(store)
+
+
+def peak(call, *args):
+    if tracemalloc is None:
+        return float('nan')
+    tracemalloc.start()
+    call(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main(count=100000):
+    from shove._imports import store_backend
+    from shove._compat import anydbm
+    with tempdir():
+        store = store_backend('dbm://bench.dbm?sync_every=100000')
+        print('{0} keys, dbm module {1}'.format(
+            count, anydbm._defaultmod.__name__
+        ))
+        store.set_many(('key{0}'.format(i), i) for i in range(count))
+        store.sync()
+        for name, call in (('keys', keys), ('items', items)):
+            print('  {0:<8} {1:.3f}s peak {2:.1f} MB'.format(
+                name, timed(call, store), peak(call, store),
+            ))
+        print('  len x1000 {0:.3f}s'.format(timed(lengths, store, count)))
+        store.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+'''
+Times reads on one cache while many other caches full of entries sit idle,
+and the CPU the process burns meanwhile keeping their entries expired.
+
+python benchmarks/bench_expiry.py [caches] [entries per cache] [reads]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+from common import timed
+
+
+def read(cache, count):
+    for i in range(count):
+        cache[i % 100]
+
+
+def main(caches=50, entries=1000, reads=200000):
+    from shove._imports import cache_backend
+    idle = []
+    for _ in range(caches):
+        cache = cache_backend('simple://', max_entries=entries * 2)
+        cache.set_many((i, i) for i in range(entries))
+        idle.append(cache)
+    cache = cache_backend('simple://')
+    cache.set_many((i, i) for i in range(100))
+    start = time.process_time()
+    time.sleep(2)
+    print('{0} caches of {1} entries: {2:.3f}s CPU while idle for 2s'.format(
+        caches, entries, time.process_time() - start,
+    ))
+    seconds = timed(read, cache, reads)
+    print('  {0} reads {1:.4f}s ({2:.0f} reads/s)'.format(
+        reads, seconds, reads / seconds,
+    ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+'''
+Compares flat and hash-sharded file store layouts: loading, random reads,
+misses, length and a full items() scan.
+
+python benchmarks/bench_fanout.py [number of keys] [random reads]
+'''
+
+from __future__ import print_function
+
+import random
+import sys
+
+from common import timed, tempdir
+
+
+def load(store, keys):
+    store.set_many((key, key) for key in keys)
+
+
+def reads(store, keys):
+    for key in keys:
+        store[key]
+
+
+def misses(store, keys):
+    for key in keys:
+        key in store
+
+
+def scan(store):
+    for _ in store.iteritems():
+        pass
+
+
+def main(count=200000, lookups=20000):
+    from shove._imports import store_backend
+    keys = ['key{0}'.format(i) for i in range(count)]
+    sample = random.sample(keys, lookups)
+    absent = ['nope{0}'.format(i) for i in range(lookups)]
+    print('{0} keys, {1} lookups'.format(count, lookups))
+    for fanout in (0, 1, 2):
+        with tempdir():
+            store = store_backend('file://files?fanout={0}'.format(fanout))
+            print('  fanout={0} load {1:.2f}s reads {2:.2f}s misses {3:.2f}s '
+                  'len {4:.2f}s items {5:.2f}s'.format(
+                      fanout, timed(load, store, keys),
+                      timed(reads, store, sample),
+                      timed(misses, store, absent), timed(len, store),
+                      timed(scan, store),
+                  ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+'''
+Measures file cache set throughput as the directory grows, with and
+without the in-memory key index.
+
+python benchmarks/bench_filecount.py [largest directory size]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir
+
+STEP = 500
+
+
+def fill(cache, start, count):
+    for i in range(start, start + count):
+        cache['key{0}'.format(i)] = i
+
+
+def main(largest=20000):
+    from shove._imports import cache_backend
+    sizes = [size for size in (1000, 5000, 10000, 20000, 50000)
+             if size <= largest]
+    for index in (False, True):
+        print('index={0}'.format(index))
+        with tempdir():
+            cache = cache_backend(
+                'file://cache', index=index, max_entries=largest + STEP,
+                timeout=3600,
+            )
+            done = 0
+            for size in sizes:
+                fill(cache, done, size - done)
+                done = size
+                seconds = timed(fill, cache, done, STEP)
+                done += STEP
+                print('  {0:>6} files {1:>10.0f} sets/s'.format(
+                    size, STEP / seconds,
+                ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
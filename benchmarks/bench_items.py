@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+'''
+Compares full scans through shove's items() with the key by key scan the
+MutableMapping mixin does.
+
+python benchmarks/bench_items.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir, report
+
+STORES = ('memory://', 'file://files', 'dbm://items.dbm', 'lite://items.db')
+
+
+def mixin(shove):
+    # what MutableMapping.items() does
+    for key in shove:
+        shove[key]
+
+
+def native(shove):
+    for _ in shove.items():
+        pass
+
+
+def main(count=5000):
+    from shove import Shove
+    data = dict(('key{0}'.format(i), {'value': i}) for i in range(count))
+    for uri in STORES:
+        with tempdir():
+            # no cache so every value comes from the store
+            shove = Shove(uri, 'simple://', max_entries=1, sync=0)
+            shove.set_many(data)
+            base = timed(mixin, shove)
+            seconds = timed(native, shove)
+            shove.close()
+        report('{0} ({1} keys)'.format(uri, count), [
+            ('key by key', base, base), ('items()', seconds, base),
+        ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
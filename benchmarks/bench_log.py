@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+'''
+Compares the log store with the other disk stores on write-heavy loads:
+single key writes, overwrites of a small hot set, batch loads, and how
+long reopening the store takes.
+
+python benchmarks/bench_log.py [number of writes] [value bytes]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+
+from common import timed, tempdir, report
+
+STORES = (
+    ('file', 'file://bench'),
+    ('dbm', 'dbm://bench.dbm'),
+    ('lite', 'lite://bench.db'),
+    ('lite commit_every=1000', 'lite://bench.db?commit_every=1000'),
+    ('log', 'log://bench?compact_interval=0'),
+)
+
+
+def writes(store, keys, value):
+    for key in keys:
+        store[key] = value
+
+
+def overwrites(store, keys, value):
+    # every write replaces one of a hundred keys
+    for i in range(len(keys)):
+        store[keys[i % 100]] = value
+
+
+def batches(store, keys, value):
+    for start in range(0, len(keys), 1000):
+        store.set_many((key, value) for key in keys[start:start + 1000])
+
+
+def finish(store):
+    commit = getattr(store, 'commit', None)
+    if commit is not None:
+        commit()
+
+
+def main(count=5000, size=100):
+    from shove._imports import store_backend
+    keys = ['key{0}'.format(i) for i in range(count)]
+    value = b'x' * size
+    print('{0} writes of {1} byte values'.format(count, size))
+    for title, workload in (
+        ('single writes', writes),
+        ('overwrites', overwrites),
+        ('set_many batches', batches),
+    ):
+        rows = []
+        for name, uri in STORES:
+            with tempdir():
+                store = store_backend(uri)
+                seconds = timed(
+                    lambda: (workload(store, keys, value), finish(store))
+                )
+                store.close()
+                rows.append((name, seconds))
+        baseline = rows[0][1]
+        report(title, [(name, seconds, baseline) for name, seconds in rows])
+    with tempdir():
+        store = store_backend('log://bench?compact_interval=0')
+        writes(store, keys, value)
+        overwrites(store, keys, value)
+        store.close()
+        opened = []
+
+        def load():
+            opened.append(store_backend('log://bench?compact_interval=0'))
+        reopen = timed(load)
+        opened.pop().close()
+
+        def rescan():
+            for name in os.listdir('bench'):
+                if name.endswith('.hint'):
+                    os.remove(os.path.join('bench', name))
+            load()
+        report('log reopen', [
+            ('without hint files', timed(rescan), reopen),
+            ('from hint files', reopen, reopen),
+        ])
+        opened.pop().close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
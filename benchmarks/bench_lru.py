@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Times every operation of a read-through load on the LRU caches, where the
+keys are drawn so that some hit and the rest are misses followed by a
+write, and reports the latency percentiles.
+
+python benchmarks/bench_lru.py [operations] [max entries]
+'''
+
+from __future__ import print_function
+
+import random
+import sys
+from timeit import default_timer
+
+
+def load(cache, count, keys):
+    draw, latencies = random.Random(42).paretovariate, []
+    append = latencies.append
+    for _ in range(count):
+        key = int(draw(1.0)) % keys
+        start = default_timer()
+        try:
+            cache[key]
+        except KeyError:
+            cache[key] = key
+        append(default_timer() - start)
+    return latencies
+
+
+def main(count=200000, max_entries=1000):
+    from shove._imports import cache_backend
+    print('{0} operations, max_entries={1}'.format(count, max_entries))
+    for uri in ('simplelru://', 'memlru://'):
+        cache = cache_backend(uri, max_entries=max_entries, copy='none')
+        latencies = sorted(load(cache, count, max_entries * 20))
+        print('  {0:<14} {1}'.format(uri, '  '.join(
+            '{0} {1:>7.1f}us'.format(name, latencies[int(
+                min(share * len(latencies), len(latencies) - 1)
+            )] * 1e6)
+            for name, share in (
+                ('p50', 0.5), ('p99', 0.99), ('p99.9', 0.999), ('max', 1),
+            )
+        )))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+'''
+Measures peak memory and time for reading one large value from a file
+store: read and unpickle, memory mapped, raw bytes and out-of-band pickle
+buffers (Python 3.8 or later).
+
+python benchmarks/bench_mmap.py [value size in MiB]
+'''
+
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+from common import tempdir
+
+MODES = (
+    ('read', 'file://files'),
+    ('mmap', 'file://files?mmap_threshold=1048576'),
+    ('raw mmap', 'file://files?mmap_threshold=1048576&raw=1'),
+    ('out of band', 'file://files?mmap_threshold=1048576&out_of_band=1'),
+)
+
+
+class Array(object):
+
+    '''Stands in for an array type that pickles its data out of band.'''
+
+    def __init__(self, data):
+        self.data = data
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            import pickle
+            return Array, (pickle.PickleBuffer(self.data),)
+        return Array, (bytes(self.data),)
+
+
+def run(name, uri, size, op):
+    # one process per step so peak memory is not shared
+    import resource
+    from timeit import default_timer
+    from shove._imports import store_backend
+    store = store_backend(uri)
+    raw = name.startswith('raw')
+    if op == 'write':
+        data = bytearray(os.urandom(size << 20))
+        store['big'] = data if raw else Array(data)
+        return
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = default_timer()
+    value = store['big']
+    # touch every page as a reader would
+    sum(memoryview(value if raw else value.data)[::4096])
+    seconds = default_timer() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    print('  {0:<12} {1:>6}MiB extra peak {2:>8.4f}s'.format(
+        name, peak // 1024, seconds,
+    ))
+
+
+def main(size=64):
+    here = os.path.abspath(__file__)
+    print('{0}MiB value'.format(size))
+    for name, uri in MODES:
+        with tempdir():
+            for op in ('write', 'read'):
+                subprocess.call([
+                    sys.executable, here, 'run', name, uri, str(size), op,
+                ])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['run']:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from bench_mmap import run as _run
+        _run(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+    else:
+        main(*map(int, sys.argv[1:]))
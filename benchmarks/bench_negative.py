@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+'''
+Compares repeated lookups of missing keys with and without the negative
+cache.
+
+python benchmarks/bench_negative.py [number of keys] [rounds]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir, report
+
+STORES = ('file://files', 'dbm://misses.dbm', 'lite://misses.db')
+
+
+def misses(shove, keys, rounds):
+    for _ in range(rounds):
+        for key in keys:
+            shove.get(key)
+
+
+def main(count=1000, rounds=5):
+    from shove import Shove
+    keys = ['missing{0}'.format(i) for i in range(count)]
+    for uri in STORES:
+        with tempdir():
+            plain = Shove(uri)
+            base = timed(misses, plain, keys, rounds)
+            plain.close()
+            negative = Shove(uri, negative_cache=True)
+            cached = timed(misses, negative, keys, rounds)
+            negative.close()
+        report('{0} ({1} keys x {2})'.format(uri, count, rounds), [
+            ('store lookups', base, base), ('negative cache', cached, base),
+        ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+Replays synthetic key traces through each cache as a read-through cache
+(a miss is followed by a write) and reports the hit ratios.
+
+Traces:
+
+- zipf: skewed lookups over many keys
+- zipf+scan: the same with a full scan of unique keys every quarter, as
+  iterating over a store does
+- loop: a loop over slightly more keys than the cache holds
+
+python benchmarks/bench_policy.py [requests] [max entries]
+'''
+
+from __future__ import print_function
+
+import random
+import sys
+from itertools import accumulate
+
+from common import timed
+
+
+def zipf(rng, count, keys, skew=0.9):
+    weights = accumulate(1.0 / (rank ** skew) for rank in range(1, keys + 1))
+    return rng.choices(range(keys), cum_weights=list(weights), k=count)
+
+
+def traces(count, max_entries):
+    rng = random.Random(42)
+    hot = zipf(rng, count, max_entries * 50)
+    scanned, quarter = [], count // 4
+    for start in range(0, count, quarter):
+        scanned.extend(hot[start:start + quarter])
+        scanned.extend(
+            'scan{0}-{1}'.format(start, key) for key in range(max_entries * 5)
+        )
+    loop = [key % (max_entries * 6 // 5) for key in range(count)]
+    return (('zipf', hot), ('zipf+scan', scanned), ('loop', loop))
+
+
+def replay(cache, trace):
+    hits = 0
+    for key in trace:
+        try:
+            cache[key]
+            hits += 1
+        except KeyError:
+            cache[key] = key
+    return hits
+
+
+def main(count=200000, max_entries=1000):
+    from shove._imports import cache_backend
+    uris = (
+        'simple://', 'simplelru://', 'memlru://', 'arc://', '2q://',
+        'tinylfu://',
+    )
+    for name, trace in traces(count, max_entries):
+        print('{0} ({1} requests, max_entries={2})'.format(
+            name, len(trace), max_entries,
+        ))
+        for uri in uris:
+            cache = cache_backend(uri, max_entries=max_entries, copy='none')
+            hits = []
+            seconds = timed(lambda: hits.append(replay(cache, trace)))
+            print('  {0:<14} hit ratio {1:>6.2%} {2:>9.4f}s'.format(
+                uri, hits[0] / float(len(trace)), seconds,
+            ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+'''
+Measures sqlite read throughput by thread count with and without the
+per-thread connection pool.
+
+python benchmarks/bench_pool.py [number of keys] [reads per thread]
+'''
+
+from __future__ import print_function
+
+import random
+import sys
+from threading import Thread
+
+from common import timed, tempdir
+
+THREADS = (1, 2, 4, 8)
+
+
+def readers(store, keys, threads, reads):
+    def read():
+        for key in random.sample(keys, reads):
+            store[key]
+    workers = [Thread(target=read) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(count=5000, reads=2000):
+    from shove._imports import store_backend
+    keys = ['key{0}'.format(i) for i in range(count)]
+    with tempdir():
+        for uri in ('lite://pool.db', 'lite://pool.db?pool=1'):
+            store = store_backend(uri)
+            store.set_many((key, {'value': key}) for key in keys)
+            print(uri)
+            for threads in THREADS:
+                seconds = timed(readers, store, keys, threads, reads)
+                print('  {0} threads {1:>10.0f} reads/s'.format(
+                    threads, threads * reads / seconds,
+                ))
+            store.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
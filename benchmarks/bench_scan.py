@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+'''
+Compares prefix scans on sqlite with raw keys (index range) and with
+pickled keys (sort every key).
+
+python benchmarks/bench_scan.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, tempdir, report
+
+
+def scans(store, prefixes):
+    for prefix in prefixes:
+        list(store.scan(prefix=prefix))
+
+
+def main(count=50000):
+    from shove._imports import store_backend
+    keys = ['user:{0:06d}'.format(i) for i in range(count)]
+    # each prefix matches 10 keys
+    prefixes = ['user:{0:05d}'.format(i) for i in range(0, count // 10, 50)]
+    rows = []
+    with tempdir():
+        for name, uri in (
+            ('pickled keys', 'lite://pickled.db'),
+            ('raw keys', 'lite://raw.db?raw_keys=1'),
+        ):
+            store = store_backend(uri)
+            store.set_many((key, {'value': key}) for key in keys)
+            rows.append((name, timed(scans, store, prefixes)))
+            store.close()
+    base = rows[0][1]
+    report('{0} prefix scans over {1} keys'.format(len(prefixes), count), [
+        (name, seconds, base) for name, seconds in rows
+    ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Times worker processes reading one dataset kept in a sqlite file: every
+worker copying it into its own memory store, every worker reading the file
+and one shared memory store loaded from it once.
+
+python benchmarks/bench_shm.py [keys] [reads per worker] [workers]
+'''
+
+from __future__ import print_function
+
+import os
+import sys
+
+from common import timed, tempdir, report
+
+
+def dataset(count):
+    return dict(('k{0}'.format(i), {'id': i, 'v': 'x' * 64}) for i in range(
+        count
+    ))
+
+
+def read(store, count, reads):
+    for i in range(reads):
+        store['k{0}'.format(i % count)]
+
+
+def spawn(workers, target):
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if not pid:
+            target()
+            os._exit(0)
+        pids.append(pid)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def main(count=10000, reads=50000, workers=4):
+    from shove._imports import store_backend
+    data = dataset(count)
+
+    def private():
+        # every worker loads its own copy
+        source = store_backend('lite://shared.db')
+        store = store_backend('memory://', copy='none')
+        store.set_many(source.iteritems())
+        source.close()
+        read(store, count, reads)
+
+    def shared(uri):
+        def work():
+            store = store_backend(uri)
+            read(store, count, reads)
+            store.close()
+        return work
+
+    with tempdir():
+        lite = store_backend('lite://shared.db')
+        lite.set_many(data)
+        lite.close()
+        shm = store_backend('shm://shove-bench?slots={0}'.format(count * 2))
+        try:
+            source = store_backend('lite://shared.db')
+            loaded = timed(shm.set_many, source.iteritems())
+            source.close()
+            baseline = timed(spawn, workers, private)
+            report(
+                '{0} workers, {1} keys, {2} reads each'.format(
+                    workers, count, reads,
+                ),
+                [
+                    ('memory:// per worker', baseline, baseline),
+                    ('lite:// shared file', timed(
+                        spawn, workers, shared('lite://shared.db')
+                    ), baseline),
+                    ('shm:// shared segment', loaded + timed(
+                        spawn, workers, shared('shm://shove-bench')
+                    ), baseline),
+                ],
+            )
+        finally:
+            shm.unlink()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
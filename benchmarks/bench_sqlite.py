@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+'''
+Compares sqlite commit policies and pragmas for bulk loads and a mixed
+read/write workload of single key calls.
+
+python benchmarks/bench_sqlite.py [number of keys]
+'''
+
+from __future__ import print_function
+
+import random
+import sys
+
+from common import timed, tempdir, report
+
+SETTINGS = (
+    ('commit every write', 'lite://bench.db', {}),
+    ('wal + normal', 'lite://bench.db', dict(
+        journal_mode='wal', synchronous='normal',
+    )),
+    ('commit_every=100', 'lite://bench.db?commit_every=100', {}),
+    ('wal + commit_every=100', 'lite://bench.db', dict(
+        journal_mode='wal', synchronous='normal', commit_every=100,
+    )),
+)
+
+
+def bulk(store, data):
+    for key, value in data.items():
+        store[key] = value
+    store.commit()
+
+
+def transaction(store, data):
+    with store.transaction():
+        for key, value in data.items():
+            store[key] = value
+
+
+def mixed(store, data, ops):
+    # four reads to every write
+    keys = list(data)
+    for op in ops:
+        key = keys[op % len(keys)]
+        if op % 5:
+            store.get(key)
+        else:
+            store[key] = data[key]
+    store.commit()
+
+
+def main(count=2000):
+    from shove._imports import store_backend
+    data = dict(('key{0}'.format(i), {'value': i}) for i in range(count))
+    ops = [random.randrange(count * 5) for _ in range(count * 5)]
+    loads, mixes = [], []
+    for name, uri, kw in SETTINGS:
+        with tempdir():
+            store = store_backend(uri, **kw)
+            loads.append((name, timed(bulk, store, data)))
+            mixes.append((name, timed(mixed, store, data, ops)))
+            store.close()
+    with tempdir():
+        store = store_backend('lite://bench.db')
+        loads.append(('transaction()', timed(transaction, store, data)))
+        store.close()
+    base = loads[0][1]
+    report('bulk load ({0} keys)'.format(count), [
+        (name, seconds, base) for name, seconds in loads
+    ])
+    base = mixes[0][1]
+    report('mixed 80/20 ({0} ops)'.format(len(ops)), [
+        (name, seconds, base) for name, seconds in mixes
+    ])
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+'''
+Times shove reads and writes on memory backends with stats collection on
+and off.
+
+python benchmarks/bench_stats.py [operations]
+'''
+
+from __future__ import print_function
+
+import sys
+
+from common import timed, report
+
+
+def reads(store, count):
+    for i in range(count):
+        store[i % 1000]
+
+
+def writes(store, count):
+    for i in range(count):
+        store[i % 1000] = i
+
+
+def main(count=200000):
+    from shove import Shove
+    rows = []
+    for name, call in (('reads', reads), ('writes', writes)):
+        seconds = dict()
+        for stats in (False, True):
+            store = Shove(
+                'memory://', 'memory://', copy='none', sync=100, stats=stats,
+                max_entries=2000,
+            )
+            store.set_many((i, i) for i in range(1000))
+            seconds[stats] = min(
+                timed(call, store, count) for _ in range(3)
+            )
+            store.close()
+        rows.append(
+            ('{0} stats off'.format(name), seconds[False], seconds[False])
+        )
+        rows.append(
+            ('{0} stats on'.format(name), seconds[True], seconds[False])
+        )
+    report('shove memory:// ({0} operations)'.format(count), rows)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
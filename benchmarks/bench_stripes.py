@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+Times a read-mostly load (one write to every hundred reads) from several
+threads on the memory store and the memory LRU cache.
+
+python benchmarks/bench_stripes.py [operations per thread] [threads]
+'''
+
+from __future__ import print_function
+
+import sys
+from threading import Thread
+
+from common import timed
+
+
+def work(store, count, offset):
+    for i in range(count):
+        key = (i + offset) % 1000
+        if i % 100:
+            try:
+                store[key]
+            except KeyError:
+                pass
+        else:
+            store[key] = i
+
+
+def threaded(store, count, threads):
+    workers = [
+        Thread(target=work, args=(store, count, n * 7))
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(count=50000, threads=8):
+    for interval in (sys.getswitchinterval(), 1e-5):
+        print('switch interval {0}s'.format(interval))
+        sys.setswitchinterval(interval)
+        run(count, threads)
+
+
+def run(count, threads):
+    from shove._imports import store_backend, cache_backend
+    for name, backend, uri in (
+        ('memory store', store_backend, 'memory://'),
+        ('memlru cache', cache_backend, 'memlru://'),
+    ):
+        for copy in ('none', 'deep'):
+            store = backend(uri, copy=copy, max_entries=2000)
+            store.set_many((i, [i]) for i in range(1000))
+            for n in (1, threads):
+                ops = count if copy == 'none' else count // 10
+                seconds = timed(threaded, store, ops, n)
+                print('  {0:<14} copy={1:<5} {2} threads {3:>9.0f} ops/s'.format(
+                    name, copy, n, ops * n / seconds,
+                ))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
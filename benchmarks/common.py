@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+'''shared helpers for shove benchmarks'''
+
+from __future__ import print_function
+
+import os
+import shutil
+from contextlib import contextmanager
+from tempfile import mkdtemp
+from timeit import default_timer
+
+
+def timed(call, *args, **kw):
+    '''Returns the seconds it takes to run `call`.'''
+    start = default_timer()
+    call(*args, **kw)
+    return default_timer() - start
+
+
+@contextmanager
+def tempdir():
+    '''Runs the block inside a fresh temporary directory.'''
+    cwd = os.getcwd()
+    path = mkdtemp()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+
+
+def report(title, rows):
+    '''Prints a table of `rows` (name, seconds, baseline seconds).'''
+    print(title)
+    for name, seconds, baseline in rows:
+        print('  {0:<24} {1:>10.4f}s {2:>8.1f}x'.format(
+            name, seconds, baseline / seconds if seconds else 0.0,
+        ))
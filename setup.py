@@ -66,16 +66,22 @@ setup(
     dbm=shove.store:DBMStore
     file=shove.store:FileStore
     lite=shove.store:SQLiteStore
+    log=shove.store:LogStore
     memory=shove.store:MemoryStore
+    shm=shove.store:ShmStore
     simple=shove.store:SimpleStore
     [shove.caches]
+    2q=shove.cache:TwoQCache
+    arc=shove.cache:ARCCache
     null=shove.cache:NullCache
     file=shove.cache:FileCache
     filelru=shove.cache:FileLRUCache
     lite=shove.cache:SQLiteCache
     memlru=shove.cache:MemoryLRUCache
     memory=shove.cache:MemoryCache
+    shm=shove.cache:ShmCache
     simple=shove.cache:SimpleCache
     simplelru=shove.cache:SimpleLRUCache
+    tinylfu=shove.cache:TinyLFUCache
     ''',
 )
\ No newline at end of file
@@ -7,8 +7,10 @@ from stuf.base import backport
 anydbm = backport('anydbm', 'dbm')
 url2pathname = backport('urllib.url2pathname', 'urllib.request.url2pathname')
 urlsplit = backport('urlparse.urlsplit', 'urllib.parse.urlsplit')
+parse_qsl = backport('urlparse.parse_qsl', 'urllib.parse.parse_qsl')
 quote_plus = backport('urllib.quote_plus', 'urllib.parse.quote_plus')
 unquote_plus = backport('urllib.unquote_plus', 'urllib.parse.unquote_plus')
+OrderedDict = backport('collections.OrderedDict', 'ordereddict.OrderedDict')
 
 
 def synchronized(func):
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+'''shove cache expiry.'''
+
+from heapq import heappop, heappush, heapify
+from itertools import count
+from threading import Condition, Thread
+from time import time
+from weakref import ref
+
+
+class Expiry(object):
+
+    '''
+    Expires the entries of every cache from one thread.
+
+    Deadlines are kept in a heap of (deadline, order, cache, key), so each
+    wake-up only handles the entries that are due. A cache holds at most one
+    heap entry per key: when a key's timeout was pushed back in the meantime
+    the cache schedules it again instead of expiring it. Caches are held by
+    weak reference and the thread exits when the heap is empty.
+    '''
+
+    def __init__(self):
+        self._heap = []
+        # breaks ties between equal deadlines
+        self._order = count()
+        self._lock = Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, cache, key, deadline):
+        '''
+        Calls ``cache._expire(key)`` once `deadline` passes.
+
+        :argument cache: cache holding `key`
+        :argument key: key to expire
+        :argument deadline: :func:`time.time` to expire `key` at
+        '''
+        with self._lock:
+            heap, order = self._heap, next(self._order)
+            heappush(heap, (deadline, order, ref(cache), key))
+            # a forked child does not have its parent's thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            elif heap[0][1] == order:
+                # sooner than the thread is waiting for
+                self._lock.notify()
+
+    def cancel(self, cache):
+        '''Forgets every key scheduled for `cache`.'''
+        with self._lock:
+            # by identity, as caches compare by their contents, and in
+            # place, as the thread holds on to the heap
+            self._heap[:] = [
+                entry for entry in self._heap
+                if entry[2]() is not cache and entry[2]() is not None
+            ]
+            heapify(self._heap)
+            self._lock.notify()
+
+    def _due(self):
+        # waits for and pops the entries that are due (None when idle)
+        with self._lock:
+            heap = self._heap
+            while True:
+                if not heap:
+                    self._thread = None
+                    return None
+                wait = heap[0][0] - time()
+                if wait <= 0:
+                    break
+                self._lock.wait(wait)
+            now, due = time(), []
+            while heap and heap[0][0] <= now:
+                _, _, cache, key = heappop(heap)
+                due.append((cache, key))
+            return due
+
+    def _run(self):
+        while True:
+            due = self._due()
+            if due is None:
+                return
+            # outside the lock so caches can schedule again
+            for cache, key in due:
+                cache = cache()
+                if cache is not None:
+                    cache._expire(key)
+
+
+# shared by every cache in the process
+expiry = Expiry()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+'''shove locking helpers.'''
+
+from threading import Event, Lock, RLock
+
+
+class _Flight(object):
+
+    '''Result of one in-progress call.'''
+
+    __slots__ = 'done value error'.split()
+
+    def __init__(self):
+        self.done = Event()
+        self.value = self.error = None
+
+
+class SingleFlight(object):
+
+    '''
+    Runs at most one call per key at a time.
+
+    Callers that arrive while a call for the same key is running wait for it
+    and get its result, or its exception, instead of making their own.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        # calls in progress by key
+        self._flights = dict()
+
+    def do(self, key, call, *args):
+        '''
+        Returns ``call(*args)``, sharing a running call for `key`.
+
+        :argument key: key the call is for
+        :argument call: callable to run
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = call(*args)
+            return flight.value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class StripedLock(object):
+
+    '''
+    Lock split into stripes that readers take one at a time.
+
+    A reader of one key takes only that key's stripe (``with
+    lock.stripe(key):``), so readers of keys on different stripes never
+    wait for each other. The lock itself is the write side: ``with lock:``
+    and :func:`~shove._compat.synchronized` take every stripe in order, so
+    a writer waits for the readers inside and keeps new ones out. Stripes
+    can be taken again by the thread holding them.
+
+    :keyword int stripes: number of stripes
+    '''
+
+    def __init__(self, stripes=16):
+        self.stripes = tuple(RLock() for _ in range(max(int(stripes), 1)))
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stripe(self, key):
+        '''Returns the stripe for `key`.'''
+        return self.stripes[hash(key) % len(self.stripes)]
+
+    def acquire(self):
+        '''Takes every stripe.'''
+        for stripe in self.stripes:
+            stripe.acquire()
+        return True
+
+    def release(self):
+        '''Gives every stripe back.'''
+        for stripe in reversed(self.stripes):
+            stripe.release()
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+'''shove cache eviction policies.'''
+
+from shove._compat import OrderedDict
+
+# seeds of the count-min sketch rows
+SKETCH_SEEDS = (
+    0x97cb3127, 0x5a5b9a1f, 0xc3a5c85c, 0x8c2bd3f1,
+)
+SKETCH_MAX = 15
+MASK64 = (1 << 64) - 1
+
+
+def _touch(order, key):
+    # makes key the most recently used
+    order.pop(key, None)
+    order[key] = None
+
+
+def _oldest(order):
+    return order.popitem(last=False)[0]
+
+
+class ARC(object):
+
+    '''
+    Adaptive replacement cache policy (Megiddo and Modha).
+
+    Keys seen once (`t1`) and keys seen again (`t2`) are kept in two LRU
+    lists, with ghost lists (`b1`, `b2`) of keys recently evicted from
+    each. A hit on a ghost moves the target size `p` of `t1` towards the
+    list it came from, so a scan only ever displaces keys seen once.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.p = 0
+        self.t1, self.t2 = OrderedDict(), OrderedDict()
+        self.b1, self.b2 = OrderedDict(), OrderedDict()
+
+    def access(self, key):
+        '''Records a hit on a cached key.'''
+        if self.t1.pop(key, self) is not self:
+            self.t2[key] = None
+        elif key in self.t2:
+            _touch(self.t2, key)
+
+    def miss(self, key):
+        '''Records a lookup of a key that is not cached.'''
+
+    def admit(self, key):
+        '''
+        Adds `key` and returns the keys to evict to make room for it.
+
+        :argument key: key being cached
+        '''
+        t1, t2, b1, b2 = self.t1, self.t2, self.b1, self.b2
+        capacity, evicted = self.capacity, []
+        if key in b1:
+            self.p = min(capacity, self.p + max(len(b2) // len(b1), 1))
+            self._replace(key, evicted)
+            b1.pop(key, None)
+            t2[key] = None
+            return evicted
+        if key in b2:
+            self.p = max(0, self.p - max(len(b1) // len(b2), 1))
+            self._replace(key, evicted)
+            b2.pop(key, None)
+            t2[key] = None
+            return evicted
+        if len(t1) + len(b1) >= capacity:
+            if len(t1) < capacity:
+                _oldest(b1)
+                self._replace(key, evicted)
+            else:
+                evicted.append(_oldest(t1))
+        elif len(t1) + len(t2) + len(b1) + len(b2) >= capacity:
+            if len(t1) + len(t2) + len(b1) + len(b2) >= 2 * capacity:
+                _oldest(b2)
+            self._replace(key, evicted)
+        t1[key] = None
+        return evicted
+
+    def discard(self, key):
+        '''Forgets a key deleted from the cache.'''
+        self.t1.pop(key, None)
+        self.t2.pop(key, None)
+
+    def victim(self):
+        '''Evicts and returns one key, or None when nothing is cached.'''
+        if not self.t1 and not self.t2:
+            return None
+        evicted = []
+        self._replace(None, evicted, True)
+        return evicted[0]
+
+    def _replace(self, key, evicted, force=False):
+        # moves the LRU key of t1 or t2 to its ghost list
+        t1, t2 = self.t1, self.t2
+        if not force and len(t1) + len(t2) < self.capacity:
+            return
+        if t1 and (
+            not t2 or len(t1) > self.p or (key in self.b2 and len(t1) == self.p)
+        ):
+            old = _oldest(t1)
+            self.b1[old] = None
+        else:
+            old = _oldest(t2)
+            self.b2[old] = None
+        evicted.append(old)
+        # ghosts of deleted keys are not trimmed by admit
+        b1, b2 = self.b1, self.b2
+        while len(b1) + len(b2) > self.capacity:
+            _oldest(b1 if len(b1) > len(b2) else b2)
+
+
+class TwoQ(object):
+
+    '''
+    2Q cache policy (Johnson and Shasha).
+
+    New keys enter a FIFO (`a1in`, a quarter of the capacity). Keys pushed
+    out of it are remembered in a ghost FIFO (`a1out`, half the capacity)
+    and only a key seen again while a ghost enters the main LRU list
+    (`am`), so a scan passes through the FIFO without touching `am`.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.kin = max(self.capacity // 4, 1)
+        self.kout = max(self.capacity // 2, 1)
+        self.a1in, self.a1out, self.am = OrderedDict(), OrderedDict(), (
+            OrderedDict()
+        )
+
+    def access(self, key):
+        '''Records a hit on a cached key.'''
+        if key in self.am:
+            _touch(self.am, key)
+
+    def miss(self, key):
+        '''Records a lookup of a key that is not cached.'''
+
+    def admit(self, key):
+        '''
+        Adds `key` and returns the keys to evict to make room for it.
+
+        :argument key: key being cached
+        '''
+        evicted = []
+        while len(self.a1in) + len(self.am) >= self.capacity:
+            evicted.append(self.victim())
+        if self.a1out.pop(key, self) is not self:
+            self.am[key] = None
+        else:
+            self.a1in[key] = None
+        return evicted
+
+    def discard(self, key):
+        '''Forgets a key deleted from the cache.'''
+        self.a1in.pop(key, None)
+        self.am.pop(key, None)
+
+    def victim(self):
+        '''Evicts and returns one key, or None when nothing is cached.'''
+        if self.a1in and (len(self.a1in) > self.kin or not self.am):
+            old = _oldest(self.a1in)
+            self.a1out[old] = None
+            if len(self.a1out) > self.kout:
+                _oldest(self.a1out)
+            return old
+        if self.am:
+            return _oldest(self.am)
+        return None
+
+
+class CountMinSketch(object):
+
+    '''
+    Approximate counts of how often keys were seen.
+
+    Four rows of `width` one-byte counters that saturate at 15. A key's
+    count is the smallest of its counter in each row. Every ten times
+    `width` increments all counters are halved, so old popularity fades.
+    '''
+
+    def __init__(self, width):
+        self.width = 16
+        while self.width < width:
+            self.width <<= 1
+        self._mask = self.width - 1
+        self._counters = bytearray(len(SKETCH_SEEDS) * self.width)
+        self._sample = 10 * self.width
+        self._additions = 0
+
+    def increment(self, key):
+        '''Counts one more sighting of `key`.'''
+        counters, changed = self._counters, False
+        for index in self._indexes(key):
+            if counters[index] < SKETCH_MAX:
+                counters[index] += 1
+                changed = True
+        if changed:
+            self._additions += 1
+            if self._additions >= self._sample:
+                self._age()
+
+    def frequency(self, key):
+        '''Returns the estimated count of `key`.'''
+        counters = self._counters
+        return min(counters[index] for index in self._indexes(key))
+
+    def _age(self):
+        # halves every counter
+        self._counters = bytearray(
+            count >> 1 for count in self._counters
+        )
+        self._additions //= 2
+
+    def _indexes(self, key):
+        # the key's counter in each row
+        mask, width, base = self._mask, self.width, hash(key) & MASK64
+        for row, seed in enumerate(SKETCH_SEEDS):
+            mixed = ((base ^ seed) * 0x9e3779b97f4a7c15) & MASK64
+            yield row * width + ((mixed ^ (mixed >> 32)) & mask)
+
+
+class TinyLFU(object):
+
+    '''
+    Window TinyLFU cache policy (Einziger, Friedman and Manes).
+
+    New keys enter a small LRU window (1% of the capacity). A key pushed
+    out of the window only enters the main segmented LRU in place of its
+    probation victim when a :class:`CountMinSketch` of recent lookups says
+    it is seen more often, so one-off keys from a scan are turned away.
+    Keys hit while on probation move to the protected segment (80% of the
+    main space).
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.window_size = max(self.capacity // 100, 1)
+        self.main_size = self.capacity - self.window_size
+        self.protected_size = max(self.main_size * 4 // 5, 1)
+        self.window, self.probation, self.protected = (
+            OrderedDict(), OrderedDict(), OrderedDict()
+        )
+        self.sketch = CountMinSketch(self.capacity)
+
+    def access(self, key):
+        '''Records a hit on a cached key.'''
+        self.sketch.increment(key)
+        if key in self.window:
+            _touch(self.window, key)
+        elif self.probation.pop(key, self) is not self:
+            self.protected[key] = None
+            if len(self.protected) > self.protected_size:
+                self.probation[_oldest(self.protected)] = None
+        elif key in self.protected:
+            _touch(self.protected, key)
+
+    def miss(self, key):
+        '''Records a lookup of a key that is not cached.'''
+        self.sketch.increment(key)
+
+    def admit(self, key):
+        '''
+        Adds `key` and returns the keys to evict to make room for it, which
+        may be a key from the window that loses to the probation victim.
+
+        :argument key: key being cached
+        '''
+        self.window[key] = None
+        if len(self.window) <= self.window_size:
+            return []
+        candidate = _oldest(self.window)
+        if not self.main_size:
+            return [candidate]
+        if len(self.probation) + len(self.protected) < self.main_size:
+            self.probation[candidate] = None
+            return []
+        main = self.probation if self.probation else self.protected
+        victim = next(iter(main))
+        frequency = self.sketch.frequency
+        if frequency(candidate) > frequency(victim):
+            del main[victim]
+            self.probation[candidate] = None
+            return [victim]
+        return [candidate]
+
+    def discard(self, key):
+        '''Forgets a key deleted from the cache.'''
+        self.window.pop(key, None)
+        self.probation.pop(key, None)
+        self.protected.pop(key, None)
+
+    def victim(self):
+        '''Evicts and returns one key, or None when nothing is cached.'''
+        for order in (self.probation, self.protected, self.window):
+            if order:
+                return _oldest(order)
+        return None
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''shove instrumentation.'''
+
+from threading import Condition, Thread
+
+# latency buckets: under 1us, then under 2, 4, ... 2**30us (about 18 min)
+BUCKETS = 32
+
+
+class Histogram(object):
+
+    '''
+    Latencies counted in power-of-two microsecond buckets.
+
+    Recording is a handful of integer operations, so it can stay on.
+    Percentiles are the upper bound of the bucket they fall in.
+    '''
+
+    __slots__ = 'counts total max'.split()
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.total = self.max = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def record(self, seconds):
+        '''Counts one latency of `seconds`.'''
+        index = int(seconds * 1000000).bit_length()
+        self.counts[index if index < BUCKETS else BUCKETS - 1] += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, share):
+        '''
+        Returns the latency in seconds that `share` (0 to 1) of the recorded
+        latencies are under.
+        '''
+        wanted, seen = share * sum(self.counts), 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return min((1 << index) / 1000000.0, self.max)
+        return self.max
+
+    def snapshot(self):
+        '''Returns the count, total, mean, max and percentiles as a dict.'''
+        count = self.count
+        return dict(
+            count=count,
+            total=self.total,
+            mean=self.total / count if count else 0.0,
+            max=self.max,
+            p50=self.percentile(0.5),
+            p90=self.percentile(0.9),
+            p99=self.percentile(0.99),
+            # upper bound in microseconds -> count, for the filled buckets
+            buckets=dict(
+                (1 << index, count)
+                for index, count in enumerate(self.counts) if count
+            ),
+        )
+
+
+class Stats(object):
+
+    '''
+    Counters and per-operation latency histograms.
+
+    Updates are not locked: under heavy contention a count can be lost,
+    which keeps them cheap enough to leave on.
+    '''
+
+    def __init__(self):
+        self.counters = dict()
+        self.latency = dict()
+
+    def incr(self, name, count=1):
+        '''Adds `count` to counter `name`.'''
+        counters = self.counters
+        counters[name] = counters.get(name, 0) + count
+
+    def histogram(self, operation):
+        '''Returns the latency :class:`Histogram` of `operation`.'''
+        histogram = self.latency.get(operation)
+        if histogram is None:
+            histogram = self.latency.setdefault(operation, Histogram())
+        return histogram
+
+    def record(self, operation, seconds):
+        '''Counts one `operation` that took `seconds`.'''
+        self.histogram(operation).record(seconds)
+
+    def snapshot(self):
+        '''Returns the counters and latency snapshots as a dict.'''
+        return dict(
+            counters=dict(self.counters),
+            latency=dict(
+                (operation, histogram.snapshot())
+                for operation, histogram in list(self.latency.items())
+            ),
+        )
+
+
+class Exporter(object):
+
+    '''
+    Hands stats to an exporter every `interval` seconds and once more on
+    :meth:`close`.
+
+    :argument export: callable taking a stats dict
+    :argument collect: callable returning a stats dict
+    :argument interval: seconds between exports (0 for only on close)
+    '''
+
+    def __init__(self, export, collect, interval=0):
+        self._export = export
+        self._collect = collect
+        self._interval = interval
+        self._lock = Condition()
+        self._closed = False
+        self._thread = None
+        if interval:
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def export(self):
+        '''Hands the current stats to the exporter.'''
+        self._export(self._collect())
+
+    def close(self):
+        '''Stops the export thread and exports one last time.'''
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.export()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._lock.wait(self._interval)
+                if self._closed:
+                    return
+            self.export()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+'''shove write-behind buffer.'''
+
+from sys import getsizeof
+from threading import Condition, Thread
+from time import time
+
+from shove.base import pairs
+
+# marks keys that are not in the buffer
+MISSING = object()
+# marks keys with a pending delete
+DELETED = object()
+
+
+class WriteBehind(object):
+
+    '''
+    Buffer drained to a store by a background worker thread.
+
+    The buffer is written when it holds `flush_entries` entries, when its
+    estimated size reaches `flush_bytes` or when its oldest entry is
+    `flush_interval` seconds old. Writers block once the buffer holds
+    `max_pending` entries or `max_pending_bytes` estimated bytes until the
+    worker catches up.
+    '''
+
+    def __init__(self, buffer, write, **kw):
+        # pending writes
+        self._buffer = buffer
+        # writes a batch to the store(s)
+        self._write = write
+        # batch being written by the worker
+        self._inflight = dict()
+        self._lock = Condition()
+        # flush policy
+        self._flush_entries = kw.get('flush_entries', 500)
+        self._flush_bytes = kw.get('flush_bytes', 1 << 22)
+        self._flush_interval = kw.get('flush_interval', 1.0)
+        # backpressure limits
+        self._max_pending = kw.get('max_pending', 10 * self._flush_entries)
+        self._max_pending_bytes = kw.get(
+            'max_pending_bytes', 4 * self._flush_bytes
+        )
+        # estimates the size of a buffered value
+        self._sizer = kw.get('sizer', getsizeof)
+        self._bytes = 0
+        # when the oldest pending write was buffered
+        self._since = None
+        # number of batches written so far
+        self._written = 0
+        self._requested = self._closed = False
+        self._error = None
+        self._worker = Thread(target=self._run)
+        self._worker.setDaemon(True)
+        self._worker.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buffer) + len(self._inflight)
+
+    def get(self, key, default=MISSING):
+        '''Returns the pending value for `key` or `default`.'''
+        with self._lock:
+            value = self._buffer.get(key, MISSING)
+            if value is MISSING:
+                value = self._inflight.get(key, default)
+            return value
+
+    def items(self):
+        '''Returns a snapshot of all pending and in-flight writes.'''
+        with self._lock:
+            pending = dict(self._inflight)
+            pending.update(self._buffer)
+            return pending
+
+    def put(self, key, value):
+        '''Buffers `value` under `key`, blocking while the buffer is full.'''
+        with self._lock:
+            self._reserve(key in self._buffer)
+            self._add(key, value)
+
+    def put_many(self, items):
+        '''Buffers every key and value pair in `items`.'''
+        with self._lock:
+            for key, value in pairs(items):
+                self._reserve(key in self._buffer)
+                self._add(key, value)
+
+    def clear(self, then=None):
+        '''
+        Waits for the current batch and drops every pending write.
+
+        :keyword then: callable run before writers are let in again, such
+            as the store's clear
+        '''
+        with self._lock:
+            while self._inflight:
+                self._lock.wait()
+            self._buffer.clear()
+            self._bytes, self._since = 0, None
+            if then is not None:
+                then()
+            self._lock.notify_all()
+
+    def flush(self, wait=True):
+        '''
+        Asks the worker to write the buffer now.
+
+        :keyword bool wait: block until everything buffered so far is written
+        '''
+        with self._lock:
+            target = self._written + bool(self._inflight) + bool(self._buffer)
+            self._requested = True
+            self._lock.notify_all()
+            if wait:
+                while self._written < target and self._worker.is_alive():
+                    self._lock.wait()
+                self._raise()
+
+    def close(self):
+        '''Drains the buffer and stops the worker.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._worker.join()
+        with self._lock:
+            self._raise()
+
+    def _add(self, key, value):
+        self._buffer[key] = value
+        if value is not DELETED:
+            self._bytes += self._sizer(value)
+        if self._since is None:
+            # start the clock on the oldest pending write
+            self._since = time()
+            self._lock.notify_all()
+        elif (
+            len(self._buffer) >= self._flush_entries or
+            self._bytes >= self._flush_bytes
+        ):
+            self._lock.notify_all()
+
+    def _reserve(self, replacing):
+        # backpressure: wait for room unless an entry is only being replaced
+        while not replacing and (
+            len(self._buffer) >= self._max_pending or
+            self._bytes >= self._max_pending_bytes
+        ) and self._worker.is_alive():
+            self._lock.notify_all()
+            self._lock.wait()
+
+    def _raise(self):
+        # reports a failed background write to the caller
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _due(self):
+        # seconds until the buffer should be written (0 when now)
+        if not self._buffer:
+            return None
+        if (
+            self._requested or self._closed or
+            len(self._buffer) >= self._flush_entries or
+            self._bytes >= self._flush_bytes or
+            # writers are blocked on a full buffer
+            len(self._buffer) >= self._max_pending or
+            self._bytes >= self._max_pending_bytes
+        ):
+            return 0
+        return max(0, self._since + self._flush_interval - time())
+
+    def _run(self):
+        lock = self._lock
+        while True:
+            with lock:
+                due = self._due()
+                while due != 0:
+                    if self._closed and not self._buffer:
+                        return
+                    if due is None and self._requested:
+                        # nothing was buffered when a flush was asked for
+                        self._requested = False
+                        lock.notify_all()
+                    lock.wait(due)
+                    due = self._due()
+                batch = self._inflight = dict(self._buffer)
+                self._buffer.clear()
+                self._bytes, self._since = 0, None
+                self._requested = False
+                lock.notify_all()
+            try:
+                self._write(batch)
+            except Exception as error:
+                with lock:
+                    # keep failed writes unless they have been superseded
+                    for key, value in batch.items():
+                        self._buffer.setdefault(key, value)
+                    self._since = self._since or time()
+                    self._error = error
+                    if self._closed:
+                        self._inflight = dict()
+                        self._written += 1
+                        lock.notify_all()
+                        return
+            with lock:
+                self._inflight = dict()
+                self._written += 1
+                lock.notify_all()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''
+shove asyncio frontend.
+
+Requires Python 3.5 or later.
+'''
+
+import asyncio
+from functools import partial
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from shove.core import Shove, MultiShove
+
+__all__ = 'AsyncShove AsyncMultiShove'.split()
+
+
+class BaseAsyncShove(object):
+
+    '''
+    Base for asyncio frontends.
+
+    Calls to the wrapped frontend run on a bounded thread pool. Reads share
+    at most as many threads as the most restrictive backend allows (see
+    `concurrency` on each backend) and writes run one at a time, so a
+    backend like sqlite sees a single writer.
+    '''
+
+    def __init__(self, shove, backends, **kw):
+        # wrapped synchronous frontend
+        self._shove = shove
+        max_workers = kw.get('max_workers', 4)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # threads allowed to use the backends at once
+        limits = [max_workers] + [
+            backend.concurrency for backend in backends
+            if getattr(backend, 'concurrency', None)
+        ]
+        self._concurrency = min(limits)
+        # keys fetched per trip to the executor while iterating
+        self._iter_batch = kw.get('iter_batch', 500)
+        # asyncio primitives are made on first use inside the running loop
+        self._slots = self._writer = None
+
+    def __aiter__(self):
+        return _AsyncIterator(self, iter)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def get(self, key, default=None):
+        '''Returns the value of `key` or `default`.'''
+        return await self._read(self._shove.get, key, default)
+
+    async def contains(self, key):
+        '''Returns whether `key` is stored.'''
+        return await self._read(self._shove.__contains__, key)
+
+    async def length(self):
+        '''Returns the number of stored keys.'''
+        return await self._read(self._shove.__len__)
+
+    async def set(self, key, value):
+        '''Stores `value` under `key`.'''
+        await self._write(self._shove.__setitem__, key, value)
+
+    async def delete(self, key):
+        '''Removes `key`, raising :exc:`KeyError` if it is not stored.'''
+        await self._write(self._shove.__delitem__, key)
+
+    async def get_many(self, keys):
+        '''Returns a :class:`dict` of the `keys` that are found.'''
+        return await self._read(self._shove.get_many, list(keys))
+
+    async def set_many(self, items):
+        '''Stores every key and value pair in `items`.'''
+        await self._write(self._shove.set_many, items)
+
+    async def delete_many(self, keys):
+        '''Removes every one of `keys` that is found.'''
+        await self._write(self._shove.delete_many, list(keys))
+
+    def items(self):
+        '''Iterates over every key and value pair.'''
+        return _AsyncIterator(self, lambda shove: shove.iteritems())
+
+    def values(self):
+        '''Iterates over every value.'''
+        return _AsyncIterator(self, lambda shove: shove.itervalues())
+
+    def scan(self, prefix=None, start=None, stop=None, limit=None):
+        '''Iterates over the key and value pairs in a key range in key order.'''
+        return _AsyncIterator(self, lambda shove: shove.scan(
+            prefix, start, stop, limit
+        ))
+
+    async def flush(self, wait=True):
+        '''Writes the buffer to the store(s).'''
+        await self._write(self._shove.flush, wait)
+
+    async def close(self):
+        '''Writes the buffer, closes the store(s) and stops the executor.'''
+        if self._shove is not None:
+            await self._write(self._shove.close)
+            self._shove = None
+            self._executor.shutdown(wait=False)
+
+    def _limits(self):
+        # bound here so they belong to the loop that is running
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._concurrency)
+            self._writer = asyncio.Lock()
+        return self._slots, self._writer
+
+    async def _run(self, call, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(call, *args)
+        )
+
+    async def _read(self, call, *args):
+        slots, _ = self._limits()
+        async with slots:
+            return await self._run(call, *args)
+
+    async def _write(self, call, *args):
+        slots, writer = self._limits()
+        async with writer:
+            async with slots:
+                return await self._run(call, *args)
+
+
+class _AsyncIterator(object):
+
+    '''Pulls batches from a synchronous iterator on the executor.'''
+
+    def __init__(self, frontend, start):
+        self._frontend = frontend
+        self._start = start
+        self._iterator = None
+        self._batch = iter(())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        for item in self._batch:
+            return item
+        frontend = self._frontend
+        if self._iterator is None:
+            self._iterator = await frontend._read(
+                self._start, frontend._shove
+            )
+        batch = await frontend._read(
+            lambda: list(islice(self._iterator, frontend._iter_batch))
+        )
+        if not batch:
+            raise StopAsyncIteration
+        self._batch = iter(batch)
+        return next(self._batch)
+
+
+class AsyncShove(BaseAsyncShove):
+
+    '''
+    asyncio frontend to a :class:`~shove.core.Shove`.
+
+    Takes the same arguments as :class:`~shove.core.Shove` plus
+    `max_workers`, the size of the thread pool (default 4). The default
+    cache is the thread-safe memory cache.
+    '''
+
+    def __init__(self, store='simple://', cache='memory://', **kw):
+        shove = Shove(store, cache, **kw)
+        super(AsyncShove, self).__init__(
+            shove, (shove._store, shove._cache), **kw
+        )
+
+
+class AsyncMultiShove(BaseAsyncShove):
+
+    '''
+    asyncio frontend to a :class:`~shove.core.MultiShove`.
+
+    Takes the same arguments as :class:`~shove.core.MultiShove` plus
+    `max_workers`, the size of the thread pool (default 4). The default
+    cache is the thread-safe memory cache.
+    '''
+
+    def __init__(self, *stores, **kw):
+        kw.setdefault('cache', 'memory://')
+        shove = MultiShove(*stores, **kw)
+        super(AsyncMultiShove, self).__init__(
+            shove, shove._stores + [shove._cache], **kw
+        )
@@ -1,19 +1,270 @@
 # -*- coding: utf-8 -*-
 '''shove core.'''
 
+import os
+import mmap
+import struct
+from copy import deepcopy
+from hashlib import md5
+from zlib import crc32
+from operator import itemgetter
 from os import listdir, remove, makedirs
-from os.path import exists, join
+from os.path import exists, join, dirname, isdir, getsize
 import sqlite3
+from sys import getsizeof
+from contextlib import contextmanager
+from tempfile import gettempdir
+from threading import Condition, Lock, Thread, local, current_thread
+from time import time
 
-from stuf.six import native, pickle
+from stuf.six import PY3, native, pickle, strings
 
-from shove._compat import url2pathname, quote_plus, unquote_plus
+from shove._compat import (
+    url2pathname, quote_plus, unquote_plus, parse_qsl, synchronized)
+from shove._locks import StripedLock
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover
+    resource_tracker = shared_memory = None
+
+# most host parameters allowed in one sqlite statement
+SQLITE_MAX_VARS = 900
+# rows fetched from sqlite at a time while iterating
+SQLITE_FETCH = 500
+# bytes moved at a time by sqlite incremental blob I/O
+SQLITE_BLOB_CHUNK = 1 << 16
+# incremental blob I/O needs Python 3.11 or later
+SQLITE_BLOBOPEN = hasattr(sqlite3.Connection, 'blobopen')
+# sqlite pragmas that can be set from a URI query or keywords
+SQLITE_PRAGMAS = dict(
+    journal_mode=frozenset(
+        'DELETE TRUNCATE PERSIST MEMORY WAL OFF'.split()
+    ),
+    synchronous=frozenset('OFF NORMAL FULL EXTRA 0 1 2 3'.split()),
+    cache_size=int,
+    mmap_size=int,
+)
+# holds a file store's own files: quote_plus always escapes '@', so no
+# key's file can have this name
+FILE_META = '.@shove'
+# marks file store directories that are sharded (in FILE_META)
+FILE_LAYOUT = 'layout'
+# quoted names of the files in a file store directory (in FILE_META)
+FILE_MANIFEST = 'manifest'
+# marks a file store directory whose manifest may be stale (in FILE_META)
+FILE_DIRTY = 'dirty'
+# starts files written with out-of-band pickle buffers
+OUT_OF_BAND = b'SHOVEOB5'
+# out-of-band buffers start on multiples of this many bytes
+OUT_OF_BAND_ALIGN = 64
+# how thread-safe memory backends keep values apart from their callers
+COPY_MODES = frozenset(('deep', 'none', 'frozen', 'serialized'))
+# log store record header after its crc32: flags, key and value lengths
+LOG_HEADER = struct.Struct('<BII')
+# crc32 that starts every log store record
+LOG_CRC = struct.Struct('<I')
+# log store hint file entry: flags, key length, value offset and length
+LOG_HINT = struct.Struct('<BIQI')
+# starts a log store hint file: size of the segment it describes
+LOG_HINT_SIZE = struct.Struct('<Q')
+# flags a log store record that deletes its key
+LOG_TOMBSTONE = 1
+# starts a shared memory segment laid out by shove
+SHM_MAGIC = b'SHOVESHM'
+# shared memory header: magic, slots, arena start and end, arena tail, live
+# entries, dead arena bytes and deleted slots
+SHM_HEADER = struct.Struct('<8sQQQQQQQ')
+# shared memory hash table slot: key hash, record offset, key and value
+# lengths (offset 0 is an empty slot and 1 a deleted one)
+SHM_SLOT = struct.Struct('<QQII')
+# most of the shared memory hash table that may be used
+SHM_LOAD = 0.75
+# first eight bytes of a shared memory key hash
+SHM_DIGEST = struct.Struct('<Q')
+# replaces a file in one step where the platform allows it
+replace = getattr(os, 'replace', os.rename)
+# spellings of a true option in a URI query
+TRUE = frozenset(('1', 'true', 'yes', 'on'))
+# flag needed to read and write binary files on some platforms
+O_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+def pairs(items):
+    '''
+    Iterates over the key and value pairs in `items`.
+
+    :argument items: mapping or iterable of key and value pairs
+    '''
+    try:
+        return items.items()
+    except AttributeError:
+        return items
+
+
+def chunks(iterable, size):
+    '''
+    Splits `iterable` into lists of at most `size` items.
+
+    :argument iterable: iterable to split
+    :argument size: maximum number of items in each list
+    '''
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scan_bounds(prefix=None, start=None, stop=None):
+    '''
+    Returns the (low, high) key range of a scan, low included and high
+    excluded, either of which may be None for no bound.
+
+    :keyword prefix: keys start with this string
+    :keyword start: keys are at least this
+    :keyword stop: keys are less than this
+    '''
+    low, high = start, stop
+    if prefix:
+        if low is None or prefix > low:
+            low = prefix
+        # smallest string after every string starting with prefix
+        after = prefix
+        while after and ord(after[-1]) == 0x10ffff:
+            after = after[:-1]
+        if after:
+            after = after[:-1] + '%c' % (ord(after[-1]) + 1)
+            if high is None or after < high:
+                high = after
+    return low, high
+
+
+def dumps_out_of_band(value):
+    '''
+    Pickles `value` with protocol 5 and returns the chunks of a file holding
+    the pickle followed by its out-of-band buffers, each aligned.
+
+    :argument value: object to pickle
+    '''
+    buffers = []
+    main = pickle.dumps(value, 5, buffer_callback=buffers.append)
+    views = [memoryview(main)] + [buffer.raw() for buffer in buffers]
+    sizes = [view.nbytes for view in views]
+    header = OUT_OF_BAND + struct.pack(
+        '<I{0}Q'.format(len(sizes)), len(sizes), *sizes
+    )
+    chunks = [header]
+    offset = len(header)
+    for view in views:
+        padding = -offset % OUT_OF_BAND_ALIGN
+        if padding:
+            chunks.append(b'\0' * padding)
+        chunks.append(view)
+        offset += padding + view.nbytes
+    return chunks
+
+
+def loads_out_of_band(data):
+    '''
+    Unpickles a file written by :func:`dumps_out_of_band`, handing its
+    buffers to the unpickler as views of `data` instead of copies.
+
+    :argument data: bytes-like contents of the file
+    '''
+    data = memoryview(data)
+    start = len(OUT_OF_BAND)
+    count, = struct.unpack_from('<I', data, start)
+    start += 4
+    sizes = struct.unpack_from('<{0}Q'.format(count), data, start)
+    offset = start + 8 * count
+    views = []
+    for size in sizes:
+        offset += -offset % OUT_OF_BAND_ALIGN
+        views.append(data[offset:offset + size])
+        offset += size
+    return pickle.loads(views[0], buffers=views[1:])
+
+
+class FrozenDict(dict):
+
+    ''':class:`dict` that cannot be changed, which pickles as a dict.'''
+
+    __slots__ = ()
+
+    def _frozen(self, *args, **kw):
+        raise TypeError('frozen values cannot be changed')
+
+    __setitem__ = __delitem__ = __ior__ = _frozen
+    clear = pop = popitem = setdefault = update = _frozen
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def freeze(value):
+    '''
+    Returns an immutable copy of `value`.
+
+    Dictionaries become :class:`FrozenDict`, lists and tuples become tuples,
+    sets become frozensets and bytearrays become bytes, all the way down.
+    Other objects are deep copied.
+
+    :argument value: value to freeze
+    '''
+    if isinstance(value, (strings, bytes, int, float, complex, type(None))):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if type(value) in (list, tuple):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    if isinstance(value, bytearray):
+        return bytes(value)
+    return deepcopy(value)
+
+
+def sizeof(value):
+    '''
+    Estimates the bytes of memory `value` takes.
+
+    The items of dictionaries, lists, tuples and sets are counted too, each
+    object once. Other objects count only their own size.
+
+    :argument value: value to measure
+    '''
+    seen, size, todo = set(), 0, [value]
+    while todo:
+        item = todo.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += getsizeof(item)
+        if isinstance(item, dict):
+            todo.extend(item.keys())
+            todo.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            todo.extend(item)
+    return size
 
 
 class Base(object):
 
     '''Base for shove.'''
 
+    # most threads that should use the backend at once (None for no limit)
+    concurrency = None
+    # bytes that went through dumps and loads
+    _encoded = _decoded = 0
+
     def __init__(self, engine, **kw):
         # encode/decode (compression, serialization, ...)
         self._encoder = kw.get('encoder', pickle.dumps)
@@ -27,14 +278,102 @@ class Base(object):
         else:
             return True
 
+    def get_many(self, keys):
+        '''
+        Returns a :class:`dict` of the `keys` that are found.
+
+        :argument keys: iterable of keys
+        '''
+        found = dict()
+        for key in keys:
+            try:
+                found[key] = self[key]
+            except KeyError:
+                pass
+        return found
+
+    def set_many(self, items):
+        '''
+        Stores every key and value pair in `items`.
+
+        :argument items: mapping or iterable of key and value pairs
+        '''
+        for key, value in pairs(items):
+            self[key] = value
+
+    def delete_many(self, keys):
+        '''
+        Removes every one of `keys` that is found.
+
+        :argument keys: iterable of keys
+        '''
+        for key in keys:
+            try:
+                del self[key]
+            except KeyError:
+                pass
+
+    def iteritems(self):
+        '''Iterates over every key and value pair.'''
+        for chunk in chunks(self, SQLITE_FETCH):
+            found = self.get_many(chunk)
+            for key in chunk:
+                if key in found:
+                    yield key, found[key]
+
+    def itervalues(self):
+        '''Iterates over every value.'''
+        for _, value in self.iteritems():
+            yield value
+
+    def scan(self, prefix=None, start=None, stop=None, limit=None):
+        '''
+        Iterates over the key and value pairs in a key range in key order.
+
+        This default sorts every key, so backends that keep their keys in
+        order should override it.
+
+        :keyword prefix: only keys starting with this string
+        :keyword start: only keys that are at least this
+        :keyword stop: only keys that are less than this
+        :keyword int limit: most pairs to return
+        '''
+        low, high = scan_bounds(prefix, start, stop)
+        keys = sorted(
+            key for key in self
+            if (low is None or key >= low) and (high is None or key < high)
+        )
+        if limit is not None:
+            keys = keys[:limit]
+        for chunk in chunks(keys, SQLITE_FETCH):
+            found = self.get_many(chunk)
+            for key in chunk:
+                if key in found:
+                    yield key, found[key]
+
     def dumps(self, value):
         '''Optionally encode object `value`.'''
-        return self._encoder(value)
+        data = self._encoder(value)
+        try:
+            self._encoded += len(data)
+        except TypeError:
+            # an encoder that does not make bytes
+            pass
+        return data
 
     def loads(self, value):
         '''Optionally decode object `value`.'''
+        try:
+            self._decoded += len(value)
+        except TypeError:
+            pass
         return self._decoder(value)
 
+    def stats(self):
+        '''Returns the bytes encoded and decoded by :meth:`dumps` and
+        :meth:`loads`.'''
+        return dict(encoded_bytes=self._encoded, decoded_bytes=self._decoded)
+
 
 class CloseStore(object):
 
@@ -49,6 +388,92 @@ class CloseStore(object):
         self._store = None
 
 
+class CopyStore(object):
+
+    '''
+    Thread-safe memory backend that keeps its values apart from callers.
+
+    `copy` (keyword or ``?copy=none`` in the URI) picks how: ``deep``
+    (default) deep copies values on every read, ``none`` hands out the
+    stored values themselves, ``frozen`` stores a :func:`freeze` copy that
+    every read shares, and ``serialized`` stores encoded values and decodes
+    a copy on every read. Copies are made outside the lock.
+
+    The lock is a :class:`~shove._locks.StripedLock` of `lock_stripes`
+    stripes (default 16): a read only takes the stripe of its key, so reads
+    only wait for writes and for reads of keys on the same stripe.
+    '''
+
+    def __init__(self, engine, **kw):
+        self._lock = StripedLock(kw.get('lock_stripes', 16))
+        super(CopyStore, self).__init__(engine, **kw)
+        query = dict(parse_qsl(engine.partition('?')[2]))
+        self._copy = query.get('copy', kw.get('copy', 'deep'))
+        if self._copy not in COPY_MODES:
+            raise ValueError('unsupported copy mode {0!r}'.format(self._copy))
+
+    def __getitem__(self, key):
+        stripes = self._lock.stripes
+        with stripes[hash(key) % len(stripes)]:
+            value = super(CopyStore, self).__getitem__(key)
+        return self._thaw(value)
+
+    def __setitem__(self, key, value):
+        value = self._freeze(value)
+        with self._lock:
+            super(CopyStore, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        with self._lock:
+            super(CopyStore, self).__delitem__(key)
+
+    def get_many(self, keys):
+        # one stripe at a time
+        stripes = dict()
+        for key in keys:
+            stripes.setdefault(self._lock.stripe(key), []).append(key)
+        found = dict()
+        get_many = super(CopyStore, self).get_many
+        for stripe, batch in stripes.items():
+            with stripe:
+                found.update(get_many(batch))
+        thaw = self._thaw
+        return dict((key, thaw(value)) for key, value in found.items())
+
+    def set_many(self, items):
+        freeze = self._freeze
+        items = [(key, freeze(value)) for key, value in pairs(items)]
+        with self._lock:
+            super(CopyStore, self).set_many(items)
+
+    def delete_many(self, keys):
+        with self._lock:
+            super(CopyStore, self).delete_many(keys)
+
+    def iteritems(self):
+        with self._lock:
+            items = list(super(CopyStore, self).iteritems())
+        thaw = self._thaw
+        for key, value in items:
+            yield key, thaw(value)
+
+    def _freeze(self, value):
+        # prepares a value to be stored
+        if self._copy == 'frozen':
+            return freeze(value)
+        if self._copy == 'serialized':
+            return self.dumps(value)
+        return value
+
+    def _thaw(self, value):
+        # prepares a stored value to be handed out
+        if self._copy == 'deep':
+            return deepcopy(value)
+        if self._copy == 'serialized':
+            return self.loads(value)
+        return value
+
+
 class Mapping(Base):
 
     '''Base mapping for shove.'''
@@ -74,52 +499,242 @@ class Mapping(Base):
     def __len__(self):
         return len(self._store)
 
+    def iteritems(self):
+        return iter(pairs(self._store))
+
+    def get_many(self, keys):
+        store = self._store
+        return dict((key, store[key]) for key in keys if key in store)
+
+    def set_many(self, items):
+        self._store.update(pairs(items))
+
+    def delete_many(self, keys):
+        pop = self._store.pop
+        for key in keys:
+            pop(key, None)
+
 
 class FileBase(Base):
 
-    '''Base for file based storage.'''
+    '''
+    Base for file based storage.
+
+    With `fanout` set to a number of levels (keyword or ``?fanout=2`` in the
+    URI), each file goes under that many levels of directories named after
+    its key's hash, which keeps directories small. The layout is recorded
+    in the store directory, so it is picked up on reopen. Use
+    :func:`migrate_layout` to change the layout of a store.
+
+    With `index` set, the keys are also kept in memory so :func:`len`,
+    ``in`` and iteration do not read the directory. That only holds while
+    this object is the directory's one writer. With `manifest` set as well,
+    the keys are saved to the directory on :meth:`close` and loaded from
+    there on open unless the store was not closed cleanly.
+
+    With `mmap_threshold` set, files of at least that many bytes are read
+    through a read-only memory map and the decoder is handed a
+    :class:`memoryview` of it, and writes replace files instead of
+    truncating them. With `raw` set, values are bytes stored as they are,
+    so large ones come back as views of the map without a copy. With
+    `out_of_band` set, values are pickled with protocol 5 and their large
+    buffers (numpy arrays, :class:`pickle.PickleBuffer`) are stored
+    separately and handed back as views of the file.
+    '''
+
+    # keep keys in memory unless asked to (index=1)
+    index = False
 
     def __init__(self, engine, **kw):
         super(FileBase, self).__init__(engine, **kw)
+        engine, _, query = engine.partition('?')
         if engine.startswith(self.init):
             engine = url2pathname(engine.split('://')[1])
         self._dir = engine
+        query = dict(parse_qsl(query))
+        fanout = query.get('fanout', kw.get('fanout'))
+        self._manifest = str(
+            query.get('manifest', kw.get('manifest', False))
+        ).lower() in TRUE
+        self._index = self._manifest or str(
+            query.get('index', kw.get('index', self.index))
+        ).lower() in TRUE
+        # keys in the store when indexed
+        self._keys = None
+        # files this large or larger are read through a memory map
+        threshold = query.get('mmap_threshold', kw.get('mmap_threshold'))
+        self._mmap_threshold = (
+            None if threshold is None else max(int(threshold), 1)
+        )
+        # values are bytes written and read as they are
+        self._raw = str(query.get('raw', kw.get('raw', False))).lower() in TRUE
+        # values are pickled with their large buffers kept out of band
+        self._out_of_band = str(
+            query.get('out_of_band', kw.get('out_of_band', False))
+        ).lower() in TRUE
+        if self._out_of_band and pickle.HIGHEST_PROTOCOL < 5:
+            raise ValueError('out_of_band needs pickle protocol 5')
         # Create directory
         if not exists(self._dir):
+            self._fanout = int(fanout or 0)
             self._createdir()
+        else:
+            self._fanout = read_layout(self._dir)
+            if fanout is not None and int(fanout) != self._fanout:
+                if any(self._files()):
+                    raise ValueError(
+                        'store "{0}" has fanout {1}, use migrate_layout to '
+                        'change it'.format(self._dir, self._fanout)
+                    )
+                self._fanout = int(fanout)
+                write_layout(self._dir, self._fanout)
+        # batch operations can resolve keys relative to one open directory
+        self._dir_fd = set(getattr(os, 'supports_dir_fd', ())) >= set(
+            (os.open, os.unlink)
+        )
+        if self._index:
+            self._load_index()
 
     def __getitem__(self, key):
         # (per Larry Meyn)
         try:
             with open(self._key_to_file(key), 'rb') as item:
-                return self.loads(item.read())
+                return self._read(item)
         except (IOError, OSError):
             raise KeyError(key)
 
     def __setitem__(self, key, value):
         # (per Larry Meyn)
+        target = path = self._key_to_file(key)
+        if self._mmap_threshold is not None:
+            # replace rather than truncate a file that may be mapped
+            path = self._temp(target)
         try:
-            with open(self._key_to_file(key), 'wb') as item:
-                item.write(self.dumps(value))
+            try:
+                item = open(path, 'wb')
+            except (IOError, OSError):
+                if not self._shard(path):
+                    raise
+                item = open(path, 'wb')
+            with item:
+                for chunk in self._encode(value):
+                    item.write(chunk)
+            if path != target:
+                replace(path, target)
         except (IOError, OSError):
             raise KeyError(key)
+        if self._keys is not None:
+            self._keys.add(key)
 
     def __delitem__(self, key):
         try:
             remove(self._key_to_file(key))
         except (IOError, OSError):
             raise KeyError(key)
+        if self._keys is not None:
+            self._keys.discard(key)
 
     def __iter__(self, unquote_plus=unquote_plus):
-        for name in listdir(self._dir):
-            if not name.startswith('.'):
-                yield unquote_plus(name)
+        if self._keys is not None:
+            for key in list(self._keys):
+                yield key
+            return
+        for name, _ in self._files():
+            yield unquote_plus(name)
 
     def __contains__(self, key):
+        if self._keys is not None:
+            return key in self._keys
         return exists(self._key_to_file(key))
 
     def __len__(self):
-        return sum(1 for i in listdir(self._dir) if not i.startswith('.'))
+        if self._keys is not None:
+            return len(self._keys)
+        return sum(1 for _ in self._files())
+
+    def close(self):
+        '''Saves the manifest.'''
+        if self._manifest and self._keys is not None:
+            self._save_index()
+            self._keys = None
+        close = getattr(super(FileBase, self), 'close', None)
+        if close is not None:
+            close()
+
+    def iteritems(self):
+        # one pass over the directory entries
+        for name, path in self._files():
+            try:
+                item = open(path, 'rb')
+            except (IOError, OSError):
+                # removed since the directory was read
+                continue
+            with item:
+                value = self._read(item)
+            yield unquote_plus(name), value
+
+    def get_many(self, keys):
+        # open the directory once and resolve every key relative to it
+        if not self._dir_fd:
+            # Base, since in stores the next class is the dict based Mapping
+            return Base.get_many(self, keys)
+        found = dict()
+        dir_fd = os.open(self._dir, os.O_RDONLY)
+        try:
+            for key in keys:
+                try:
+                    fd = os.open(
+                        self._key_to_name(key), os.O_RDONLY | O_BINARY,
+                        dir_fd=dir_fd,
+                    )
+                except (IOError, OSError):
+                    continue
+                with os.fdopen(fd, 'rb') as item:
+                    found[key] = self._read(item)
+        finally:
+            os.close(dir_fd)
+        return found
+
+    def set_many(self, items):
+        if not self._dir_fd or self._mmap_threshold is not None:
+            return Base.set_many(self, items)
+        encode = self._encode
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | O_BINARY
+        dir_fd = os.open(self._dir, os.O_RDONLY)
+        try:
+            for key, value in pairs(items):
+                name = self._key_to_name(key)
+                try:
+                    try:
+                        fd = os.open(name, flags, 0o666, dir_fd=dir_fd)
+                    except (IOError, OSError):
+                        if not self._shard(join(self._dir, name)):
+                            raise
+                        fd = os.open(name, flags, 0o666, dir_fd=dir_fd)
+                    with os.fdopen(fd, 'wb') as item:
+                        for chunk in encode(value):
+                            item.write(chunk)
+                except (IOError, OSError):
+                    raise KeyError(key)
+                if self._keys is not None:
+                    self._keys.add(key)
+        finally:
+            os.close(dir_fd)
+
+    def delete_many(self, keys):
+        if not self._dir_fd:
+            return Base.delete_many(self, keys)
+        dir_fd = os.open(self._dir, os.O_RDONLY)
+        try:
+            for key in keys:
+                try:
+                    os.unlink(self._key_to_name(key), dir_fd=dir_fd)
+                except (IOError, OSError):
+                    continue
+                if self._keys is not None:
+                    self._keys.discard(key)
+        finally:
+            os.close(dir_fd)
 
     def _createdir(self):
         # creates the store directory
@@ -130,10 +745,250 @@ class FileBase(Base):
                 'cache directory "{0}" does not exist and could not be '
                 'created'.format(self._dir)
             )
+        if self._fanout:
+            write_layout(self._dir, self._fanout)
+        if self._keys is not None:
+            # the directory was emptied
+            self._keys = set()
+            if self._manifest:
+                self._mark_dirty()
+
+    def _decode(self, data):
+        # value from the contents of a file
+        if self._raw:
+            return data
+        if self._out_of_band and data[:len(OUT_OF_BAND)] == OUT_OF_BAND:
+            return loads_out_of_band(data)
+        return self.loads(data)
+
+    def _encode(self, value):
+        # chunks of the file for a value
+        if self._raw:
+            return [value]
+        if self._out_of_band:
+            return dumps_out_of_band(value)
+        return [self.dumps(value)]
+
+    def _read(self, item):
+        # value of an open file, mapped instead of copied when large
+        threshold = self._mmap_threshold
+        if threshold is not None:
+            fileno = item.fileno()
+            if os.fstat(fileno).st_size >= threshold:
+                # the map outlives the file and lives as long as views of it
+                return self._decode(memoryview(
+                    mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+                ))
+        return self._decode(item.read())
+
+    def _temp(self, path):
+        # name a file is written under before it replaces path
+        head, tail = os.path.split(path)
+        return join(head, '.{0}.{1}-{2}.tmp'.format(
+            tail, os.getpid(), current_thread().ident,
+        ))
+
+    def _files(self):
+        # (quoted key, path) of every file in the store
+        return walk_files(self._dir)
+
+    def _used_bytes(self):
+        # bytes of every file in the store
+        used = 0
+        for _, path in self._files():
+            try:
+                used += getsize(path)
+            except OSError:
+                # removed since the directory was read
+                pass
+        return used
+
+    def _load_index(self):
+        # loads the keys from a clean manifest or else from the directory
+        names = None
+        if self._manifest and not exists(meta_path(self._dir, FILE_DIRTY)):
+            try:
+                with open(meta_path(self._dir, FILE_MANIFEST)) as manifest:
+                    names = [line.rstrip('\n') for line in manifest]
+            except (IOError, OSError):
+                pass
+        if names is None:
+            names = [name for name, _ in self._files()]
+        self._keys = set(unquote_plus(name) for name in names)
+        if self._manifest:
+            # the manifest goes stale with the first write
+            self._mark_dirty()
+
+    def _mark_dirty(self):
+        with open(meta_path(self._dir, FILE_DIRTY, create=True), 'w'):
+            pass
+
+    def _save_index(self):
+        # the manifest is complete before the dirty marker goes
+        path = meta_path(self._dir, FILE_MANIFEST, create=True)
+        with open(path + '.tmp', 'w') as manifest:
+            for key in self._keys:
+                manifest.write(quote_plus(key) + '\n')
+            manifest.flush()
+            os.fsync(manifest.fileno())
+        os.rename(path + '.tmp', path)
+        try:
+            remove(meta_path(self._dir, FILE_DIRTY))
+        except OSError:
+            pass
 
     def _key_to_file(self, key):
         # gives the filesystem path for a key
-        return join(self._dir, quote_plus(key))
+        return join(self._dir, self._key_to_name(key))
+
+    def _key_to_name(self, key):
+        # gives the filesystem path for a key relative to the store directory
+        return shard_name(quote_plus(key), self._fanout)
+
+    def _shard(self, path):
+        # creates the hash directory a file goes in (False if not sharded)
+        if not self._fanout:
+            return False
+        try:
+            makedirs(dirname(path))
+        except OSError:
+            # made by another writer
+            if not isdir(dirname(path)):
+                raise
+        return True
+
+
+def shard_name(name, fanout):
+    '''
+    Returns the path of a file name under `fanout` levels of hash
+    directories.
+
+    :argument name: quoted file name
+    :argument int fanout: number of directory levels
+    '''
+    if not fanout:
+        return name
+    digest = md5(name.encode('utf-8')).hexdigest()
+    return join(*[digest[i:i + 2] for i in range(0, 2 * fanout, 2)] + [name])
+
+
+def walk_files(top):
+    '''
+    Iterates over the (file name, path) of every file under `top` whatever
+    its layout, skipping dot files.
+
+    :argument top: store directory
+    '''
+    scandir = getattr(os, 'scandir', None)
+    stack = [top]
+    while stack:
+        directory = stack.pop()
+        if scandir is None:
+            for name in listdir(directory):
+                if name.startswith('.'):
+                    continue
+                path = join(directory, name)
+                if isdir(path):
+                    stack.append(path)
+                else:
+                    yield name, path
+            continue
+        entries = scandir(directory)
+        try:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    yield entry.name, entry.path
+        finally:
+            if hasattr(entries, 'close'):
+                entries.close()
+
+
+def meta_path(top, name, create=False):
+    '''
+    Returns the path of file `name` among the store's own files in `top`.
+
+    :argument top: store directory
+    :argument name: file name
+    :argument create: make the directory holding it
+    '''
+    directory = join(top, FILE_META)
+    if create and not isdir(directory):
+        try:
+            makedirs(directory)
+        except OSError:
+            # made by another writer
+            if not isdir(directory):
+                raise
+    return join(directory, name)
+
+
+def read_layout(top):
+    '''
+    Returns the fanout recorded for the file store in `top`, 0 if flat.
+
+    :argument top: store directory
+    '''
+    try:
+        with open(meta_path(top, FILE_LAYOUT)) as layout:
+            options = dict(
+                line.strip().split('=', 1) for line in layout if '=' in line
+            )
+    except (IOError, OSError):
+        return 0
+    return int(options.get('fanout', 0))
+
+
+def write_layout(top, fanout):
+    '''
+    Records the fanout of the file store in `top`.
+
+    :argument top: store directory
+    :argument int fanout: number of directory levels
+    '''
+    path = meta_path(top, FILE_LAYOUT, create=bool(fanout))
+    if not fanout:
+        if exists(path):
+            remove(path)
+            try:
+                os.rmdir(dirname(path))
+            except OSError:
+                # still holds other files
+                pass
+        return
+    with open(path + '.tmp', 'w') as layout:
+        layout.write('fanout={0}\n'.format(fanout))
+    os.rename(path + '.tmp', path)
+
+
+def migrate_layout(top, fanout):
+    '''
+    Moves every file of the file store in `top` to the layout with `fanout`
+    levels of hash directories (0 for flat). An interrupted migration can be
+    run again. No other process should use the store meanwhile.
+
+    :argument top: store directory
+    :argument int fanout: number of directory levels
+    '''
+    fanout = int(fanout)
+    for name, path in list(walk_files(top)):
+        target = join(top, shard_name(name, fanout))
+        if target == path:
+            continue
+        parent = dirname(target)
+        if not isdir(parent):
+            makedirs(parent)
+        os.rename(path, target)
+    # drop directories left empty, deepest first
+    for directory, _, _ in sorted(
+        os.walk(top), key=lambda walked: -len(walked[0])
+    ):
+        if directory != top and not listdir(directory):
+            os.rmdir(directory)
+    write_layout(top, fanout)
 
 
 class PathBase(Base):
@@ -148,50 +1003,1291 @@ class PathBase(Base):
 
 class SQLiteBase(PathBase):
 
-    '''Base for file based storage.'''
+    '''
+    Base for sqlite based storage.
+
+    Writes are committed every `commit_every` writes (default 1) or, when
+    `commit_interval` is set, by a background thread once the oldest
+    uncommitted write is that many seconds old. :meth:`commit`,
+    :meth:`close` and the end of a :meth:`transaction` block commit whatever
+    is pending.
+
+    The `journal_mode`, `synchronous`, `cache_size` and `mmap_size` pragmas
+    can be passed as keywords or in the URI query string, which wins over
+    keywords (``lite://test.db?journal_mode=WAL&commit_every=100``), as can
+    the commit policy.
+
+    Values are stored as BLOBs (tables from older versions that declare the
+    value column TEXT are migrated on open). Where incremental blob I/O is
+    available, values of at least `blob_threshold` bytes (default 1 MiB)
+    are written and read in chunks instead of being copied whole through
+    the statement.
+
+    With `raw_keys` set, keys must be strings and are stored as text instead
+    of being pickled, which keeps them in order so :meth:`scan` can use the
+    index.
+
+    With `pool` set, each thread reads through its own connection, and the
+    journal defaults to WAL so reads run in parallel with each other and
+    with the writer connection. Reads go to the writer connection
+    while it holds uncommitted writes so they stay visible, so with
+    `commit_every` above 1 set `commit_interval` too to bound how long
+    that lasts.
+    '''
+
+    # one connection serves every thread
+    concurrency = 1
 
     def __init__(self, engine, **kw):
+        engine, _, query = engine.partition('?')
         super(SQLiteBase, self).__init__(engine, **kw)
-        # make store table
-        self._store = sqlite3.connect(self._engine)
+        # options in the URI query win over keywords
+        query = dict(parse_qsl(query))
+        # commit policy
+        self._commit_every = max(
+            int(query.pop('commit_every', kw.get('commit_every', 1))), 1
+        )
+        # keys kept as text, in order, instead of pickled
+        raw_keys = query.pop('raw_keys', kw.get('raw_keys', False))
+        self._raw_keys = str(raw_keys).lower() in TRUE
+        # values read and written in chunks
+        self._blob_threshold = int(query.pop(
+            'blob_threshold', kw.get('blob_threshold', 1 << 20)
+        ))
+        interval = query.pop('commit_interval', kw.get('commit_interval'))
+        self._commit_interval = None if interval is None else float(interval)
+        # uncommitted writes, when the oldest was made and open transactions
+        self._dirty = 0
+        self._since = None
+        self._depth = 0
+        self._closed = False
+        # make store table (the connection is shared by threads, serialized
+        # by self._lock)
+        self._store = sqlite3.connect(self._engine, check_same_thread=False)
         self._store.text_factory = native
+        self._lock = Condition()
         self._cursor = self._store.cursor()
+        # per thread read connections (an in-memory database is private to
+        # its connection so it cannot be pooled)
+        self._readers = self._local = None
+        pool = query.pop('pool', kw.get('pool', False))
+        pragmas = dict(
+            (name, kw[name]) for name in SQLITE_PRAGMAS if name in kw
+        )
+        pragmas.update(query)
+        if str(pool).lower() in TRUE and (
+            self._engine != ':memory:'
+        ):
+            pragmas.setdefault('journal_mode', 'WAL')
+            # by the thread they belong to
+            self._readers = dict()
+            self._local = local()
+            # reads no longer share the writer connection
+            self.concurrency = None
+        self._pragmas = dict(
+            (name, self._pragma(name, value)) for name, value in pragmas.items()
+        )
+        for statement in self._pragmas.values():
+            self._cursor.execute(statement)
         # create store table if it does not exist
         self._cursor.execute(
             '''
             CREATE TABLE IF NOT EXISTS shove (
                 key TEXT PRIMARY KEY NOT NULL,
-                value TEXT NOT NULL
+                value BLOB NOT NULL
             )
             '''
         )
         self._store.commit()
+        self._migrate()
+        self._committer = None
+        if self._commit_interval is not None and self._commit_interval > 0:
+            self._committer = Thread(target=self._commit_loop)
+            self._committer.daemon = True
+            self._committer.start()
 
     def __getitem__(self, key):
-        self._cursor.execute('SELECT value FROM shove WHERE key=?', (self.dumps(key),))
-        row = self._cursor.fetchone()
-        if row:
-            return self.loads(row[0])
-        raise KeyError(key)
+        reader = self._reader()
+        if reader is None:
+            with self._lock:
+                return self._get(self._store, key)
+        return self._get(reader, key)
 
+    @synchronized
     def __setitem__(self, k, v):
+        self._insert([(self._dumpkey(k), self.dumps(v))])
+        self._wrote(1)
+
+    @synchronized
+    def __delitem__(self, key):
         self._cursor.execute(
-            'INSERT OR REPLACE INTO shove VALUES (?, ?)',
-            (self.dumps(k), self.dumps(v))
+            'DELETE FROM shove WHERE key=?', (self._lookupkey(key),)
         )
-        self._store.commit()
+        self._wrote(1)
+
+    def __iter__(self):
+        loadkey = self._loadkey
+        for row in self._rows('SELECT key FROM shove'):
+            yield loadkey(row[0])
+
+    def __len__(self):
+        reader = self._reader()
+        if reader is None:
+            with self._lock:
+                return self._len(self._store)
+        return self._len(reader)
+
+    def get_many(self, keys):
+        reader = self._reader()
+        if reader is None:
+            with self._lock:
+                return self._get_many(self._store, keys)
+        return self._get_many(reader, keys)
+
+    @synchronized
+    def set_many(self, items):
+        # encode first so a bad value leaves nothing half written
+        dumps, dumpkey = self.dumps, self._dumpkey
+        rows = [(dumpkey(k), dumps(v)) for k, v in pairs(items)]
+        self._insert(rows)
+        # the whole batch counts as one write
+        self._wrote(bool(rows))
+
+    @synchronized
+    def delete_many(self, keys):
+        rows = [(key,) for key in self._lookupkeys(keys)]
+        self._store.executemany('DELETE FROM shove WHERE key=?', rows)
+        self._wrote(bool(rows))
+
+    @synchronized
+    def clear(self):
+        self._cursor.execute('DELETE FROM shove')
+        self._wrote(1)
+
+    def scan(self, prefix=None, start=None, stop=None, limit=None):
+        if not self._raw_keys:
+            # pickled keys are not kept in key order
+            for item in super(SQLiteBase, self).scan(
+                prefix, start, stop, limit
+            ):
+                yield item
+            return
+        low, high = scan_bounds(prefix, start, stop)
+        where, args = [], []
+        if low is not None:
+            where.append('key >= ?')
+            args.append(low)
+        if high is not None:
+            where.append('key < ?')
+            args.append(high)
+        sql = 'SELECT key, value FROM shove'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY key'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            args.append(int(limit))
+        loadvalue = self._loadvalue
+        for key, value in self._rows(sql, args):
+            yield key, loadvalue(value)
+
+    def iteritems(self):
+        loadkey, loadvalue = self._loadkey, self._loadvalue
+        for key, value in self._rows('SELECT key, value FROM shove'):
+            yield loadkey(key), loadvalue(value)
+
+    def itervalues(self):
+        loadvalue = self._loadvalue
+        for row in self._rows('SELECT value FROM shove'):
+            yield loadvalue(row[0])
+
+    @synchronized
+    def commit(self):
+        '''Commits pending writes.'''
+        if self._dirty:
+            self._store.commit()
+            self._dirty, self._since = 0, None
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Runs the block as one transaction.
+
+        Other threads wait for the block to finish. Writes made in it are
+        committed together at the end or rolled back if it raises.
+        '''
+        with self._lock:
+            if not self._depth:
+                # keep earlier writes out of a possible rollback
+                self.commit()
+            self._depth += 1
+            try:
+                yield self
+            except Exception:
+                self._depth -= 1
+                if not self._depth:
+                    self._store.rollback()
+                    self._dirty, self._since = 0, None
+                raise
+            self._depth -= 1
+            if not self._depth:
+                self.commit()
+
+    def close(self):
+        '''Commits pending writes and closes the store.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._committer is not None:
+            self._committer.join()
+            self._committer = None
+        if self._store is not None:
+            self.commit()
+        if self._readers:
+            with self._lock:
+                readers, self._readers = self._readers, dict()
+            for reader in readers.values():
+                reader.close()
+        super(SQLiteBase, self).close()
+
+    def _reader(self):
+        # this thread's read connection or None to read with the writer
+        if self._readers is None or self._dirty or self._depth:
+            return None
+        try:
+            return self._local.connection
+        except AttributeError:
+            reader = sqlite3.connect(self._engine, check_same_thread=False)
+            reader.text_factory = native
+            # the journal mode belongs to the database, the rest to the
+            # connection
+            for name, statement in self._pragmas.items():
+                if name != 'journal_mode':
+                    reader.execute(statement)
+            with self._lock:
+                readers = self._readers
+                # threads that have exited (a pool replacing its workers)
+                # leave their connections behind
+                stale = [
+                    readers.pop(thread) for thread in list(readers)
+                    if not thread.is_alive()
+                ]
+                readers[current_thread()] = reader
+            for old in stale:
+                old.close()
+            self._local.connection = reader
+            return reader
+
+    def _rows(self, sql, args=()):
+        # fetch in batches so other threads get the connection in between
+        cursor = self._store.cursor()
+        with self._lock:
+            cursor.execute(sql, args)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(SQLITE_FETCH)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def _dumpkey(self, key):
+        # key as stored in the key column
+        if self._raw_keys:
+            if not isinstance(key, strings):
+                raise TypeError('raw keys must be strings: {0!r}'.format(key))
+            return key
+        return self.dumps(key)
+
+    def _loadkey(self, key):
+        return key if self._raw_keys else self.loads(key)
+
+    def _lookupkey(self, key):
+        # key as stored, for reads and deletes: a key that could not have
+        # been stored is missing
+        if self._raw_keys and not isinstance(key, strings):
+            raise KeyError(key)
+        return self._dumpkey(key)
+
+    def _lookupkeys(self, keys):
+        # stored key -> key for the keys that could have been stored
+        if not self._raw_keys:
+            dumps = self.dumps
+            return dict((dumps(key), key) for key in keys)
+        return dict((key, key) for key in keys if isinstance(key, strings))
+
+    def _get(self, connection, key):
+        if not SQLITE_BLOBOPEN:
+            row = connection.execute(
+                'SELECT value FROM shove WHERE key=?', (self._lookupkey(key),)
+            ).fetchone()
+            if row:
+                return self._loadvalue(row[0])
+            raise KeyError(key)
+        # large values are left out and read in chunks
+        row = connection.execute(
+            '''
+            SELECT rowid, length(value),
+                CASE WHEN length(value) < ? THEN value END
+            FROM shove WHERE key=?
+            ''',
+            (self._blob_threshold, self._lookupkey(key)),
+        ).fetchone()
+        if not row:
+            raise KeyError(key)
+        rowid, size, value = row
+        if value is None:
+            value = memoryview(bytearray(size))
+            with connection.blobopen(
+                'shove', 'value', rowid, readonly=True
+            ) as blob:
+                for offset in range(0, size, SQLITE_BLOB_CHUNK):
+                    chunk = blob.read(SQLITE_BLOB_CHUNK)
+                    value[offset:offset + len(chunk)] = chunk
+        return self._loadvalue(value)
+
+    def _insert(self, rows):
+        # writes encoded rows, streaming large values in chunks
+        threshold = self._blob_threshold
+        if SQLITE_BLOBOPEN:
+            large = [row for row in rows if len(row[1]) >= threshold]
+            rows = [row for row in rows if len(row[1]) < threshold]
+        else:
+            large = ()
+        if rows:
+            Binary = sqlite3.Binary
+            self._store.executemany(
+                'INSERT OR REPLACE INTO shove VALUES (?, ?)',
+                ((key, Binary(value)) for key, value in rows),
+            )
+        for key, value in large:
+            cursor = self._store.execute(
+                'INSERT OR REPLACE INTO shove VALUES (?, zeroblob(?))',
+                (key, len(value)),
+            )
+            value = memoryview(value)
+            with self._store.blobopen('shove', 'value', cursor.lastrowid) as blob:
+                for offset in range(0, len(value), SQLITE_BLOB_CHUNK):
+                    blob.write(value[offset:offset + SQLITE_BLOB_CHUNK])
+
+    def _loadvalue(self, value):
+        # sqlite hands Python 2 BLOBs over as buffers
+        return self.loads(value if PY3 else bytes(value))
+
+    def _migrate(self):
+        # rebuilds tables whose value column is declared TEXT
+        columns = dict(
+            (row[1], row[2].upper())
+            for row in self._store.execute('PRAGMA table_info(shove)')
+        )
+        if columns.get('value') != 'TEXT':
+            return
+        with self._store:
+            self._store.executescript(
+                '''
+                CREATE TABLE shove_blob (
+                    key TEXT PRIMARY KEY NOT NULL,
+                    value BLOB NOT NULL
+                );
+                INSERT INTO shove_blob
+                    SELECT key, CAST(value AS BLOB) FROM shove;
+                DROP TABLE shove;
+                ALTER TABLE shove_blob RENAME TO shove;
+                '''
+            )
+
+    def _get_many(self, connection, keys):
+        found = dict()
+        loadvalue = self._loadvalue
+        for chunk in chunks(keys, SQLITE_MAX_VARS):
+            encoded = self._lookupkeys(chunk)
+            if not encoded:
+                continue
+            rows = connection.execute(
+                'SELECT key, value FROM shove WHERE key IN ({0})'.format(
+                    ', '.join('?' * len(encoded))
+                ),
+                list(encoded),
+            )
+            for key, value in rows:
+                found[encoded[key]] = loadvalue(value)
+        return found
+
+    @staticmethod
+    def _len(connection):
+        return int(
+            connection.execute('SELECT COUNT(*) FROM shove').fetchone()[0]
+        )
+
+    def _commit_loop(self):
+        # commits writes once the oldest is commit_interval seconds old
+        interval = self._commit_interval
+        with self._lock:
+            while not self._closed:
+                if not self._dirty:
+                    # woken by the first write
+                    self._lock.wait()
+                    continue
+                wait = self._since + interval - time()
+                if wait > 0:
+                    self._lock.wait(wait)
+                else:
+                    # not inside a transaction, which holds the lock
+                    self._store.commit()
+                    self._dirty, self._since = 0, None
+
+    def _wrote(self, count):
+        # commits when the commit policy says so
+        if not count:
+            return
+        if not self._dirty:
+            self._since = time()
+            if self._committer is not None:
+                self._lock.notify_all()
+        self._dirty += count
+        if self._depth:
+            return
+        interval = self._commit_interval
+        if self._dirty >= self._commit_every or (
+            interval is not None and time() - self._since >= interval
+        ):
+            self._store.commit()
+            self._dirty, self._since = 0, None
+
+    @staticmethod
+    def _pragma(name, value):
+        # builds a pragma statement from an allowed name and value
+        allowed = SQLITE_PRAGMAS.get(name)
+        if allowed is None:
+            raise ValueError('unsupported sqlite pragma {0!r}'.format(name))
+        if allowed is int:
+            value = int(value)
+        else:
+            value = str(value).upper()
+            if value not in allowed:
+                raise ValueError(
+                    'unsupported value {0!r} for sqlite pragma {1}'.format(
+                        value, name,
+                    )
+                )
+        return 'PRAGMA {0}={1}'.format(name, value)
+
+
+class LogBase(PathBase):
+
+    '''
+    Base for log-structured storage.
+
+    Every write appends a record (checksum, key and value) to the newest
+    segment file in the store directory and every delete appends a
+    tombstone, so writes are sequential. An in-memory key directory holds
+    where the latest value of each key is, so a read is one seek. When a
+    segment reaches `segment_bytes` (default 64 MiB) it is never written
+    again and a hint file listing its keys and offsets is written next to
+    it, as one is for the open segment on :meth:`close`. Opening a store
+    reads the hint files instead of the segments. A segment without a
+    current hint file is scanned instead, and a torn record at the end of
+    the newest one is cut off.
+
+    Records reach the operating system with every write and, with `fsync`
+    set, the disk. A background thread runs :meth:`compact` every
+    `compact_interval` seconds (default 60, 0 for never), which copies the
+    live records out of full segments that are at least `compact_ratio`
+    (default 0.5) dead and removes them.
+
+    Options can be passed as keywords or in the URI query string, which
+    wins over keywords (``log://test?segment_bytes=1048576``).
+    '''
+
+    # the segment files are shared by every thread
+    concurrency = 1
+
+    def __init__(self, engine, **kw):
+        engine, _, query = engine.partition('?')
+        super(LogBase, self).__init__(engine, **kw)
+        # options in the URI query win over keywords
+        query = dict(parse_qsl(query))
+        self._segment_bytes = max(int(query.get(
+            'segment_bytes', kw.get('segment_bytes', 1 << 26)
+        )), 1)
+        self._fsync = str(
+            query.get('fsync', kw.get('fsync', False))
+        ).lower() in TRUE
+        self._compact_ratio = float(
+            query.get('compact_ratio', kw.get('compact_ratio', 0.5))
+        )
+        interval = float(
+            query.get('compact_interval', kw.get('compact_interval', 60))
+        )
+        self._lock = Condition()
+        # one compaction at a time
+        self._compaction = Lock()
+        # key -> (segment, value offset, value length, record length)
+        self._store = dict()
+        # bytes in each segment and how many of them are no longer live
+        self._sizes = dict()
+        self._dead = dict()
+        # segments open for reading
+        self._readers = dict()
+        # segment being written, its size and the entries for its hint file
+        self._active = self._segment = self._offset = None
+        self._hints = []
+        self._closed = False
+        if not exists(self._engine):
+            makedirs(self._engine)
+        self._load()
+        self._compactor = None
+        if interval > 0:
+            self._compactor = Thread(
+                target=self._compact_loop, args=[interval]
+            )
+            self._compactor.setDaemon(True)
+            self._compactor.start()
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                entry = self._store[key]
+            except KeyError:
+                raise KeyError(key)
+            value = self._value(entry)
+        return self.loads(value)
+
+    def __setitem__(self, key, value):
+        value = self.dumps(value)
+        with self._lock:
+            self._put(key, value)
+            self._wrote()
 
     def __delitem__(self, key):
-        self._cursor.execute('DELETE FROM shove WHERE key=?', (self.dumps(key),))
-        self._store.commit()
+        with self._lock:
+            if key not in self._store:
+                raise KeyError(key)
+            self._remove(key)
+            self._wrote()
+
+    def __contains__(self, key):
+        return key in self._store
 
     def __iter__(self):
-        for row in self._store.execute('SELECT key FROM shove'):
-            yield self.loads(row[0])
+        with self._lock:
+            return iter(list(self._store))
 
     def __len__(self):
-        return int(self._store.execute('SELECT COUNT(*) FROM shove').fetchone()[0])
+        return len(self._store)
+
+    def get_many(self, keys):
+        found = []
+        with self._lock:
+            store = self._store
+            for key in keys:
+                entry = store.get(key)
+                if entry is not None:
+                    found.append((key, self._value(entry)))
+        loads = self.loads
+        return dict((key, loads(value)) for key, value in found)
+
+    def set_many(self, items):
+        dumps = self.dumps
+        items = [(key, dumps(value)) for key, value in pairs(items)]
+        with self._lock:
+            for key, value in items:
+                self._put(key, value)
+            self._wrote()
+
+    def delete_many(self, keys):
+        with self._lock:
+            store = self._store
+            for key in keys:
+                if key in store:
+                    self._remove(key)
+            self._wrote()
+
+    def iteritems(self):
+        # reads in segment and offset order
+        with self._lock:
+            entries = sorted(self._store.items(), key=itemgetter(1))
+        loads = self.loads
+        for chunk in chunks(entries, SQLITE_FETCH):
+            with self._lock:
+                store = self._store
+                found = [
+                    (key, self._value(store[key]))
+                    for key, _ in chunk if key in store
+                ]
+            for key, value in found:
+                yield key, loads(value)
 
     def clear(self):
-        self._cursor.execute('DELETE FROM shove')
-        self._store.commit()
\ No newline at end of file
+        '''Removes every segment.'''
+        with self._compaction:
+            with self._lock:
+                self._close_files()
+                for name in listdir(self._engine):
+                    if name.endswith(('.log', '.hint')):
+                        remove(join(self._engine, name))
+                self._store.clear()
+                self._sizes.clear()
+                self._dead.clear()
+                self._open(0)
+
+    def compact(self):
+        '''
+        Copies the live records out of full segments that are at least
+        `compact_ratio` dead and removes those segments.
+        '''
+        with self._compaction:
+            with self._lock:
+                ratio = self._compact_ratio
+                segments = sorted(
+                    segment for segment, size in self._sizes.items()
+                    if segment != self._segment and
+                    self._dead[segment] >= ratio * size
+                )
+            for segment in segments:
+                if not self._compact(segment):
+                    break
+
+    def stats(self):
+        '''Returns the segment count and the log's total and dead bytes
+        along with the encoded and decoded bytes.'''
+        stats = super(LogBase, self).stats()
+        with self._lock:
+            stats.update(
+                segments=len(self._sizes),
+                log_bytes=sum(self._sizes.values()),
+                dead_bytes=sum(self._dead.values()),
+            )
+        return stats
+
+    def close(self):
+        '''Writes the hint file for the open segment and closes segments.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            if self._active is not None:
+                self._finish()
+                self._close_files()
+        close = getattr(super(LogBase, self), 'close', None)
+        if close is not None:
+            close()
+
+    def _append(self, flags, key, value):
+        # appends a record to the open segment and returns its entry
+        if self._offset >= self._segment_bytes:
+            self._finish()
+            self._active.close()
+            self._open(self._segment + 1)
+        header = LOG_HEADER.pack(flags, len(key), len(value))
+        crc = crc32(value, crc32(key, crc32(header))) & 0xffffffff
+        write = self._active.write
+        write(LOG_CRC.pack(crc))
+        write(header)
+        write(key)
+        write(value)
+        start = self._offset
+        offset = start + LOG_CRC.size + LOG_HEADER.size + len(key)
+        self._offset = offset + len(value)
+        self._sizes[self._segment] = self._offset
+        self._hints.append((flags, key, offset, len(value)))
+        return self._segment, offset, len(value), self._offset - start
+
+    def _close_files(self):
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+
+    def _compact(self, segment):
+        # copies the live records out of a full segment, then removes it
+        entries = self._entries(segment)
+        loads = self.loads
+        for chunk in chunks(entries, SQLITE_FETCH):
+            with self._lock:
+                if self._closed:
+                    return False
+                store = self._store
+                # tombstones still hide records in older segments
+                older = any(other < segment for other in self._sizes)
+                for flags, key, offset, length in chunk:
+                    name = loads(key)
+                    if flags & LOG_TOMBSTONE:
+                        if older and name not in store:
+                            self._index(
+                                name, flags, self._append(flags, key, b'')
+                            )
+                        continue
+                    entry = store.get(name)
+                    if entry is not None and entry[:2] == (segment, offset):
+                        self._index(
+                            name, flags,
+                            self._append(flags, key, self._value(entry)),
+                        )
+                self._active.flush()
+        with self._lock:
+            if self._closed:
+                return False
+            # the copies are on disk before the originals go
+            os.fsync(self._active.fileno())
+            reader = self._readers.pop(segment, None)
+            if reader is not None:
+                reader.close()
+            for suffix in ('.hint', '.log'):
+                try:
+                    remove(self._path(segment, suffix))
+                except OSError:
+                    pass
+            del self._sizes[segment], self._dead[segment]
+        return True
+
+    def _compact_loop(self, interval):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._lock.wait(interval)
+                if self._closed:
+                    return
+            self.compact()
+
+    def _entries(self, segment, repair=False):
+        # (flags, key, value offset, value length) of a segment's records
+        path = self._path(segment, '.log')
+        try:
+            with open(self._path(segment, '.hint'), 'rb') as hint:
+                data = hint.read()
+        except (IOError, OSError):
+            data = None
+        if data is not None and (
+            data[:LOG_HINT_SIZE.size] == LOG_HINT_SIZE.pack(getsize(path))
+        ):
+            entries = []
+            position = LOG_HINT_SIZE.size
+            while position < len(data):
+                flags, size, offset, length = LOG_HINT.unpack_from(
+                    data, position
+                )
+                position += LOG_HINT.size
+                entries.append(
+                    (flags, data[position:position + size], offset, length)
+                )
+                position += size
+            return entries
+        return self._scan_segment(path, repair)
+
+    def _finish(self):
+        # puts the open segment on disk and writes its hint file
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        path = self._path(self._segment, '.hint')
+        with open(path + '.tmp', 'wb') as hint:
+            hint.write(LOG_HINT_SIZE.pack(self._offset))
+            for flags, key, offset, length in self._hints:
+                hint.write(LOG_HINT.pack(flags, len(key), offset, length))
+                hint.write(key)
+            hint.flush()
+            os.fsync(hint.fileno())
+        replace(path + '.tmp', path)
+
+    def _index(self, key, flags, entry):
+        # points the key directory at a new record
+        old = self._store.pop(key, None)
+        if old is not None:
+            self._dead[old[0]] += old[3]
+        if flags & LOG_TOMBSTONE:
+            self._dead[entry[0]] += entry[3]
+        else:
+            self._store[key] = entry
+
+    def _load(self):
+        # rebuilds the key directory from hint files or segments
+        segments = sorted(
+            int(name[:-4]) for name in listdir(self._engine)
+            if name.endswith('.log') and name[:-4].isdigit()
+        )
+        entries = []
+        loads = self.loads
+        for segment in segments:
+            entries = self._entries(segment, segment == segments[-1])
+            self._sizes[segment] = getsize(self._path(segment, '.log'))
+            self._dead[segment] = 0
+            head = LOG_CRC.size + LOG_HEADER.size
+            for flags, key, offset, length in entries:
+                self._index(loads(key), flags, (
+                    segment, offset, length, head + len(key) + length
+                ))
+        self._open(segments[-1] if segments else 0)
+        self._hints = entries
+
+    def _open(self, segment):
+        # opens a segment for appending
+        path = self._path(segment, '.log')
+        self._active = open(path, 'ab')
+        self._segment = segment
+        self._offset = getsize(path)
+        self._sizes[segment] = self._offset
+        self._dead.setdefault(segment, 0)
+        self._hints = []
+
+    def _path(self, segment, suffix):
+        return join(self._engine, '{0:010d}{1}'.format(segment, suffix))
+
+    def _put(self, key, value):
+        self._index(key, 0, self._append(0, self.dumps(key), value))
+
+    def _remove(self, key):
+        entry = self._append(LOG_TOMBSTONE, self.dumps(key), b'')
+        self._index(key, LOG_TOMBSTONE, entry)
+
+    @staticmethod
+    def _scan_segment(path, repair):
+        # reads records until the end or the first damaged one
+        entries = []
+        head = LOG_CRC.size + LOG_HEADER.size
+        position = 0
+        with open(path, 'rb') as segment:
+            while True:
+                record = segment.read(head)
+                if len(record) < head:
+                    break
+                crc, = LOG_CRC.unpack_from(record)
+                header = record[LOG_CRC.size:]
+                flags, size, length = LOG_HEADER.unpack(header)
+                key = segment.read(size)
+                value = segment.read(length)
+                if len(key) < size or len(value) < length or crc != (
+                    crc32(value, crc32(key, crc32(header))) & 0xffffffff
+                ):
+                    break
+                entries.append((flags, key, position + head + size, length))
+                position += head + size + length
+        if repair and position < getsize(path):
+            with open(path, 'r+b') as segment:
+                segment.truncate(position)
+        return entries
+
+    def _value(self, entry):
+        # reads the value a key directory entry points to
+        segment, offset, length = entry[:3]
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(
+                self._path(segment, '.log'), 'rb'
+            )
+        reader.seek(offset)
+        return reader.read(length)
+
+    def _wrote(self):
+        # hands the records written to the operating system
+        self._active.flush()
+        if self._fsync:
+            os.fsync(self._active.fileno())
+
+
+class _ShmGuard(object):
+
+    # holds a shm store's thread lock and a flock on its lock file
+
+    __slots__ = ('_owner', '_mode')
+
+    def __init__(self, owner, mode):
+        self._owner = owner
+        self._mode = mode
+
+    def __enter__(self):
+        owner = self._owner
+        owner._lock.acquire()
+        try:
+            fcntl.flock(owner._lockfile, self._mode)
+        except BaseException:
+            owner._lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        owner = self._owner
+        fcntl.flock(owner._lockfile, fcntl.LOCK_UN)
+        owner._lock.release()
+
+
+class ShmBase(Base):
+
+    '''
+    Base for storage in a shared memory segment.
+
+    Every process that opens the same name shares one segment, laid out as
+    a hash table of `slots` slots (default one per KiB) pointing into an
+    arena where keys and values are appended. The segment is `size` bytes
+    (default 64 MiB) and is made by the first process to open it; the
+    others use its layout. Processes exclude each other with
+    :func:`fcntl.flock` on a lock file (shared for reads, exclusive for
+    writes). Keys are found by their pickle, so they must pickle the same
+    in every process, as strings and numbers do.
+
+    Replaced and deleted entries leave dead space that is reclaimed by
+    compacting the segment when it fills up. When there is still no room,
+    :meth:`_full` decides what happens.
+
+    The segment outlives the processes using it until :meth:`unlink`.
+    Options can be passed as keywords or in the URI query string
+    (``shm://workers?size=268435456``).
+    '''
+
+    def __init__(self, engine, **kw):
+        if shared_memory is None or fcntl is None:
+            raise ImportError(
+                'shm needs Python 3.8 or later and a POSIX platform'
+            )
+        super(ShmBase, self).__init__(engine, **kw)
+        engine, _, query = engine.partition('?')
+        query = dict(parse_qsl(query))
+        if engine.startswith(self.init):
+            engine = engine.split('://')[1]
+        self._name = engine
+        size = int(query.get('size', kw.get('size', 1 << 26)))
+        slots = int(query.get('slots', kw.get('slots', size >> 10)))
+        self._lock = Lock()
+        self._pid = None
+        self._lockfile = None
+        self._relock()
+        with self._locked(True):
+            self._shm = self._attach(size, max(slots, 1))
+        self._buf = self._shm.buf
+        (_, self._slots, self._start, self._end, _, _, _, _) = (
+            SHM_HEADER.unpack_from(self._buf)
+        )
+
+    def __getitem__(self, key):
+        encoded = self.dumps(key)
+        digest = self._digest(encoded)
+        with self._locked(False):
+            slot = self._find(encoded, digest)[0]
+            if slot is None:
+                raise KeyError(key)
+            value = self._value(slot)
+        return self.loads(value)
+
+    def __setitem__(self, key, value):
+        key, value = self.dumps(key), self.dumps(value)
+        with self._locked(True):
+            self._put(key, value)
+
+    def __delitem__(self, key):
+        encoded = self.dumps(key)
+        with self._locked(True):
+            if not self._remove(encoded):
+                raise KeyError(key)
+
+    def __contains__(self, key):
+        encoded = self.dumps(key)
+        digest = self._digest(encoded)
+        with self._locked(False):
+            return self._find(encoded, digest)[0] is not None
+
+    def __iter__(self):
+        loads = self.loads
+        for chunk in self._chunks(False):
+            for key, _ in chunk:
+                yield loads(key)
+
+    def __len__(self):
+        with self._locked(False):
+            return SHM_HEADER.unpack_from(self._buf)[5]
+
+    def get_many(self, keys):
+        dumps, digest = self.dumps, self._digest
+        encoded = [(key, dumps(key)) for key in keys]
+        found = []
+        with self._locked(False):
+            for key, raw in encoded:
+                slot = self._find(raw, digest(raw))[0]
+                if slot is not None:
+                    found.append((key, self._value(slot)))
+        loads = self.loads
+        return dict((key, loads(value)) for key, value in found)
+
+    def set_many(self, items):
+        dumps = self.dumps
+        items = [(dumps(key), dumps(value)) for key, value in pairs(items)]
+        with self._locked(True):
+            for key, value in items:
+                self._put(key, value)
+
+    def delete_many(self, keys):
+        dumps = self.dumps
+        keys = [dumps(key) for key in keys]
+        with self._locked(True):
+            for key in keys:
+                self._remove(key)
+
+    def iteritems(self):
+        loads = self.loads
+        for chunk in self._chunks(True):
+            for key, value in chunk:
+                yield loads(key), loads(value)
+
+    def clear(self):
+        '''Removes every entry.'''
+        with self._locked(True):
+            self._reset()
+
+    def close(self):
+        '''Detaches from the segment, which stays for other processes.'''
+        if self._shm is not None:
+            self._buf = None
+            self._shm.close()
+            self._shm = None
+        if self._lockfile is not None:
+            self._lockfile.close()
+            self._lockfile = None
+        close = getattr(super(ShmBase, self), 'close', None)
+        if close is not None:
+            close()
+
+    def unlink(self):
+        '''Removes the segment and its lock file.'''
+        try:
+            shm = shared_memory.SharedMemory(name=self._name)
+        except (IOError, OSError):
+            pass
+        else:
+            shm.close()
+            shm.unlink()
+        try:
+            remove(self._lock_path())
+        except OSError:
+            pass
+
+    def _attach(self, size, slots):
+        # opens the segment or makes and lays it out
+        try:
+            shm = shared_memory.SharedMemory(name=self._name)
+        except (IOError, OSError):
+            start = SHM_HEADER.size + slots * SHM_SLOT.size
+            if start >= size:
+                raise ValueError(
+                    'shm size {0} leaves no room for {1} slots'.format(
+                        size, slots,
+                    )
+                )
+            shm = shared_memory.SharedMemory(
+                name=self._name, create=True, size=size
+            )
+            SHM_HEADER.pack_into(
+                shm.buf, 0, SHM_MAGIC, slots, start, size, start, 0, 0, 0
+            )
+        else:
+            if bytes(shm.buf[:len(SHM_MAGIC)]) != SHM_MAGIC:
+                shm.close()
+                raise ValueError(
+                    'shared memory "{0}" is not a shove segment'.format(
+                        self._name
+                    )
+                )
+        # the segment belongs to every process using it, so the process
+        # that made it must not remove it when it exits
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:  # pragma: no cover
+            pass
+        return shm
+
+    def _chunks(self, values):
+        # lists of (key, value or None) pairs a table range at a time
+        for start in range(0, self._slots, SQLITE_FETCH):
+            with self._locked(False):
+                chunk = self._entries(start, start + SQLITE_FETCH, values)
+            yield chunk
+
+    def _compact(self):
+        # rewrites the live entries without dead space or deleted slots
+        buf = self._buf
+        live = []
+        for slot in range(self._slots):
+            digest, offset, size, length = SHM_SLOT.unpack_from(
+                buf, SHM_HEADER.size + slot * SHM_SLOT.size
+            )
+            if offset > 1:
+                live.append(
+                    (digest, bytes(buf[offset:offset + size + length]), size)
+                )
+        self._reset()
+        table, tail = SHM_HEADER.size, self._start
+        for digest, record, size in live:
+            slot = digest % self._slots
+            while SHM_SLOT.unpack_from(buf, table + slot * SHM_SLOT.size)[1]:
+                slot = (slot + 1) % self._slots
+            buf[tail:tail + len(record)] = record
+            SHM_SLOT.pack_into(
+                buf, table + slot * SHM_SLOT.size,
+                digest, tail, size, len(record) - size,
+            )
+            tail += len(record)
+        self._header(tail=tail, count=len(live))
+
+    @staticmethod
+    def _digest(key):
+        # hash of a pickled key that is the same in every process
+        return SHM_DIGEST.unpack_from(md5(key).digest())[0]
+
+    def _entry_bytes(self, key):
+        # arena bytes of the entry for a pickled key (0 if it is gone)
+        with self._locked(False):
+            slot = self._find(key, self._digest(key))[0]
+            if slot is None:
+                return 0
+            return sum(SHM_SLOT.unpack_from(
+                self._buf, SHM_HEADER.size + slot * SHM_SLOT.size
+            )[2:])
+
+    def _entries(self, start, stop, values):
+        # (key, value or None) pairs in a range of the table
+        buf, entries = self._buf, []
+        for slot in range(start, min(stop, self._slots)):
+            _, offset, size, length = SHM_SLOT.unpack_from(
+                buf, SHM_HEADER.size + slot * SHM_SLOT.size
+            )
+            if offset > 1:
+                entries.append((
+                    bytes(buf[offset:offset + size]),
+                    bytes(buf[offset + size:offset + size + length])
+                    if values else None,
+                ))
+        return entries
+
+    def _find(self, key, digest):
+        # (slot holding key or None, slot to put key in or None)
+        buf, slots = self._buf, self._slots
+        slot, free = digest % slots, None
+        for _ in range(slots):
+            stored, offset, size, _ = SHM_SLOT.unpack_from(
+                buf, SHM_HEADER.size + slot * SHM_SLOT.size
+            )
+            if not offset:
+                return None, slot if free is None else free
+            if offset == 1:
+                if free is None:
+                    free = slot
+            elif (
+                stored == digest and size == len(key) and
+                buf[offset:offset + size] == key
+            ):
+                return slot, slot
+            slot = (slot + 1) % slots
+        return None, free
+
+    def _full(self, key, value):
+        # called when an entry does not fit even after compacting
+        raise MemoryError(
+            'shm "{0}" has no room for {1} more bytes'.format(
+                self._name, len(key) + len(value),
+            )
+        )
+
+    def _header(self, **changes):
+        # updates the mutable header fields
+        fields = list(SHM_HEADER.unpack_from(self._buf))
+        for name, value in changes.items():
+            fields[('tail', 'count', 'dead', 'deleted').index(name) + 4] = value
+        SHM_HEADER.pack_into(self._buf, 0, *fields)
+
+    def _lock_path(self):
+        return join(gettempdir(), 'shove-shm-{0}.lock'.format(
+            quote_plus(self._name)
+        ))
+
+    def _locked(self, exclusive):
+        # excludes threads in this process, then other processes
+        if self._pid != os.getpid():
+            self._relock()
+        return self._guards[exclusive]
+
+    def _put(self, key, value):
+        # stores an entry, compacting and then making room when needed
+        if self._store_entry(key, value):
+            return
+        self._compact()
+        if self._store_entry(key, value):
+            return
+        self._full(key, value)
+        if not self._store_entry(key, value):
+            ShmBase._full(self, key, value)
+
+    def _relock(self):
+        # a forked child shares its parent's lock file, which would let
+        # them hold the same flock, so it opens its own
+        self._pid = os.getpid()
+        self._lock = Lock()
+        self._lockfile = open(self._lock_path(), 'a')
+        self._guards = (
+            _ShmGuard(self, fcntl.LOCK_SH), _ShmGuard(self, fcntl.LOCK_EX)
+        )
+
+    def _used_bytes(self):
+        # arena bytes of the live entries of every process
+        with self._locked(False):
+            header = SHM_HEADER.unpack_from(self._buf)
+        return header[4] - self._start - header[6]
+
+    def _remove(self, key):
+        slot = self._find(key, self._digest(key))[0]
+        if slot is None:
+            return False
+        position = SHM_HEADER.size + slot * SHM_SLOT.size
+        _, offset, size, length = SHM_SLOT.unpack_from(self._buf, position)
+        SHM_SLOT.pack_into(self._buf, position, 0, 1, 0, 0)
+        _, _, _, _, tail, count, dead, deleted = SHM_HEADER.unpack_from(
+            self._buf
+        )
+        self._header(
+            count=count - 1, dead=dead + size + length, deleted=deleted + 1
+        )
+        return True
+
+    def _reset(self):
+        buf = self._buf
+        table = SHM_HEADER.size
+        buf[table:self._start] = bytes(self._start - table)
+        self._header(tail=self._start, count=0, dead=0, deleted=0)
+
+    def _store_entry(self, key, value):
+        # appends an entry if the arena and table have room
+        buf = self._buf
+        _, _, _, _, tail, count, dead, deleted = SHM_HEADER.unpack_from(buf)
+        length = len(key) + len(value)
+        if tail + length > self._end:
+            return False
+        digest = self._digest(key)
+        slot, free = self._find(key, digest)
+        if slot is None:
+            if free is None or count + deleted + 1 > self._slots * SHM_LOAD:
+                return False
+            count += 1
+            if SHM_SLOT.unpack_from(
+                buf, SHM_HEADER.size + free * SHM_SLOT.size
+            )[1] == 1:
+                deleted -= 1
+        else:
+            dead += sum(SHM_SLOT.unpack_from(
+                buf, SHM_HEADER.size + slot * SHM_SLOT.size
+            )[2:])
+            free = slot
+        buf[tail:tail + len(key)] = key
+        buf[tail + len(key):tail + length] = value
+        SHM_SLOT.pack_into(
+            buf, SHM_HEADER.size + free * SHM_SLOT.size,
+            digest, tail, len(key), len(value),
+        )
+        self._header(
+            tail=tail + length, count=count, dead=dead, deleted=deleted
+        )
+        return True
+
+    def _value(self, slot):
+        _, offset, size, length = SHM_SLOT.unpack_from(
+            self._buf, SHM_HEADER.size + slot * SHM_SLOT.size
+        )
+        return bytes(self._buf[offset + size:offset + size + length])
@@ -2,20 +2,25 @@
 '''shove cache core.'''
 
 from collections import deque
-from copy import deepcopy
 from operator import delitem
-from random import seed, sample
-from threading import Thread, Condition
-from time import time, sleep
-
-from shove._compat import synchronized
-from shove.base import Mapping, FileBase, SQLiteBase, CloseStore
+from os.path import getsize
+from random import seed, sample, randrange
+from threading import Condition, Lock
+from time import time
+
+from shove._compat import synchronized, OrderedDict
+from shove._expiry import expiry
+from shove._policy import ARC, TwoQ, TinyLFU
+from shove.base import (
+    Mapping, FileBase, SQLiteBase, ShmBase, CloseStore, CopyStore, pairs,
+    sizeof)
 from stuf.iterable import xpartmap
 
 
 __all__ = (
     'FileCache FileLRUCache MemoryCache SimpleCache MemoryLRUCache '
-    'SimpleLRUCache SQLiteCache NullCache'
+    'SimpleLRUCache SQLiteCache ShmCache ARCCache TwoQCache TinyLFUCache '
+    'NullCache NegativeCache'
 ).split()
 
 
@@ -32,57 +37,329 @@ class NullCache(object):
     def __delitem__(self, key):
         pass
 
+    def get_many(self, keys):
+        return dict()
+
+    def set_many(self, items):
+        pass
+
+    def delete_many(self, keys):
+        pass
+
+
+class NegativeCache(object):
+
+    '''
+    Thread-safe cache of keys known to be missing from a store.
+
+    Keys are forgotten after `negative_timeout` seconds (default 60) and the
+    oldest keys are dropped past `negative_max_entries` (default 10000).
+    `hits` counts store lookups that were skipped, `misses` counts lookups
+    that still had to go to the store.
+    '''
+
+    def __init__(self, **kw):
+        self._timeout = kw.get('negative_timeout', 60)
+        self._max_entries = kw.get('negative_max_entries', 10000)
+        # every key shares one timeout so insertion order is expiry order
+        self._keys = OrderedDict()
+        # bumped whenever a key may have been written
+        self._version = 0
+        self._lock = Condition()
+        self.hits = self.misses = 0
+
+    @synchronized
+    def __contains__(self, key):
+        expires = self._keys.get(key)
+        if expires is not None:
+            if expires > time():
+                self.hits += 1
+                return True
+            del self._keys[key]
+        self.misses += 1
+        return False
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def version(self):
+        '''Token to take before a store lookup and pass to :meth:`add`.'''
+        return self._version
+
+    @synchronized
+    def add(self, key, version):
+        '''
+        Remembers that `key` is missing.
+
+        :argument key: key missing from the store
+        :argument version: :attr:`version` from before the store lookup
+        '''
+        # a write since the lookup started may have added the key
+        if version != self._version:
+            return
+        keys, now = self._keys, time()
+        keys.pop(key, None)
+        keys[key] = now + self._timeout
+        # drop expired and excess keys from the oldest end
+        while keys and (
+            len(keys) > self._max_entries or keys[next(iter(keys))] <= now
+        ):
+            keys.popitem(last=False)
+
+    @synchronized
+    def discard(self, key):
+        '''Forgets `key` because it may have been written.'''
+        self._version += 1
+        self._keys.pop(key, None)
+
+    @synchronized
+    def discard_many(self, keys):
+        '''Forgets every one of `keys`.'''
+        self._version += 1
+        pop = self._keys.pop
+        for key in keys:
+            pop(key, None)
+
+    @synchronized
+    def clear(self):
+        '''Forgets every key.'''
+        self._version += 1
+        self._keys.clear()
+
+    def stats(self):
+        '''Returns hit, miss and entry counts.'''
+        return dict(hits=self.hits, misses=self.misses, entries=len(self))
+
 
 class BaseCache(object):
 
+    '''
+    Base for caches.
+
+    Caches hold at most `max_entries` entries (default 300). With
+    `max_bytes` set they also keep the total size of their entries under
+    that many bytes, measured by :meth:`_sizeof`, and an entry larger than
+    the whole budget is not kept. Caches whose backend other processes
+    share measure the total from the backend, and evict entries whichever
+    process wrote them.
+    '''
+
+    # backend shared with other processes
+    shared = False
+
     def __init__(self, engine, **kw):
         super(BaseCache, self).__init__(engine, **kw)
         # get random seed
         seed()
         # set max entries
         self._max_entries = kw.get('max_entries', 300)
+        # set byte budget
+        max_bytes = kw.get('max_bytes')
+        self._max_bytes = None if max_bytes is None else int(max_bytes)
+        # entry sizes when there is a byte budget
+        self._sizes = {}
+        self._bytes = 0
+        # counters for stats()
+        self._hits = self._misses = self._evictions = self._expirations = 0
         # set timeout
         self._key_timeout = kw.get('timeout', 300)
-        self._purge_timeout = kw.get('purge_timeout', 0.2)
         self._key_ttl_map = {}
-        purge_daemon = Thread(target=self._purge_daemon_loop, args=[self._purge_timeout])
-        purge_daemon.setDaemon(True)
-        purge_daemon.start()
+        # keys with a deadline in the shared expiry heap
+        self._scheduled = set()
+        self._expiry_lock = Lock()
 
     def __getitem__(self, key):
-        self._reset_timeout(key)
-        return super(BaseCache, self).__getitem__(key)
+        now, ttl = time(), self._key_ttl_map
+        # an expired entry is a miss even before it is purged
+        deadline = ttl.get(key)
+        if deadline is not None and deadline <= now:
+            self._misses += 1
+            raise KeyError(key)
+        try:
+            value = super(BaseCache, self).__getitem__(key)
+        except KeyError:
+            self._misses += 1
+            raise
+        self._hits += 1
+        ttl[key] = now + self._key_timeout
+        if key not in self._scheduled:
+            self._schedule(key)
+        return value
 
     def __setitem__(self, key, value):
         self._reset_timeout(key)
         super(BaseCache, self).__setitem__(key, value)
-        # cull values if over max number of entries
-        if len(self) > self._max_entries:
+        if self._max_bytes is not None:
+            self._measure(key, value)
+        # cull values if over max number of entries or bytes
+        if len(self) > self._max_entries or self._over_budget():
             self._cull()
 
     def __delitem__(self, key):
         super(BaseCache, self).__delitem__(key)
-        del self._key_ttl_map[key]
+        # entries of an on-disk cache may be from an earlier session
+        self._key_ttl_map.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        now, get = time(), self._key_ttl_map.get
+        found = super(BaseCache, self).get_many([
+            key for key in keys if get(key, now + 1) > now
+        ])
+        self._hits += len(found)
+        self._misses += len(keys) - len(found)
+        for key in found:
+            self._reset_timeout(key)
+        return found
+
+    def set_many(self, items):
+        items = list(pairs(items))
+        for key, _ in items:
+            self._reset_timeout(key)
+        super(BaseCache, self).set_many(items)
+        if self._max_bytes is not None:
+            for key, value in items:
+                self._measure(key, value)
+        # cull values once for the whole batch
+        if len(self) > self._max_entries or self._over_budget():
+            self._cull()
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        super(BaseCache, self).delete_many(keys)
+        pop, size = self._key_ttl_map.pop, self._sizes.pop
+        for key in keys:
+            pop(key, None)
+            self._bytes -= size(key, 0)
+
+    def close(self):
+        '''Stops expiring entries and closes the backend.'''
+        expiry.cancel(self)
+        with self._expiry_lock:
+            self._key_ttl_map.clear()
+            self._scheduled.clear()
+        close = getattr(super(BaseCache, self), 'close', None)
+        if close is not None:
+            close()
+
+    def stats(self):
+        '''
+        Returns hit, miss, eviction and expiry counts, entry counts and
+        limits, the total bytes and the size of every entry (sizes are only
+        measured with `max_bytes`) and the backend's stats.
+        '''
+        stats = getattr(super(BaseCache, self), 'stats', None)
+        stats = stats() if stats is not None else dict()
+        stats.update(
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            expirations=self._expirations,
+            scheduled=len(self._scheduled),
+            entries=len(self),
+            max_entries=self._max_entries,
+            bytes=self._usage(),
+            max_bytes=self._max_bytes,
+            sizes=dict(self._sizes),
+        )
+        return stats
 
     def _cull(self):
         # cull remainder of allowed quota at random
-        xpartmap(
-            delitem, sample(list(self), len(self) - self._max_entries), self
-        )
+        if len(self) > self._max_entries:
+            excess = len(self) - self._max_entries
+            xpartmap(delitem, sample(list(self), excess), self)
+            self._evictions += excess
+        # then random entries until under the byte budget
+        if self._max_bytes is not None:
+            used = self._usage()
+            if used > self._max_bytes:
+                keys = list(self) if self.shared else list(self._sizes)
+                self._trim(keys, used)
+
+    def _entry_size(self, key):
+        # bytes of a cached entry (0 if it is gone)
+        size = self._sizes.get(key)
+        if size is None:
+            try:
+                size = self._sizeof(key, None)
+            except (IOError, OSError, KeyError):
+                size = 0
+        return size
+
+    def _measure(self, key, value):
+        # records the size of an entry that was just stored
+        size = self._sizeof(key, value)
+        if size > self._max_bytes:
+            # would push every other entry out
+            try:
+                del self[key]
+            except KeyError:
+                pass
+            return
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def _over_budget(self):
+        return self._max_bytes is not None and self._usage() > self._max_bytes
+
+    def _trim(self, keys, used):
+        # evicts random keys until the `used` bytes are under the budget
+        while keys and used > self._max_bytes:
+            index = randrange(len(keys))
+            keys[index], keys[-1] = keys[-1], keys[index]
+            key = keys.pop()
+            size = self._entry_size(key)
+            try:
+                del self[key]
+            except KeyError:
+                continue
+            used -= size
+            self._evictions += 1
+
+    def _usage(self):
+        # bytes the entries take
+        return self._bytes
+
+    def _sizeof(self, key, value):
+        # bytes an entry takes (estimated for objects in memory)
+        return sizeof(key) + sizeof(value)
+
+    def _expire(self, key):
+        # called by the expiry thread once the key's deadline passes
+        with self._expiry_lock:
+            self._scheduled.discard(key)
+            deadline = self._key_ttl_map.get(key)
+            if deadline is None:
+                # deleted since
+                return
+            if deadline > time():
+                # read since, so wait for the new deadline
+                self._scheduled.add(key)
+                expiry.schedule(self, key, deadline)
+                return
+        # a read racing this may lose its entry, which is only a miss
+        try:
+            del self[key]
+        except KeyError:
+            pass
+        else:
+            self._expirations += 1
 
     def _reset_timeout(self, key):
         self._key_ttl_map[key] = time() + self._key_timeout
+        if key not in self._scheduled:
+            self._schedule(key)
 
-    def _purge_daemon_loop(self, purge_timeout):
-        while True:
-            expired_keys = [key for key, expiry_time in self._key_ttl_map.items() if expiry_time < time()]
-            for key in expired_keys:
-                try:
-                    del self[key]
-                except KeyError:
-                    pass
-            if purge_timeout:
-                sleep(purge_timeout)
+    def _schedule(self, key):
+        # gives a key its one entry in the expiry heap
+        with self._expiry_lock:
+            deadline = self._key_ttl_map.get(key)
+            if deadline is not None and key not in self._scheduled:
+                self._scheduled.add(key)
+                expiry.schedule(self, key, deadline)
 
 
 class SimpleCache(BaseCache, Mapping):
@@ -100,7 +377,7 @@ class SimpleCache(BaseCache, Mapping):
         self._store = dict()
 
 
-class MemoryCache(SimpleCache):
+class MemoryCache(CopyStore, SimpleCache):
 
     '''
     Thread-safe in-memory cache.
@@ -108,18 +385,9 @@ class MemoryCache(SimpleCache):
     The shove URI for a memory cache is:
 
     memory://
-    '''
 
-    def __init__(self, engine, **kw):
-        super(MemoryCache, self).__init__(engine, **kw)
-        self._lock = Condition()
-
-    @synchronized
-    def __getitem__(self, key):
-        return deepcopy(super(MemoryCache, self).__getitem__(key))
-
-    __setitem__ = synchronized(SimpleCache.__setitem__)
-    __delitem__ = synchronized(SimpleCache.__delitem__)
+    See :class:`~shove.base.CopyStore` for the `copy` option.
+    '''
 
 
 class FileCache(BaseCache, FileBase):
@@ -137,6 +405,15 @@ class FileCache(BaseCache, FileBase):
     '''
 
     init = 'file://'
+    # the directory can be shared
+    shared = True
+
+    def _sizeof(self, key, value):
+        # bytes of the entry's file
+        return getsize(self._key_to_file(key))
+
+    def _usage(self):
+        return self._used_bytes()
 
 
 class SQLiteCache(BaseCache, SQLiteBase, CloseStore):
@@ -153,57 +430,169 @@ class SQLiteCache(BaseCache, SQLiteBase, CloseStore):
 
     init = 'lite://'
 
+    def _sizeof(self, key, value):
+        # bytes of the entry's stored key and value
+        with self._lock:
+            row = self._cursor.execute(
+                'SELECT length(key) + length(value) FROM shove WHERE key=?',
+                (self._dumpkey(key),),
+            ).fetchone()
+        return row[0] if row else 0
+
+
+class ShmCache(BaseCache, ShmBase):
+
+    '''
+    Shared memory cache for processes on one host.
+
+    shove's URI for shared memory caches follows the form:
+
+    shm://<name>
+
+    Where the name is the name of the shared memory segment. When the
+    segment runs out of room, a random half of the entries is dropped.
+    '''
+
+    init = 'shm://'
+    # the segment is shared by processes
+    shared = True
+
+    def _full(self, key, value):
+        # drop a random half of the other entries, then compact what is left
+        names = [
+            name for name, _ in self._entries(0, self._slots, False)
+            if name != key
+        ]
+        loads, ttl, sizes = self.loads, self._key_ttl_map, self._sizes
+        for name in sample(names, (len(names) + 1) // 2):
+            if self._remove(name):
+                # what __delitem__ forgets about a key
+                evicted = loads(name)
+                ttl.pop(evicted, None)
+                self._bytes -= sizes.pop(evicted, 0)
+                self._evictions += 1
+        self._compact()
+
+    def _sizeof(self, key, value):
+        # bytes of the entry in the segment
+        return self._entry_bytes(self.dumps(key))
+
+    def _usage(self):
+        return self._used_bytes()
+
 
 class BaseLRUCache(BaseCache):
 
+    '''
+    Base for caches that evict the least recently used entries first.
+
+    Recency is an ordered map of keys, so a hit, a write and an eviction
+    each take constant time.
+    '''
+
     def __init__(self, engine, **kw):
         super(BaseLRUCache, self).__init__(engine, **kw)
         self._max_entries = kw.get('max_entries', 300)
-        self._hits = 0
-        self._misses = 0
-        self._queue = deque()
-        self._refcount = dict()
+        # keys from least to most recently used
+        self._order = OrderedDict()
+        # a hit moves its key in one atomic step where OrderedDict is
+        # written in C
+        self._touch = getattr(self._order, 'move_to_end', None)
+        # otherwise hits wait here for the next write, so reads do not
+        # change the order (the oldest are dropped when it is full)
+        self._recent = deque(maxlen=self._max_entries * 4)
 
     def __getitem__(self, key):
-        try:
-            value = super(BaseLRUCache, self).__getitem__(key)
-            self._hits += 1
-        except KeyError:
-            self._misses += 1
-            raise
-        self._housekeep(key)
+        value = super(BaseLRUCache, self).__getitem__(key)
+        self._hit(key)
         return value
 
     def __setitem__(self, key, value):
         super(BaseLRUCache, self).__setitem__(key, value)
+        self._drain()
         self._housekeep(key)
-        if len(self) > self._max_entries:
-            queue = self._queue
-            store = self
-            max_entries = self._max_entries
-            refcount = self._refcount
-            ditem = super(BaseLRUCache, self).__delitem__
-            qpopleft = queue.popleft
-            while len(store) > max_entries:
-                k = qpopleft()
-                refcount[k] -= 1
-                if not refcount[k]:
-                    ditem(k)
-                    del refcount[k]
+        self._evict()
+
+    def __delitem__(self, key):
+        super(BaseLRUCache, self).__delitem__(key)
+        self._order.pop(key, None)
+
+    def get_many(self, keys):
+        found = super(BaseLRUCache, self).get_many(keys)
+        for key in found:
+            self._hit(key)
+        return found
+
+    def set_many(self, items):
+        items = list(pairs(items))
+        super(BaseLRUCache, self).set_many(items)
+        self._drain()
+        for key, _ in items:
+            self._housekeep(key)
+        self._evict()
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        super(BaseLRUCache, self).delete_many(keys)
+        pop = self._order.pop
+        for key in keys:
+            pop(key, None)
+
+    def _cull(self):
+        # entries are evicted in LRU order once the order is updated
+        pass
+
+    def _drain(self):
+        # applies buffered hits on keys still cached to the order
+        recent, order = self._recent, self._order
+        popleft, pop = recent.popleft, order.pop
+        while recent:
+            key = popleft()
+            if pop(key, recent) is not recent:
+                order[key] = None
+
+    def _evict(self):
+        # evict least recently used entries over max number of entries or
+        # bytes
+        order, store = self._order, self
+        max_entries, max_bytes = self._max_entries, self._max_bytes
+        # measured once and then counted down
+        used = self._usage() if max_bytes is not None else None
+        ditem = super(BaseLRUCache, self).__delitem__
+        # the newest entry fits on its own, so it stays
+        while len(order) > 1 and (
+            len(store) > max_entries or (used is not None and used > max_bytes)
+        ):
+            key = order.popitem(last=False)[0]
+            size = self._entry_size(key) if used is not None else 0
+            try:
+                ditem(key)
+            except KeyError:
+                # expired or too big to keep
+                pass
+            else:
+                self._evictions += 1
+                if used is not None:
+                    used -= size
+        if used is not None and used > max_bytes and self.shared:
+            # what other processes wrote has no recency here
+            self._trim([key for key in self if key not in order], used)
+
+    def _hit(self, key):
+        if self._touch is None:
+            self._recent.append(key)
+            return
+        try:
+            self._touch(key)
+        except KeyError:
+            # evicted since
+            pass
 
     def _housekeep(self, key):
-        self._queue.append(key)
-        self._refcount[key] = self._refcount.get(key, 0) + 1
-        if len(self._queue) > self._max_entries * 4:
-            queue = self._queue
-            qpopleft, qappend = queue.popleft, queue.append
-            refcount = self._refcount
-            for _ in [None] * len(queue):
-                k = qpopleft()
-                if refcount[k] == 1:
-                    qappend(k)
-                else:
-                    refcount[k] -= 1
+        # makes key the most recently used
+        order = self._order
+        order.pop(key, None)
+        order[key] = None
 
 
 class SimpleLRUCache(BaseLRUCache, Mapping):
@@ -221,8 +610,12 @@ class SimpleLRUCache(BaseLRUCache, Mapping):
         super(SimpleLRUCache, self).__init__(engine, **kw)
         self._store = dict()
 
+    def __contains__(self, key):
+        # a lookup that is not a hit
+        return key in self._store
 
-class MemoryLRUCache(SimpleLRUCache):
+
+class MemoryLRUCache(CopyStore, SimpleLRUCache):
 
     '''
     Thread-safe in-memory cache using LRU.
@@ -230,18 +623,9 @@ class MemoryLRUCache(SimpleLRUCache):
     The shove URI for a memory cache is:
 
     memlru://
-    '''
-
-    def __init__(self, engine, **kw):
-        super(MemoryLRUCache, self).__init__(engine, **kw)
-        self._lock = Condition()
 
-    @synchronized
-    def __getitem__(self, key):
-        return deepcopy(super(MemoryLRUCache, self).__getitem__(key))
-
-    __setitem__ = synchronized(SimpleLRUCache.__setitem__)
-    __delitem__ = synchronized(SimpleLRUCache.__delitem__)
+    See :class:`~shove.base.CopyStore` for the `copy` option.
+    '''
 
 
 class FileLRUCache(BaseLRUCache, FileBase):
@@ -258,4 +642,161 @@ class FileLRUCache(BaseLRUCache, FileBase):
     'engine' argument.
     '''
 
-    init = 'filelru://'
\ No newline at end of file
+    init = 'filelru://'
+    # the directory can be shared
+    shared = True
+
+    def __init__(self, engine, **kw):
+        super(FileLRUCache, self).__init__(engine, **kw)
+        # entries from an earlier session are the least recently used
+        self._order.update((key, None) for key in self)
+
+    def _sizeof(self, key, value):
+        # bytes of the entry's file
+        return getsize(self._key_to_file(key))
+
+    def _usage(self):
+        return self._used_bytes()
+
+
+class BasePolicyCache(BaseCache):
+
+    '''
+    Base for thread-safe in-memory caches that leave what to keep and what
+    to evict to a policy from :mod:`shove._policy`.
+
+    The policy is told about every hit, miss, new key and delete. It names
+    the keys to evict when a new key needs room, and one key at a time when
+    entries are over `max_bytes`. Values are not copied.
+    '''
+
+    # policy class, made with max_entries
+    policy = None
+
+    def __init__(self, engine, **kw):
+        super(BasePolicyCache, self).__init__(engine, **kw)
+        self._store = dict()
+        self._policy = self.policy(self._max_entries)
+        self._lock = Condition()
+
+    @synchronized
+    def __getitem__(self, key):
+        try:
+            value = super(BasePolicyCache, self).__getitem__(key)
+        except KeyError:
+            self._policy.miss(key)
+            raise
+        self._policy.access(key)
+        return value
+
+    @synchronized
+    def __setitem__(self, key, value):
+        if key in self._store:
+            self._policy.access(key)
+        else:
+            evicted = self._policy.admit(key)
+            remove = super(BasePolicyCache, self).__delitem__
+            for old in evicted:
+                if old != key:
+                    try:
+                        remove(old)
+                    except KeyError:
+                        pass
+                    else:
+                        self._evictions += 1
+            if key in evicted:
+                # turned away by the policy
+                return
+        super(BasePolicyCache, self).__setitem__(key, value)
+
+    @synchronized
+    def __delitem__(self, key):
+        super(BasePolicyCache, self).__delitem__(key)
+        self._policy.discard(key)
+
+    def __contains__(self, key):
+        # a lookup that is not a hit
+        return key in self._store
+
+    @synchronized
+    def get_many(self, keys):
+        keys = list(keys)
+        found = super(BasePolicyCache, self).get_many(keys)
+        policy = self._policy
+        for key in keys:
+            if key in found:
+                policy.access(key)
+            else:
+                policy.miss(key)
+        return found
+
+    @synchronized
+    def set_many(self, items):
+        for key, value in pairs(items):
+            self[key] = value
+
+    @synchronized
+    def delete_many(self, keys):
+        keys = list(keys)
+        super(BasePolicyCache, self).delete_many(keys)
+        discard = self._policy.discard
+        for key in keys:
+            discard(key)
+
+    def _cull(self):
+        # the policy picks what goes
+        victim, remove = self._policy.victim, (
+            super(BasePolicyCache, self).__delitem__
+        )
+        while len(self) > self._max_entries or self._over_budget():
+            key = victim()
+            if key is None:
+                break
+            try:
+                remove(key)
+            except KeyError:
+                pass
+            else:
+                self._evictions += 1
+
+
+class ARCCache(BasePolicyCache, Mapping):
+
+    '''
+    Thread-safe in-memory cache using adaptive replacement (ARC), which
+    keeps keys seen more than once safe from scans.
+
+    The shove URI for an ARC cache is:
+
+    arc://
+    '''
+
+    policy = ARC
+
+
+class TwoQCache(BasePolicyCache, Mapping):
+
+    '''
+    Thread-safe in-memory cache using 2Q, which only keeps keys for long
+    once they are seen again soon after being evicted.
+
+    The shove URI for a 2Q cache is:
+
+    2q://
+    '''
+
+    policy = TwoQ
+
+
+class TinyLFUCache(BasePolicyCache, Mapping):
+
+    '''
+    Thread-safe in-memory cache using window TinyLFU, which only admits a
+    new key in place of another when it is looked up more often.
+
+    The shove URI for a TinyLFU cache is:
+
+    tinylfu://
+    '''
+
+    policy = TinyLFU
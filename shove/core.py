@@ -2,86 +2,555 @@
 '''shove core.'''
 from __future__ import print_function
 
-from operator import methodcaller
-from collections import MutableMapping
+from heapq import merge
+from itertools import islice
+from sys import getsizeof
+from timeit import default_timer
+from collections import MutableMapping, ItemsView, ValuesView
 
-from stuf.iterable import xpartmap
 from concurrent.futures import ThreadPoolExecutor
+from stuf.six import PY3
 
+from shove.base import pairs, scan_bounds
+from shove.cache import NegativeCache
+from shove._locks import SingleFlight
+from shove._stats import Stats, Exporter
+from shove._writer import WriteBehind, MISSING, DELETED
 from shove._imports import cache_backend, store_backend
 
 __all__ = 'Shove MultiShove'.split()
 
 
-class Shove(MutableMapping):
+class _ItemsView(ItemsView):
 
-    '''Common object frontend class.'''
+    def __iter__(self):
+        return self._mapping.iteritems()
 
-    def __init__(self, store='simple://', cache='simple://', **kw):
-        super(Shove, self).__init__()
-        # load store backend
-        self._store = store_backend(store, **kw)
-        # load cache backend
-        self._cache = cache_backend(cache, **kw)
+
+class _ValuesView(ValuesView):
+
+    def __iter__(self):
+        return self._mapping.itervalues()
+
+
+def _stats_of(backend):
+    # stats of a store or cache, empty for backends without them
+    stats = getattr(backend, 'stats', None)
+    return stats() if stats is not None else dict()
+
+
+class BaseShove(MutableMapping):
+
+    '''Base for shove frontends that buffer writes.'''
+
+    def __init__(self, **kw):
+        super(BaseShove, self).__init__()
+        # counters and latency histograms (off with stats=False)
+        self._stats = self._gets = self._sets = None
+        if kw.get('stats', True):
+            self._stats = Stats()
+            # bound once for the hottest operations
+            self._gets = self._stats.histogram('get')
+            self._sets = self._stats.histogram('set')
         # buffer for lazier writing
         self._buffer = dict()
         # setting for syncing frequency
         self._sync = kw.get('sync', 2)
+        # background worker that writes the buffer to the store
+        self._writer = None
+        if kw.get('write_behind', False):
+            self._writer = WriteBehind(self._buffer, self._flush_batch, **kw)
+        # keys known to be missing from the store
+        self._negative = None
+        if kw.get('negative_cache', False):
+            self._negative = NegativeCache(**kw)
+        # one thread loads a missing key while the others wait for it
+        self._flights = None
+        if kw.get('coalesce', True):
+            self._flights = SingleFlight()
+        # hands stats() to a callable every export_interval seconds (and
+        # on close)
+        self._exporter = None
+        if kw.get('exporter') is not None:
+            self._exporter = Exporter(
+                kw['exporter'], self.stats, kw.get('export_interval', 0)
+            )
 
     def __getitem__(self, key):
+        gets = self._gets
+        if gets is None:
+            return self._get(key)
+        start = default_timer()
+        try:
+            return self._get(key)
+        finally:
+            gets.record(default_timer() - start)
+
+    def __setitem__(self, key, value):
+        sets = self._sets
+        if sets is None:
+            return self._set(key, value)
+        start = default_timer()
+        try:
+            self._set(key, value)
+        finally:
+            sets.record(default_timer() - start)
+
+    def __delitem__(self, key):
+        self._timed('delete', self._delete, key)
+
+    def __iter__(self):
+        return self._timed_iter('iter', self._iter())
+
+    def __contains__(self, key):
+        negative = self._negative
+        if negative is not None:
+            version = negative.version
+        # pending writes answer before the store
+        value = self._pending(key)
+        if value is not MISSING:
+            return value is not DELETED
+        if negative is None:
+            return self._stored(key)
+        if key in negative:
+            return False
+        if self._stored(key):
+            return True
+        negative.add(key, version)
+        return False
+
+    def get_many(self, keys):
+        '''
+        Returns a :class:`dict` of the `keys` that are found.
+
+        :argument keys: iterable of keys
+        '''
+        return self._timed('get_many', self._get_many, keys)
+
+    def set_many(self, items):
+        '''
+        Stores every key and value pair in `items`.
+
+        :argument items: mapping or iterable of key and value pairs
+        '''
+        self._timed('set_many', self._set_many, items)
+
+    def delete_many(self, keys):
+        '''
+        Removes every one of `keys` that is found.
+
+        :argument keys: iterable of keys
+        '''
+        self._timed('delete_many', self._delete_many, keys)
+
+    def iteritems(self):
+        '''Iterates over every key and value pair in one pass.'''
+        return self._timed_iter('iteritems', self._iteritems())
+
+    def itervalues(self):
+        '''Iterates over every value in one pass.'''
+        for _, value in self.iteritems():
+            yield value
+
+    def stats(self):
+        '''
+        Returns shove's counters and per-operation latency histograms (in
+        seconds), the depth of its write buffer and the stats of its cache
+        and stores.
+        '''
+        stats = self._stats
+        snapshot = stats.snapshot() if stats is not None else dict(
+            counters=dict(), latency=dict()
+        )
+        if self._writer is not None:
+            snapshot['buffer'] = len(self._writer)
+        else:
+            snapshot['buffer'] = len(self._buffer)
+        snapshot['cache'] = _stats_of(self._cache)
+        if self._negative is not None:
+            snapshot['negative'] = self._negative.stats()
+        snapshot.update(self._backend_stats())
+        return snapshot
+
+    def export_stats(self):
+        '''Hands :meth:`stats` to the `exporter` now.'''
+        if self._exporter is not None:
+            self._exporter.export()
+
+    def _get(self, key):
         try:
             return self._cache[key]
         except KeyError:
-            # synchronize cache with store
+            if self._flights is None:
+                return self._fill(key)
+            return self._flights.do(key, self._fill, key)
+
+    def _set(self, key, value):
+        self._cache[key] = value
+        self._put(key, value)
+
+    def _delete(self, key):
+        if key not in self:
+            raise KeyError(key)
+        try:
+            del self._cache[key]
+        except KeyError:
+            pass
+        # buffer a tombstone until the delete is written to the store
+        self._put(key, DELETED)
+
+    def _get_many(self, keys):
+        keys = list(keys)
+        found = self._cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = self._load_many(missing)
+            if stored:
+                # synchronize cache with store
+                self._cache.set_many(stored)
+                found.update(stored)
+        return found
+
+    def _set_many(self, items):
+        items = dict(pairs(items))
+        self._cache.set_many(items)
+        self._put_many(items.items())
+
+    def _delete_many(self, keys):
+        keys = list(keys)
+        self._cache.delete_many(keys)
+        self._put_many([(key, DELETED) for key in keys])
+
+    if PY3:
+        def items(self):
+            return _ItemsView(self)
+
+        def values(self):
+            return _ValuesView(self)
+    else:
+        def items(self):
+            return list(self.iteritems())
+
+        def values(self):
+            return list(self.itervalues())
+
+    def scan(self, prefix=None, start=None, stop=None, limit=None):
+        '''
+        Iterates over the key and value pairs in a key range in key order.
+
+        Backends that keep keys in order answer from an index, the others
+        sort every key.
+
+        :keyword prefix: only keys starting with this string
+        :keyword start: only keys that are at least this
+        :keyword stop: only keys that are less than this
+        :keyword int limit: most pairs to return
+        '''
+        low, high = scan_bounds(prefix, start, stop)
+        pending = dict(
+            (key, entry) for key, entry in self._pending_items().items()
+            if (low is None or key >= low) and (high is None or key < high)
+        )
+        # pending writes can shadow as many stored keys as there are of them
+        stored = self._scan(
+            low, high, None if limit is None else limit + len(pending)
+        )
+        items = merge(
+            ((key, value) for key, value in stored if key not in pending),
+            sorted(
+                (key, self._unpack(entry))
+                for key, entry in pending.items() if entry is not DELETED
+            ),
+        )
+        return islice(items, limit)
+
+    def update(self, *args, **kw):
+        if args:
+            self.set_many(*args)
+        if kw:
+            self.set_many(kw)
+
+    def flush(self, wait=True):
+        '''
+        Writes buffer to store.
+
+        :keyword bool wait: with `write_behind`, block until the buffer is
+            written instead of only waking the background writer
+        '''
+        if self._writer is not None:
+            self._writer.flush(wait)
+        else:
             self.sync()
-            self._cache[key] = value = self._store[key]
+
+    def sync(self):
+        '''Writes buffer to store.'''
+        self._timed('sync', self._flush)
+
+    def _backend_stats(self):
+        # stats of the stores by name
+        raise NotImplementedError
+
+    def _fill(self, key):
+        # synchronize cache with store
+        self._cache[key] = value = self._timed('load', self._load, key)
+        return value
+
+    def _flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+        else:
+            self._flush_batch(self._buffer)
+            self._buffer.clear()
+
+    def _flush_batch(self, batch):
+        # writes a batch of buffered writes and deletes, counted and timed
+        if self._stats is not None:
+            self._stats.incr('flushes')
+            self._stats.incr('flushed', len(batch))
+        self._timed('write', self._write, batch)
+
+    def _iter(self):
+        # every key
+        raise NotImplementedError
+
+    def _iteritems(self):
+        # every key and value pair
+        raise NotImplementedError
+
+    def _load(self, key):
+        # loads a key that is not cached from the buffer or the store
+        negative = self._negative
+        if negative is not None:
+            # taken before the buffer is checked so racing writes show up
+            version = negative.version
+        # pending writes answer before the store
+        value = self._pending(key)
+        if value is DELETED:
+            raise KeyError(key)
+        if value is not MISSING:
             return value
+        if negative is None:
+            return self._fetch(key)
+        if key in negative:
+            raise KeyError(key)
+        try:
+            return self._fetch(key)
+        except KeyError:
+            negative.add(key, version)
+            raise
+
+    def _load_many(self, keys):
+        # loads keys that are not cached from the buffer or the store
+        negative = self._negative
+        if negative is not None:
+            version = negative.version
+        found = dict()
+        missing = []
+        for key in keys:
+            # pending writes answer before the store
+            value = self._pending(key)
+            if value is MISSING:
+                if negative is None or key not in negative:
+                    missing.append(key)
+            elif value is not DELETED:
+                found[key] = value
+        if missing:
+            stored = self._fetch_many(missing)
+            found.update(stored)
+            if negative is not None:
+                for key in missing:
+                    if key not in stored:
+                        negative.add(key, version)
+        return found
+
+    def _pending(self, key):
+        # buffered value of a key, DELETED or MISSING
+        if self._writer is not None:
+            entry = self._writer.get(key)
+        else:
+            entry = self._buffer.get(key, MISSING)
+        if entry is MISSING or entry is DELETED:
+            return entry
+        return self._unpack(entry)
+
+    def _pending_items(self):
+        # snapshot of buffered writes and deletes
+        if self._writer is not None:
+            return self._writer.items()
+        return dict(self._buffer)
+
+    def _put(self, key, value):
+        # buffers a write or a DELETED tombstone
+        if self._writer is not None:
+            self._writer.put(key, value)
+        else:
+            self._buffer[key] = value
+        # after buffering so a racing miss cannot be remembered
+        if self._negative is not None:
+            self._negative.discard(key)
+        # when buffer reaches self._limit, write buffer to store
+        if self._writer is None and len(self._buffer) >= self._sync:
+            self.sync()
 
-    def __setitem__(self, key, value):
-        self._cache[key] = self._buffer[key] = value
+    def _put_many(self, items):
+        if self._writer is not None:
+            self._writer.put_many(items)
+        else:
+            self._buffer.update(items)
+        if self._negative is not None:
+            self._negative.discard_many(key for key, _ in items)
         # when buffer reaches self._limit, write buffer to store
-        if len(self._buffer) >= self._sync:
+        if self._writer is None and len(self._buffer) >= self._sync:
             self.sync()
 
-    def __delitem__(self, key):
-        self.sync()
+    def _unpack(self, entry):
+        # value of a buffered entry
+        return entry
+
+    def _fetch(self, key):
+        # reads a key from the store
+        raise NotImplementedError
+
+    def _fetch_many(self, keys):
+        # reads keys from the store
+        raise NotImplementedError
+
+    def _stored(self, key):
+        # checks the store for a key
+        raise NotImplementedError
+
+    def _timed(self, operation, call, *args):
+        # calls call(*args), timing it as operation
+        stats = self._stats
+        if stats is None:
+            return call(*args)
+        start = default_timer()
         try:
-            del self._cache[key]
-        except KeyError:
-            pass
-        del self._store[key]
+            return call(*args)
+        finally:
+            stats.record(operation, default_timer() - start)
 
-    def __len__(self):
-        self.sync()
-        return len(self._store)
+    def _timed_iter(self, operation, iterable):
+        # times a whole pass over an iterable as operation
+        if self._stats is None:
+            return iterable
+        return self._timing_iter(operation, iterable)
 
-    def __contains__(self, key):
-        self.sync()
-        return key in self._store
+    def _timing_iter(self, operation, iterable):
+        start = default_timer()
+        for item in iterable:
+            yield item
+        self._stats.record(operation, default_timer() - start)
 
-    def __iter__(self):
-        self.sync()
-        return self._store.__iter__()
+    def _scan(self, low, high, limit):
+        # key and value pairs in a key range from the store, in key order
+        raise NotImplementedError
+
+    def _write(self, batch):
+        # writes a batch of buffered writes and deletes
+        raise NotImplementedError
+
+
+class Shove(BaseShove):
+
+    '''Common object frontend class.'''
+
+    def __init__(self, store='simple://', cache='simple://', **kw):
+        super(Shove, self).__init__(**kw)
+        # load store backend
+        self._store = store_backend(store, **kw)
+        # load cache backend
+        self._cache = cache_backend(cache, **kw)
+
+    def __len__(self):
+        length = len(self._store)
+        for key, value in self._pending_items().items():
+            stored = key in self._store
+            if value is DELETED:
+                length -= stored
+            else:
+                length += not stored
+        return length
+
+    def _iter(self):
+        pending = self._pending_items()
+        for key, value in pending.items():
+            if value is not DELETED:
+                yield key
+        for key in self._store:
+            if key not in pending:
+                yield key
+
+    def _iteritems(self):
+        pending = self._pending_items()
+        for key, value in pending.items():
+            if value is not DELETED:
+                yield key, value
+        for key, value in self._store.iteritems():
+            if key not in pending:
+                yield key, value
 
     def close(self):
         '''Finalizes and closes shove.'''
         # if close has been called, pass
-        if self._store is not None:
-            try:
-                self.sync()
-            except AttributeError:
-                pass
+        if self._store is None:
+            return
+        try:
+            if self._writer is not None:
+                # drain the buffer before the store goes away
+                self._writer.close()
+            else:
+                try:
+                    self.sync()
+                except AttributeError:
+                    pass
+        finally:
+            # closed even when the last write fails, which is raised
+            if self._exporter is not None:
+                # a last export while the store is open
+                self._exporter.close()
             self._store.close()
-        self._store = self._cache = self._buffer = None
-
-    def sync(self):
-        '''Writes buffer to store.'''
-        self._store.update(self._buffer)
-        self._buffer.clear()
+            # stops expiring its entries
+            close = getattr(self._cache, 'close', None)
+            if close is not None:
+                close()
+            self._store = self._cache = self._buffer = self._writer = None
 
     def clear(self):
-        self._store.clear()
-        self._buffer.clear()
+        if self._negative is not None:
+            self._negative.clear()
+        if self._writer is not None:
+            # under the buffer lock, so no write lands between the two
+            self._writer.clear(self._store.clear)
+        else:
+            self._store.clear()
+            self._buffer.clear()
+
+    def _backend_stats(self):
+        return dict(store=_stats_of(self._store))
+
+    def _fetch(self, key):
+        return self._store[key]
+
+    def _fetch_many(self, keys):
+        return self._store.get_many(keys)
+
+    def _stored(self, key):
+        return key in self._store
+
+    def _scan(self, low, high, limit):
+        return self._store.scan(start=low, stop=high, limit=limit)
+
+    def _write(self, batch):
+        # writes a batch of buffered writes and deletes to the store
+        deleted = [key for key, value in batch.items() if value is DELETED]
+        if len(deleted) < len(batch):
+            self._store.set_many(
+                (key, value) for key, value in batch.items()
+                if value is not DELETED
+            )
+        if deleted:
+            self._store.delete_many(deleted)
 
 
 def copy_dispatcher(stores):
@@ -93,7 +562,7 @@ def copy_dispatcher(stores):
     return inner_dispatcher
 
 
-class MultiShove(MutableMapping):
+class MultiShove(BaseShove):
     """
     Common frontend to multiple object stores.
 
@@ -108,93 +577,166 @@ class MultiShove(MutableMapping):
     """
 
     def __init__(self, *stores, **kw):
-        # init superclass with first store
-        super(MultiShove, self).__init__()
+        # buffered writes are (value, store indices) pairs
+        sizer = kw.get('sizer', getsizeof)
+        super(MultiShove, self).__init__(
+            **dict(kw, sizer=lambda entry: sizer(entry[0]))
+        )
         if not stores:
             stores = ('simple://',)
         # load stores
         self._stores = list(store_backend(i, **kw) for i in stores)
         # load cache
         self._cache = cache_backend(kw.get('cache', 'simple://'), **kw)
-        # buffer for lazy writing
-        self._buffer = dict()
-        # setting for syncing frequency
-        self._sync = kw.get('sync', 2)
         # dispatcher
         self._dispatcher = kw.get('dispatcher', copy_dispatcher)(self._stores)
 
-    def __getitem__(self, key):
+    def _set(self, key, value):
+        self._cache[key] = value
+        self._put(key, (value, self._dispatch(key, value)))
+
+    def _iter(self):
+        pending = self._pending_items()
+        for index, store in enumerate(self._stores):
+            for key, entry in pending.items():
+                if (
+                    entry is not DELETED and index in entry[1] and
+                    key not in store
+                ):
+                    yield key
+            for key in store:
+                if pending.get(key) is not DELETED:
+                    yield key
+
+    def _iteritems(self):
+        pending = self._pending_items()
+        for index, store in enumerate(self._stores):
+            for key, entry in pending.items():
+                if (
+                    entry is not DELETED and index in entry[1] and
+                    key not in store
+                ):
+                    yield key, entry[0]
+            for key, value in store.iteritems():
+                entry = pending.get(key, MISSING)
+                if entry is MISSING:
+                    yield key, value
+                elif entry is not DELETED:
+                    yield key, entry[0]
+
+    def __len__(self):
+        stores = self._stores
+        length = sum(map(len, stores))
+        for key, entry in self._pending_items().items():
+            if entry is DELETED:
+                length -= sum(key in store for store in stores)
+            else:
+                length += sum(key not in stores[i] for i in entry[1])
+        return length
+
+    def _set_many(self, items):
+        items = dict(pairs(items))
+        self._cache.set_many(items)
+        self._put_many([
+            (key, (value, self._dispatch(key, value)))
+            for key, value in items.items()
+        ])
+
+    def close(self):
+        '''Finalizes and closes shove stores.'''
         try:
-            return self._cache[key]
-        except KeyError:
-            # flush items in buffer to stores
-            self.sync()
+            if self._writer is not None:
+                # drain the buffer before the stores go away
+                self._writer.close()
+            else:
+                self.sync()
+        finally:
+            # closed even when the last write fails, which is raised
+            if self._exporter is not None:
+                # a last export while the stores are open
+                self._exporter.close()
+            # close stores
             for store in self._stores:
-                try:
-                    # synchronize cache and store
-                    self._cache[key] = value = store[key]
-                    return value
-                except KeyError:
-                    continue
-            raise KeyError(key)
+                if hasattr(store, 'close'):
+                    store.close()
+            if hasattr(self._cache, 'close'):
+                self._cache.close()
+            self._cache = self._buffer = self._stores = self._writer = None
 
-    def __setitem__(self, key, value):
-        self._cache[key] = self._buffer[key] = value
-        # when the buffer reaches self._limit, writes the buffer to the store
-        if len(self._buffer) >= self._sync:
-            self.sync()
+    def _backend_stats(self):
+        return dict(stores=[_stats_of(store) for store in self._stores])
 
-    def __delitem__(self, key):
-        # flush items in buffer to stores
-        self.sync()
-        try:
-            del self._cache[key]
-        except KeyError:
-            pass
-        deleted = False
+    def _fetch(self, key):
         for store in self._stores:
             try:
-                del store[key]
+                return store[key]
             except KeyError:
                 continue
-            deleted = True
-        if not deleted:
-            raise KeyError(key)
+        raise KeyError(key)
 
-    def __contains__(self, key):
-        self.sync()
+    def _fetch_many(self, keys):
+        found = dict()
+        for store in self._stores:
+            if not keys:
+                break
+            found.update(store.get_many(keys))
+            keys = [key for key in keys if key not in found]
+        return found
+
+    def _stored(self, key):
         for store in self._stores:
             if key in store:
                 return True
         return False
 
-    def __iter__(self):
-        self.sync()
-        for store in self._stores:
-            for key in store:
-                yield key
-
-    def __len__(self):
-        self.sync()
-        return sum(map(len, self._stores))
-
-    def close(self):
-        '''Finalizes and closes shove stores.'''
-        self.sync()
-        # close stores
-        for store in self._stores:
-            if hasattr(store, 'close'):
-                store.close()
-        self._cache = self._buffer = self._stores = None
-
-    def sync(self):
-        """
-        Writes buffer to stores.
-        """
-        for key, value in self._buffer.items():
-            for store in self._dispatcher(key, value):
-                self._stores[store][key] = value
-        self._buffer.clear()
+    def _scan(self, low, high, limit):
+        # the same key can be in several stores
+        scans = [
+            ((key, index, value) for key, value in store.scan(
+                start=low, stop=high, limit=limit,
+            ))
+            for index, store in enumerate(self._stores)
+        ]
+        last = MISSING
+        for key, _, value in merge(*scans):
+            if key != last:
+                last = key
+                yield key, value
+
+    def _unpack(self, entry):
+        # buffered entries are (value, store indices) pairs
+        return entry[0]
+
+    def _dispatch(self, key, value):
+        # indices of the stores a key and value pair is written to
+        indices = self._dispatcher(key, value)
+        if isinstance(indices, int):
+            return (indices,)
+        return indices
+
+    def _batches(self, batch):
+        # splits buffered writes and deletes into one batch per store
+        batches = [(dict(), []) for _ in self._stores]
+        for key, entry in batch.items():
+            if entry is DELETED:
+                for _, deleted in batches:
+                    deleted.append(key)
+            else:
+                value, indices = entry
+                for index in indices:
+                    batches[index][0][key] = value
+        return batches
+
+    def _write(self, batch):
+        for store, (items, deleted) in zip(self._stores, self._batches(batch)):
+            self._write_store(store, items, deleted)
+
+    @staticmethod
+    def _write_store(store, items, deleted):
+        if items:
+            store.set_many(items)
+        if deleted:
+            store.delete_many(deleted)
 
 
 # another example of dispatcher for MultiShove
@@ -220,28 +762,13 @@ class ThreadShove(MultiShove):
         super(ThreadShove, self).__init__(*stores, **kw)
         self._maxworkers = kw.get('max_workers', 2)
 
-    def __delitem__(self, key):
-        try:
-            self.sync()
-        except AttributeError:
-            pass
+    def _write(self, batch):
         with ThreadPoolExecutor(max_workers=self._maxworkers) as executor:
-            xpartmap(
-                executor.submit,
-                self._stores,
-                methodcaller('__delitem__', key),
-            )
-        try:
-            del self._cache[key]
-        except KeyError:
-            pass
-
-    def sync(self):
-        '''Writes buffer to store.'''
-        with ThreadPoolExecutor(max_workers=self._maxworkers) as executor:
-            xpartmap(
-                executor.submit,
-                self._stores,
-                methodcaller('update', self._buffer),
-            )
-        self._buffer.clear()
+            futures = [
+                executor.submit(self._write_store, store, items, deleted)
+                for store, (items, deleted) in zip(
+                    self._stores, self._batches(batch)
+                )
+            ]
+        for future in futures:
+            future.result()
@@ -2,15 +2,19 @@
 '''shove store support.'''
 
 from collections import MutableMapping
-from copy import deepcopy
 import shutil
-from threading import Condition
+from threading import Condition, Thread
 
-from shove._compat import anydbm, synchronized
-from shove.base import Mapping, FileBase, SQLiteBase, PathBase, CloseStore
+from shove._compat import anydbm, parse_qsl, synchronized
+from shove.base import (
+    Base, Mapping, FileBase, SQLiteBase, LogBase, PathBase, CloseStore,
+    CopyStore, ShmBase, SQLITE_FETCH, chunks, pairs)
 
 
-__all__ = 'DBMStore FileStore MemoryStore SimpleStore SQLiteStore'.split()
+__all__ = (
+    'DBMStore FileStore LogStore MemoryStore ShmStore SimpleStore '
+    'SQLiteStore'
+).split()
 
 
 class BaseStore(Mapping, MutableMapping, CloseStore):
@@ -33,7 +37,7 @@ class SimpleStore(BaseStore):
         self._store = dict()
 
 
-class MemoryStore(SimpleStore):
+class MemoryStore(CopyStore, SimpleStore):
 
     '''
     Thread-safe in-memory store.
@@ -41,18 +45,9 @@ class MemoryStore(SimpleStore):
     The shove URI for a memory store is:
 
     memory://
-    '''
-
-    def __init__(self, engine, **kw):
-        super(MemoryStore, self).__init__(engine, **kw)
-        self._lock = Condition()
-
-    @synchronized
-    def __getitem__(self, key):
-        return deepcopy(super(MemoryStore, self).__getitem__(key))
 
-    __setitem__ = synchronized(SimpleStore.__setitem__)
-    __delitem__ = synchronized(SimpleStore.__delitem__)
+    See :class:`~shove.base.CopyStore` for the `copy` option.
+    '''
 
 
 class ClientStore(PathBase, BaseStore):
@@ -68,6 +63,33 @@ class ClientStore(PathBase, BaseStore):
     def __delitem__(self, key):
         super(ClientStore, self).__delitem__(self.dumps(key))
 
+    def get_many(self, keys):
+        found = dict()
+        store, dumps, loads = self._store, self.dumps, self.loads
+        for key in keys:
+            try:
+                found[key] = loads(store[dumps(key)])
+            except KeyError:
+                pass
+        return found
+
+    def iteritems(self):
+        # keys and values are encoded, so skip the raw mapping
+        return Base.iteritems(self)
+
+    def set_many(self, items):
+        store, dumps = self._store, self.dumps
+        for key, value in pairs(items):
+            store[dumps(key)] = dumps(value)
+
+    def delete_many(self, keys):
+        store, dumps = self._store, self.dumps
+        for key in keys:
+            try:
+                del store[dumps(key)]
+            except KeyError:
+                pass
+
 
 class SyncStore(ClientStore):
 
@@ -75,13 +97,23 @@ class SyncStore(ClientStore):
 
     def __setitem__(self, key, value):
         super(SyncStore, self).__setitem__(key, value)
-        try:
-            self.sync()
-        except AttributeError:
-            pass
+        self._wrote(1)
 
     def __delitem__(self, key):
         super(SyncStore, self).__delitem__(key)
+        self._wrote(1)
+
+    def set_many(self, items):
+        # one pass over the batch, then one sync
+        super(SyncStore, self).set_many(items)
+        self._wrote(1)
+
+    def delete_many(self, keys):
+        super(SyncStore, self).delete_many(keys)
+        self._wrote(1)
+
+    def _wrote(self, count):
+        # syncs after every write
         try:
             self.sync()
         except AttributeError:
@@ -99,20 +131,178 @@ class DBMStore(SyncStore):
 
     Where <path> is a URL path to a DBM database. Alternatively, the native
     pathname to a DBM database can be passed as the 'engine' parameter.
+
+    Changes are synced to disk every `sync_every` writes (default 1, a
+    batch counts as one write), every `sync_interval` seconds by a
+    background thread when that is set, and on :meth:`sync` and
+    :meth:`close`. Both can be passed as keywords or in the URI query
+    string (``dbm://test.dbm?sync_every=1000``). Databases that can be
+    opened in fast mode (gdbm) are, since syncing is left to the policy.
+
+    Iteration walks the database's key chain a chunk at a time where the
+    database has one (gdbm), so it runs in constant memory. The length is
+    counted once and then kept up to date by this store's writes.
     '''
 
     init = 'dbm://'
+    # dbm handles are not thread-safe
+    concurrency = 1
 
     def __init__(self, engine, **kw):
+        engine, _, query = engine.partition('?')
         super(DBMStore, self).__init__(engine, **kw)
-        self._store = anydbm.open(self._engine, 'c')
+        # options in the URI query win over keywords
+        query = dict(parse_qsl(query))
+        self._sync_every = max(
+            int(query.get('sync_every', kw.get('sync_every', 1))), 1
+        )
+        interval = query.get('sync_interval', kw.get('sync_interval'))
+        # writes since the last sync and the length once counted
+        self._dirty = 0
+        self._length = None
+        self._closed = False
         try:
-            self.sync = self._store.sync
-        except AttributeError:
-            pass
+            # fast mode leaves syncing to us
+            self._store = anydbm.open(self._engine, 'cf')
+        except (ValueError,) + tuple(anydbm.error):
+            self._store = anydbm.open(self._engine, 'c')
+        self._lock = Condition()
+        self._syncer = None
+        if interval is not None and float(interval) > 0:
+            self._syncer = Thread(
+                target=self._sync_loop, args=[float(interval)]
+            )
+            self._syncer.setDaemon(True)
+            self._syncer.start()
 
     def __iter__(self):
-        return iter(self.loads(i) for i in self._store.keys())
+        loads = self.loads
+        for chunk in self._key_chunks():
+            for key in chunk:
+                yield loads(key)
+
+    @synchronized
+    def __setitem__(self, key, value):
+        key = self.dumps(key)
+        self._count(key)
+        self._store[key] = self.dumps(value)
+        self._wrote(1)
+
+    @synchronized
+    def __delitem__(self, key):
+        try:
+            del self._store[self.dumps(key)]
+        except KeyError:
+            raise KeyError(key)
+        if self._length is not None:
+            self._length -= 1
+        self._wrote(1)
+
+    @synchronized
+    def __len__(self):
+        if self._length is None:
+            self._length = len(self._store)
+        return self._length
+
+    @synchronized
+    def set_many(self, items):
+        store, dumps = self._store, self.dumps
+        for key, value in pairs(items):
+            key = dumps(key)
+            self._count(key)
+            store[key] = dumps(value)
+        self._wrote(1)
+
+    @synchronized
+    def delete_many(self, keys):
+        store, dumps = self._store, self.dumps
+        for key in keys:
+            try:
+                del store[dumps(key)]
+            except KeyError:
+                continue
+            if self._length is not None:
+                self._length -= 1
+        self._wrote(1)
+
+    def iteritems(self):
+        # keys come out of the database pickled, so skip pickling them again
+        store, loads = self._store, self.loads
+        for keys in self._key_chunks():
+            for chunk in chunks(keys, SQLITE_FETCH):
+                with self._lock:
+                    found = [
+                        (key, store[key]) for key in chunk if key in store
+                    ]
+                for key, value in found:
+                    yield loads(key), loads(value)
+
+    @synchronized
+    def sync(self):
+        '''Syncs changes to disk.'''
+        self._sync()
+
+    def close(self):
+        '''Syncs changes and closes the database.'''
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        if self._syncer is not None:
+            self._syncer.join()
+        with self._lock:
+            if self._store is not None:
+                self._sync()
+            super(DBMStore, self).close()
+
+    __getitem__ = synchronized(SyncStore.__getitem__)
+    get_many = synchronized(SyncStore.get_many)
+
+    def _count(self, key):
+        # keeps a counted length up to date for a key about to be stored
+        if self._length is not None and key not in self._store:
+            self._length += 1
+
+    def _key_chunks(self):
+        # lists of pickled keys
+        store = self._store
+        if not hasattr(store, 'firstkey'):
+            # the database hands every key over at once anyway
+            with self._lock:
+                keys = store.keys()
+            yield keys
+            return
+        # walk the key chain, holding the lock for one chunk at a time
+        with self._lock:
+            key = store.firstkey()
+        while key is not None:
+            chunk = []
+            with self._lock:
+                while key is not None and len(chunk) < SQLITE_FETCH:
+                    chunk.append(key)
+                    key = store.nextkey(key)
+            yield chunk
+
+    def _sync(self):
+        if self._dirty:
+            sync = getattr(self._store, 'sync', None)
+            if sync is not None:
+                sync()
+            self._dirty = 0
+
+    def _sync_loop(self, interval):
+        while True:
+            with self._lock:
+                if not self._closed:
+                    self._lock.wait(interval)
+                if self._closed:
+                    return
+                self._sync()
+
+    def _wrote(self, count):
+        # syncs when the sync policy says so
+        self._dirty += count
+        if self._dirty >= self._sync_every:
+            self._sync()
 
 
 class FileStore(FileBase, BaseStore):
@@ -149,4 +339,36 @@ class SQLiteStore(SQLiteBase, BaseStore):
     Where the path is a URI path to a file on a local filesystem or ":memory:".
     '''
 
-    init = 'lite://'
\ No newline at end of file
+    init = 'lite://'
+
+
+class LogStore(LogBase, BaseStore):
+
+    '''
+    Log-structured object store.
+
+    shove's URI for log stores follows the form:
+
+    log://<path>
+
+    Where the path is a URI path to a directory on a local filesystem that
+    holds the segment and hint files.
+    '''
+
+    init = 'log://'
+
+
+class ShmStore(ShmBase, BaseStore):
+
+    '''
+    Shared memory object store for processes on one host.
+
+    shove's URI for shared memory stores follows the form:
+
+    shm://<name>
+
+    Where the name is the name of the shared memory segment. A store that
+    runs out of room raises :class:`MemoryError`.
+    '''
+
+    init = 'shm://'
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+'''shove asyncio frontend tests'''
+
+from stuf.six import unittest
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+@unittest.skipIf(asyncio is None, 'asyncio is not available')
+class AsyncStore(object):
+
+    def setUp(self):
+        import os
+        from tempfile import mkdtemp
+        self.cwd = os.getcwd()
+        self.tmp = mkdtemp()
+        os.chdir(self.tmp)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.run = self.loop.run_until_complete
+        self.store = self.frontend(iter_batch=2)
+
+    def tearDown(self):
+        import os
+        from shutil import rmtree
+        self.run(self.store.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        os.chdir(self.cwd)
+        rmtree(self.tmp)
+
+    def collect(self, iterator=None):
+        keys = []
+        if iterator is None:
+            iterator = self.store.__aiter__()
+        while True:
+            try:
+                keys.append(self.run(iterator.__anext__()))
+            except StopAsyncIteration:  # @UndefinedVariable
+                return sorted(keys)
+
+    def test_get(self):
+        self.run(self.store.set('max', 3))
+        self.assertEqual(self.run(self.store.get('max')), 3)
+        self.assertEqual(self.run(self.store.get('min')), None)
+
+    def test_delete(self):
+        self.run(self.store.set('max', 3))
+        self.run(self.store.delete('max'))
+        self.assertEqual(self.run(self.store.contains('max')), False)
+        self.assertRaises(KeyError, self.run, self.store.delete('max'))
+
+    def test_get_many(self):
+        self.run(self.store.set_many({'max': 3, 'min': 6, 'pow': 7}))
+        self.assertEqual(
+            self.run(self.store.get_many(['max', 'min', 'nope'])),
+            {'max': 3, 'min': 6},
+        )
+
+    def test_delete_many(self):
+        self.run(self.store.set_many({'max': 3, 'min': 6, 'pow': 7}))
+        self.run(self.store.delete_many(['max', 'min']))
+        self.run(self.store.flush())
+        self.assertEqual(self.collect(), ['pow'] * self.copies)
+
+    def test_iter(self):
+        self.run(self.store.set_many(dict((str(i), i) for i in range(5))))
+        self.assertEqual(
+            self.collect(), sorted(list('01234') * self.copies)
+        )
+
+    def test_items(self):
+        self.run(self.store.set_many(dict((str(i), i) for i in range(5))))
+        self.assertEqual(
+            self.collect(self.store.items()),
+            sorted([(str(i), i) for i in range(5)] * self.copies),
+        )
+        self.assertEqual(
+            self.collect(self.store.values()), sorted(list(range(5)) * self.copies)
+        )
+
+    def test_scan(self):
+        self.run(self.store.set_many(dict((str(i), i) for i in range(5))))
+        self.assertEqual(
+            self.collect(self.store.scan(start='1', stop='4')),
+            [('1', 1), ('2', 2), ('3', 3)],
+        )
+
+    def test_concurrent(self):
+        self.run(asyncio.gather(*[
+            self.store.set(str(i), i) for i in range(50)
+        ]))
+        values = self.run(asyncio.gather(*[
+            self.store.get(str(i)) for i in range(50)
+        ]))
+        self.assertEqual(values, list(range(50)))
+
+    def test_length(self):
+        self.run(self.store.set_many({'max': 3, 'min': 6}))
+        self.assertEqual(self.run(self.store.length()), 2 * self.copies)
+
+
+class TestAsyncShove(AsyncStore, unittest.TestCase):
+
+    copies = 1
+
+    def frontend(self, **kw):
+        from shove.aio import AsyncShove
+        return AsyncShove('lite://test.db', **kw)
+
+
+class TestAsyncMultiShove(AsyncStore, unittest.TestCase):
+
+    copies = 2
+
+    def frontend(self, **kw):
+        from shove.aio import AsyncMultiShove
+        return AsyncMultiShove('lite://test.db', 'file://test', **kw)
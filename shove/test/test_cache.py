@@ -9,6 +9,27 @@ setUpModule = Spawn.setUpModule
 tearDownModule = Spawn.tearDownModule
 
 
+class SharedBudget(object):
+
+    def test_shared_max_bytes(self):
+        from shove._imports import cache_backend
+        # two caches on one backend stand in for two processes
+        one = cache_backend(self.initstring, max_bytes=3000)
+        two = cache_backend(self.initstring, max_bytes=3000)
+        for i in range(4):
+            one['one{0}'.format(i)] = 'v' * 300
+        self.assertEqual(one.stats()['bytes'] > 0, True)
+        two.delete_many(['one{0}'.format(i) for i in range(4)])
+        # what the other process deleted is no longer counted
+        self.assertEqual(one.stats()['bytes'], 0)
+        for i in range(12):
+            two['two{0}'.format(i)] = 'v' * 300
+        one['one'] = 'v' * 300
+        # the budget holds for what both wrote
+        self.assertEqual(0 < one.stats()['bytes'] <= 3000, True)
+        self.assertEqual(one.stats()['bytes'], two.stats()['bytes'])
+
+
 class NoTimeout(object):
 
     def setUp(self):
@@ -31,6 +52,32 @@ class NoTimeout(object):
         del self.cache['test']
         self.assertEqual('test' in self.cache, False)
 
+    def test_get_many(self):
+        self.cache.set_many({'test': 'test', 'test2': 'test2'})
+        self.assertEqual(
+            self.cache.get_many(['test', 'test2', 'test3']),
+            {'test': 'test', 'test2': 'test2'},
+        )
+
+    def test_delete_many(self):
+        self.cache.set_many({'test': 'test', 'test2': 'test2'})
+        self.cache.delete_many(['test', 'test3'])
+        self.assertEqual('test' in self.cache, False)
+        self.assertEqual(self.cache['test2'], 'test2')
+
+    def test_max_bytes(self):
+        from shove._imports import cache_backend
+        cache = cache_backend(self.initstring, max_bytes=2000)
+        for i in range(20):
+            cache['test{0}'.format(i)] = 'v' * 300
+        stats = cache.stats()
+        self.assertEqual(0 < stats['bytes'] <= 2000, True)
+        self.assertEqual(stats['bytes'], sum(stats['sizes'].values()))
+        self.assertEqual(0 < stats['entries'] < 20, True)
+        cache['big'] = 'v' * 5000
+        self.assertEqual('big' in cache, False)
+        self.assertEqual(cache.stats()['bytes'] <= 2000, True)
+
 
 class Cache(NoTimeout):
 
@@ -54,6 +101,198 @@ class CacheCull(Cache):
         cache['test2'] = 'test2'
         cache['test3'] = 'test3'
         self.assertEquals(len(cache), 1)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+
+class TestNegativeCache(unittest.TestCase):
+
+    def test_expiry(self):
+        import time
+        from shove.cache import NegativeCache
+        cache = NegativeCache(negative_timeout=0.05)
+        cache.add('test', cache.version)
+        self.assertEqual('test' in cache, True)
+        time.sleep(0.1)
+        self.assertEqual('test' in cache, False)
+
+    def test_max_entries(self):
+        from shove.cache import NegativeCache
+        cache = NegativeCache(negative_max_entries=2)
+        for key in ('test1', 'test2', 'test3'):
+            cache.add(key, cache.version)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual('test1' in cache, False)
+
+    def test_stale_version(self):
+        from shove.cache import NegativeCache
+        cache = NegativeCache()
+        version = cache.version
+        cache.discard('test')
+        cache.add('test', version)
+        self.assertEqual('test' in cache, False)
+
+
+class TestStripedLock(unittest.TestCase):
+
+    def test_readers_share(self):
+        from threading import Thread, Event
+        from shove._locks import StripedLock
+        lock, inside, done = StripedLock(4), Event(), Event()
+
+        def reader():
+            with lock.stripe(0):
+                inside.set()
+                done.wait(5)
+        thread = Thread(target=reader)
+        thread.start()
+        inside.wait(5)
+        # a reader on another stripe gets in while the first is inside
+        self.assertEqual(lock.stripe(1).acquire(False), True)
+        lock.stripe(1).release()
+        done.set()
+        thread.join()
+
+    def test_writer_waits(self):
+        import time
+        from threading import Thread
+        from shove._locks import StripedLock
+        lock, order = StripedLock(4), []
+
+        def writer():
+            with lock:
+                order.append('write')
+        lock.stripe(3).acquire()
+        thread = Thread(target=writer)
+        thread.start()
+        time.sleep(0.1)
+        order.append('read')
+        lock.stripe(3).release()
+        thread.join()
+        self.assertEqual(order, ['read', 'write'])
+
+    def test_writer_reenters(self):
+        from shove._locks import StripedLock
+        lock = StripedLock(4)
+        with lock:
+            with lock.stripe('max'):
+                with lock:
+                    pass
+        self.assertEqual(lock.stripe('max').acquire(False), True)
+
+
+class TestExpiry(unittest.TestCase):
+
+    def test_order(self):
+        import time
+        from threading import Event
+        from shove._expiry import Expiry
+        expiry, done, expired = Expiry(), Event(), []
+
+        class Cache(object):
+            def _expire(self, key):
+                expired.append(key)
+                if len(expired) == 2:
+                    done.set()
+        cache, now = Cache(), time.time()
+        expiry.schedule(cache, 'late', now + 0.2)
+        expiry.schedule(cache, 'never', now + 60)
+        expiry.schedule(cache, 'soon', now + 0.1)
+        done.wait(5)
+        self.assertEqual(expired, ['soon', 'late'])
+        self.assertEqual(len(expiry), 1)
+        expiry.cancel(cache)
+        self.assertEqual(len(expiry), 0)
+
+    def test_lazy(self):
+        from shove._imports import cache_backend
+        cache = cache_backend('simple://', timeout=60)
+        cache['max'] = 3
+        cache.set_many({'min': 1})
+        # past its deadline, but not yet purged
+        cache._key_ttl_map['max'] = cache._key_ttl_map['min'] = 0
+        self.assertRaises(KeyError, cache.__getitem__, 'max')
+        self.assertEqual(cache.get_many(['max', 'min']), {})
+        self.assertEqual('max' in cache._store, True)
+        cache._expire('max')
+        self.assertEqual('max' in cache._store, False)
+        stats = cache.stats()
+        self.assertEqual(stats['expirations'], 1)
+        self.assertEqual(stats['misses'], 3)
+
+    def test_read_extends(self):
+        import time
+        from shove._imports import cache_backend
+        cache = cache_backend('simple://', timeout=60)
+        cache['max'] = 3
+        deadline = cache._key_ttl_map['max']
+        time.sleep(0.01)
+        cache['max']
+        # rescheduled for the later deadline instead of expired
+        cache._expire('max')
+        self.assertEqual(cache['max'], 3)
+        self.assertEqual(cache._key_ttl_map['max'] > deadline, True)
+        self.assertEqual(cache._scheduled, set(['max']))
+
+    def test_close_others(self):
+        import time
+        from shove._imports import cache_backend
+        closed = cache_backend('simple://', timeout=60)
+        closed['max'] = 3
+        # the thread is waiting for the closed cache's deadline
+        time.sleep(0.05)
+        closed.close()
+        cache = cache_backend('simple://', timeout=0.2)
+        cache['min'] = 1
+        cache['pow'] = 2
+        deadline = time.time() + 5
+        while len(cache._store) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(cache._store), 0)
+        self.assertEqual(cache.stats()['expirations'], 2)
+
+    def test_close(self):
+        from shove._expiry import expiry
+        from shove._imports import cache_backend
+        cache = cache_backend('simple://', timeout=60)
+        cache.set_many({'max': 3, 'min': 1})
+        cache.close()
+        self.assertEqual(
+            [entry for entry in expiry._heap if entry[2]() is cache], []
+        )
+
+
+class TestStats(unittest.TestCase):
+
+    def test_histogram(self):
+        from shove._stats import Histogram
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.record(0.000003)
+        for _ in range(10):
+            histogram.record(0.1)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 100)
+        self.assertEqual(snapshot['max'], 0.1)
+        # the upper bound of the bucket, so within a factor of two
+        self.assertEqual(snapshot['p50'], 0.000004)
+        self.assertEqual(snapshot['p99'], 0.1)
+        self.assertEqual(snapshot['buckets'], {4: 90, 131072: 10})
+
+    def test_exporter(self):
+        from threading import Event
+        from shove._stats import Exporter
+        exported, done = [], Event()
+
+        def export(stats):
+            exported.append(stats)
+            done.set()
+        exporter = Exporter(export, lambda: {'hits': len(exported)}, 0.01)
+        done.wait(5)
+        exporter.close()
+        self.assertEqual(len(exported) >= 2, True)
+        self.assertEqual(exported[-1], {'hits': len(exported) - 1})
+        exporter.close()
+        self.assertEqual(exported[-1], {'hits': len(exported) - 1})
 
 
 class TestSimpleCache(CacheCull, unittest.TestCase):
@@ -65,6 +304,19 @@ class TestSimpleLRUCache(NoTimeout, unittest.TestCase):
 
     initstring = 'simplelru://'
 
+    def test_evict(self):
+        from shove._imports import cache_backend
+        cache = cache_backend(self.initstring, max_entries=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a']
+        cache['c'] = 3
+        self.assertEqual(sorted(cache._store), ['a', 'c'])
+        del cache['a']
+        cache.set_many({'d': 4, 'e': 5})
+        self.assertEqual(sorted(cache._store), ['d', 'e'])
+        self.assertEqual(sorted(cache._order), ['d', 'e'])
+
 
 class TestMemoryCache(CacheCull, unittest.TestCase):
 
@@ -75,8 +327,152 @@ class TestMemoryLRUCache(NoTimeout, unittest.TestCase):
 
     initstring = 'memlru://'
 
+    def test_recent_hits(self):
+        self.cache['a'] = 1
+        self.cache['b'] = 2
+        self.cache._touch = None
+        self.cache['a']
+        # without move_to_end the hit waits for the next write
+        self.assertEqual(list(self.cache._order), ['a', 'b'])
+        self.assertEqual(list(self.cache._recent), ['a'])
+        self.cache['c'] = 3
+        self.assertEqual(list(self.cache._order), ['b', 'a', 'c'])
+        self.assertEqual(list(self.cache._recent), [])
+
+    def test_copy_frozen(self):
+        from shove._imports import cache_backend
+        cache = cache_backend('memlru://?copy=frozen')
+        cache['max'] = [1]
+        self.assertEqual(cache['max'], (1,))
+        self.assertEqual(cache['max'] is cache['max'], True)
+        cache.set_many({'min': [2]})
+        self.assertEqual(cache.get_many(['min']), {'min': (2,)})
+        cache = cache_backend('memlru://?copy=frozen', max_entries=1)
+        cache['max'] = [1]
+        cache['min'] = [2]
+        # the least recently used entry goes
+        self.assertRaises(KeyError, cache.__getitem__, 'max')
+        self.assertEqual(cache['min'], (2,))
+
+    def test_max_bytes_lru(self):
+        from shove._imports import cache_backend
+        from shove.base import sizeof
+        size = sizeof('a') + sizeof('v' * 300)
+        cache = cache_backend('memlru://', max_bytes=size * 2)
+        cache['a'] = 'v' * 300
+        cache['b'] = 'v' * 300
+        cache['a']
+        cache['c'] = 'v' * 300
+        # the least recently used entry goes first
+        self.assertEqual(sorted(cache._store), ['a', 'c'])
+        self.assertEqual(cache.stats()['bytes'], size * 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+@unittest.skipIf(
+    __import__('shove.base').base.shared_memory is None,
+    'shared memory is not available',
+)
+class TestShmCache(SharedBudget, NoTimeout, unittest.TestCase):
+
+    initstring = 'shm://shove-test-cache'
+
+    def tearDown(self):
+        self.cache.unlink()
+        super(TestShmCache, self).tearDown()
+
+    def test_full(self):
+        from shove.cache import ShmCache
+        cache = ShmCache('shm://shove-test-cull?size=8192&slots=16')
+        try:
+            for i in range(40):
+                cache['k{0}'.format(i)] = 'v' * 500
+            self.assertEqual(cache['k39'], 'v' * 500)
+            self.assertEqual(len(cache) < 40, True)
+        finally:
+            cache.unlink()
+
+    def test_full_max_bytes(self):
+        from shove.cache import ShmCache
+        cache = ShmCache(
+            'shm://shove-test-cull?size=8192&slots=16', max_bytes=100000
+        )
+        try:
+            for i in range(40):
+                cache['k{0}'.format(i)] = 'v' * 500
+            stats = cache.stats()
+            # entries dropped to make room are no longer counted
+            self.assertEqual(sorted(stats['sizes']), sorted(cache))
+            self.assertEqual(stats['bytes'], sum(stats['sizes'].values()))
+            self.assertEqual(stats['evictions'] > 0, True)
+            self.assertEqual(set(cache._key_ttl_map) <= set(cache), True)
+        finally:
+            cache.unlink()
+
+
+class PolicyCache(NoTimeout):
+
+    def _read(self, cache, key):
+        try:
+            return cache[key]
+        except KeyError:
+            cache[key] = key
+
+    def test_cull(self):
+        from shove._imports import cache_backend
+        cache = cache_backend(self.initstring, max_entries=3)
+        for i in range(10):
+            cache['test{0}'.format(i)] = i
+        self.assertEqual(len(cache), 3)
+        cache = cache_backend(self.initstring, max_entries=1)
+        cache.set_many([('test1', 1), ('test2', 2), ('test3', 3)])
+        self.assertEqual(len(cache), 1)
+
+    def test_scan(self):
+        from shove._imports import cache_backend
+        cache = cache_backend(self.initstring, max_entries=40)
+        for rounds in range(20):
+            for key in range(10):
+                self._read(cache, key)
+            for key in range(5):
+                self._read(cache, 'cold{0}{1}'.format(rounds, key))
+        for key in range(200):
+            self._read(cache, 'scan{0}'.format(key))
+        # the hot keys outlast the scan
+        hot = sum(1 for key in range(10) if key in cache)
+        self.assertEqual(hot >= 8, True, hot)
+        stats = cache.stats()
+        self.assertEqual(stats['hits'] + stats['misses'], 500)
+
+
+class TestARCCache(PolicyCache, unittest.TestCase):
+
+    initstring = 'arc://'
 
-class TestFileCache(CacheCull, unittest.TestCase):
+
+class TestTwoQCache(PolicyCache, unittest.TestCase):
+
+    initstring = '2q://'
+
+
+class TestTinyLFUCache(PolicyCache, unittest.TestCase):
+
+    initstring = 'tinylfu://'
+
+    def test_sketch(self):
+        from shove._policy import CountMinSketch
+        sketch = CountMinSketch(64)
+        for _ in range(20):
+            sketch.increment('hot')
+        sketch.increment('cold')
+        self.assertEqual(sketch.frequency('hot'), 15)
+        self.assertEqual(sketch.frequency('cold') >= 1, True)
+        self.assertEqual(sketch.frequency('never') <= 1, True)
+        sketch._age()
+        self.assertEqual(sketch.frequency('hot'), 7)
+
+
+class TestFileCache(SharedBudget, CacheCull, unittest.TestCase):
 
     initstring = 'file://test'
 
@@ -85,8 +481,19 @@ class TestFileCache(CacheCull, unittest.TestCase):
         self.cache = None
         shutil.rmtree('test')
 
+    def test_shared(self):
+        from shove._imports import cache_backend
+        # another process on the same directory is seen without an index
+        other = cache_backend(self.initstring)
+        other['max'] = 3
+        self.assertEqual('max' in self.cache, True)
+        self.assertEqual(len(self.cache), 1)
+        del other['max']
+        self.assertEqual('max' in self.cache, False)
+        self.assertEqual(len(self.cache), 0)
+
 
-class TestFileLRUCache(NoTimeout, unittest.TestCase):
+class TestFileLRUCache(SharedBudget, NoTimeout, unittest.TestCase):
 
     initstring = 'filelru://test2'
 
@@ -95,6 +502,15 @@ class TestFileLRUCache(NoTimeout, unittest.TestCase):
         self.cache = None
         shutil.rmtree('test2')
 
+    def test_reopen(self):
+        from shove._imports import cache_backend
+        self.cache['old'] = 1
+        cache = cache_backend(self.initstring, max_entries=2)
+        cache['a'] = 2
+        cache['b'] = 3
+        # what an earlier session left goes first
+        self.assertEqual(sorted(cache), ['a', 'b'])
+
 
 class TestSQLiteMemoryCache(NoTimeout, unittest.TestCase):
 
@@ -121,6 +121,84 @@ class Multi(object):
         self.assertEqual(self.store['pow'], 8)
         self.store.clear()
 
+    def test_get_many(self):
+        self.store.set_many({'max': 3, 'min': 6})
+        self.store.sync()
+        self.assertEqual(
+            self.store.get_many(['max', 'min', 'pow']), {'max': 3, 'min': 6}
+        )
+        self.store.clear()
+
+    def test_delete_many(self):
+        self.store.set_many({'max': 3, 'min': 6, 'pow': 7})
+        self.store.sync()
+        self.store.delete_many(['max', 'pow'])
+        self.assertEqual(list(self.store.keys()), ['min'] * 5)
+        self.store.clear()
+
+    def test_pending_writes(self):
+        from shove.core import MultiShove
+        self.store.close()
+        self.store = MultiShove(*self.stores, sync=100)
+        self.store['max'] = 3
+        self.store.sync()
+        self.store['min'] = 6
+        del self.store['max']
+        self.assertEqual('min' in self.store, True)
+        self.assertEqual('max' in self.store, False)
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(list(self.store.keys()), ['min'] * 5)
+        self.store.sync()
+        self.assertEqual(len(self.store), 5)
+        self.store.clear()
+
+    def test_coalesce(self):
+        import time
+        from threading import Thread
+        calls = []
+        fetch = self.store._fetch
+
+        def slow(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return fetch(key)
+        self.store._fetch = slow
+        self.store['max'] = 3
+        self.store.sync()
+        del self.store._cache['max']
+        found = []
+        threads = [
+            Thread(target=lambda key=key: found.append(self.store.get(key)))
+            for key in ['max'] * 5 + ['min'] * 5
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(calls), ['max', 'min'])
+        self.assertEqual(sorted(found, key=str), [3] * 5 + [None] * 5)
+        self.store.clear()
+
+    def test_iteritems(self):
+        self.store.set_many({'max': 3, 'min': 6})
+        self.store.sync()
+        self.store['min'] = 5
+        del self.store['max']
+        self.assertEqual(list(self.store.iteritems()), [('min', 5)] * 5)
+        self.assertEqual(list(self.store.itervalues()), [5] * 5)
+        self.store.clear()
+
+    def test_scan(self):
+        self.store.set_many({'max': 3, 'min': 6, 'pow': 7})
+        self.store.sync()
+        self.store['mid'] = 4
+        self.assertEqual(
+            list(self.store.scan(prefix='m')),
+            [('max', 3), ('mid', 4), ('min', 6)],
+        )
+        self.assertEqual(list(self.store.scan(start='n', limit=1)), [('pow', 7)])
+        self.store.clear()
+
     def test_update(self):
         from shove.core import MultiShove
         tstore = MultiShove()
@@ -62,6 +62,23 @@ class Store(object):
         slist = list(items(self.store))
         self.assertEqual(('min', 6) in slist, True)
 
+    def test_iteritems(self):
+        self.store.set_many({'max': 3, 'min': 6, 'pow': 7})
+        self.store.sync()
+        self.store['min'] = 5
+        self.store['abs'] = 1
+        del self.store['pow']
+        self.assertEqual(
+            sorted(self.store.iteritems()), [('abs', 1), ('max', 3), ('min', 5)]
+        )
+        self.assertEqual(sorted(self.store.itervalues()), [1, 3, 5])
+        self.store.sync()
+        self.assertEqual(
+            sorted(self.store._store.iteritems()),
+            [('abs', 1), ('max', 3), ('min', 5)],
+        )
+        self.assertEqual(sorted(self.store._store.itervalues()), [1, 3, 5])
+
     def test_keys(self):
         self.store['max'] = 3
         self.store['min'] = 6
@@ -125,6 +142,161 @@ class Store(object):
         self.store.sync()
         self.assertEqual(len(item) + len(self.store), 4)
 
+    def test_get_many(self):
+        self.store['max'] = 3
+        self.store['min'] = 6
+        self.store.sync()
+        self.assertEqual(
+            self.store.get_many(['max', 'min', 'pow']), {'max': 3, 'min': 6}
+        )
+
+    def test_set_many(self):
+        self.store.set_many({'max': 3, 'min': 6})
+        self.store.set_many([('pow', 7)])
+        self.store.sync()
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store['pow'], 7)
+
+    def test_delete_many(self):
+        self.store.set_many({'max': 3, 'min': 6, 'pow': 7})
+        self.store.sync()
+        self.store.delete_many(['max', 'pow', 'nope'])
+        self.assertEqual(list(keys(self.store)), ['min'])
+
+    def test_pending_writes(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring, sync=100)
+        self.store['max'] = 3
+        self.store['min'] = 6
+        self.assertEqual('max' in self.store._store, False)
+        self.assertEqual('max' in self.store, True)
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(sorted(keys(self.store)), ['max', 'min'])
+        self.assertEqual('max' in self.store._store, False)
+
+    def test_pending_deletes(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring, sync=100)
+        self.store['max'] = 3
+        self.store['min'] = 6
+        self.store.sync()
+        del self.store['max']
+        self.assertEqual('max' in self.store._store, True)
+        self.assertEqual('max' in self.store, False)
+        self.assertEqual(self.store.get('max'), None)
+        self.assertEqual(len(self.store), 1)
+        self.assertEqual(list(keys(self.store)), ['min'])
+        self.assertRaises(KeyError, self.store.__delitem__, 'max')
+        self.store.sync()
+        self.assertEqual('max' in self.store._store, False)
+
+    def test_scan(self):
+        self.store.set_many(
+            ('key{0}'.format(i), i) for i in range(20)
+        )
+        self.store.sync()
+        self.store['key05'] = 'pending'
+        del self.store['key1']
+        self.assertEqual(
+            list(self.store.scan(prefix='key1')),
+            [('key1{0}'.format(i), 10 + i) for i in range(10)],
+        )
+        self.assertEqual(
+            [key for key, _ in self.store.scan(start='key0', stop='key3')],
+            ['key0', 'key05', 'key10', 'key11', 'key12', 'key13', 'key14',
+             'key15', 'key16', 'key17', 'key18', 'key19', 'key2'],
+        )
+        self.assertEqual(
+            list(self.store.scan(prefix='key0', limit=2)),
+            [('key0', 0), ('key05', 'pending')],
+        )
+
+    def test_coalesce(self):
+        import time
+        from threading import Thread
+        calls = []
+        fetch = self.store._fetch
+
+        def slow(key):
+            calls.append(key)
+            time.sleep(0.1)
+            return fetch(key)
+        self.store._fetch = slow
+        self.store['max'] = 3
+        self.store.sync()
+        del self.store._cache['max']
+        found = []
+        threads = [
+            Thread(target=lambda key=key: found.append(self.store.get(key)))
+            for key in ['max'] * 5 + ['min'] * 5
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(calls), ['max', 'min'])
+        self.assertEqual(sorted(found, key=str), [3] * 5 + [None] * 5)
+
+    def test_negative_cache(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0, negative_cache=True)
+        self.assertEqual(self.store.get('max'), None)
+        self.assertEqual('max' in self.store, False)
+        self.assertEqual(self.store.get_many(['max']), {})
+        self.assertEqual(self.store._negative.stats()['hits'], 2)
+        self.store['max'] = 3
+        self.assertEqual(self.store['max'], 3)
+        self.assertEqual('max' in self.store._negative, False)
+        del self.store['max']
+        self.assertEqual('max' in self.store, False)
+        self.store.set_many({'max': 4})
+        self.assertEqual(self.store.get_many(['max']), {'max': 4})
+
+    def test_stats(self):
+        self.store['max'] = 3
+        self.store.sync()
+        self.store['max']
+        self.store.get('min')
+        self.store.get_many(['max'])
+        del self.store['max']
+        stats = self.store.stats()
+        latency = stats['latency']
+        self.assertEqual(latency['set']['count'], 1)
+        self.assertEqual(latency['get']['count'], 2)
+        self.assertEqual(latency['get_many']['count'], 1)
+        self.assertEqual(latency['delete']['count'], 1)
+        self.assertEqual(latency['load']['count'] >= 1, True)
+        self.assertEqual(stats['counters']['flushes'] >= 1, True)
+        self.assertEqual(stats['cache']['hits'] >= 1, True)
+        self.assertEqual(stats['cache']['misses'] >= 1, True)
+        self.assertEqual('buffer' in stats, True)
+        self.assertEqual('store' in stats, True)
+
+    def test_no_stats(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0, stats=False)
+        self.store['max'] = 3
+        self.assertEqual(self.store['max'], 3)
+        stats = self.store.stats()
+        self.assertEqual(stats['latency'], {})
+        self.assertEqual(stats['counters'], {})
+
+    def test_exporter(self):
+        from shove import Shove
+        exported = []
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0, exporter=exported.append)
+        self.store['max'] = 3
+        self.store.export_stats()
+        self.assertEqual(exported[0]['latency']['set']['count'], 1)
+        self.store.close()
+        # once more on close
+        self.assertEqual(len(exported), 2)
+
     def test_close(self):
         self.store.close()
         self.assertEqual(self.store._store, None)
@@ -150,6 +322,94 @@ class PathStore(Store):
         del os.environ['TEST_DIR']
 
 
+class WriteBehindStore(Store):
+
+    def setUp(self):
+        from shove import Shove
+        self.store = Shove(
+            self.initstring, write_behind=True, flush_interval=60
+        )
+
+    def test_flush(self):
+        self.store['max'] = 3
+        self.assertEqual('max' in self.store._store, False)
+        self.assertEqual(self.store['max'], 3)
+        self.store.flush(wait=True)
+        self.assertEqual(self.store._store['max'], 3)
+
+    def test_flush_interval(self):
+        import time
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring, write_behind=True, flush_interval=0.05
+        )
+        self.store['max'] = 3
+        time.sleep(0.5)
+        self.assertEqual(self.store._store['max'], 3)
+
+    def test_backpressure(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring, write_behind=True, flush_interval=60,
+            max_pending=2,
+        )
+        for i in range(10):
+            self.store[i] = i
+            self.assertEqual(len(self.store._buffer) <= 2, True)
+        self.store.flush()
+        self.assertEqual(len(self.store._store), 10)
+
+    def test_close_drains(self):
+        batches = []
+        set_many = self.store._store.set_many
+        self.store._store.set_many = lambda batch: (
+            batches.append(dict(batch)), set_many(batch)
+        )
+        self.store['max'] = 3
+        self.store.close()
+        self.assertEqual(batches, [{'max': 3}])
+
+    def test_close_error(self):
+        closed = []
+        store = self.store._store
+        close = store.close
+
+        def fail(batch):
+            raise IOError('disk full')
+        store.set_many = fail
+        store.close = lambda: (closed.append(True), close())
+        self.store['max'] = 3
+        self.assertRaises(IOError, self.store.close)
+        # the store is closed even though the last write failed
+        self.assertEqual(closed, [True])
+        self.assertEqual(self.store._store, None)
+
+    def test_clear_locked(self):
+        from threading import Thread
+        self.store['max'] = 3
+        writer = self.store._writer
+        clear = self.store._store.clear
+        blocked = []
+
+        def clearing():
+            # a write racing the clear waits until it is done
+            racer = Thread(target=self.store.__setitem__, args=('min', 6))
+            racer.start()
+            racer.join(0.2)
+            blocked.append(racer.is_alive())
+            clear()
+            self.racer = racer
+        self.store._store.clear = clearing
+        self.store.clear()
+        self.racer.join()
+        self.assertEqual(blocked, [True])
+        self.assertEqual(writer.items(), {'min': 6})
+        self.store.flush(wait=True)
+        self.assertEqual(list(self.store._store), ['min'])
+
+
 class TestSimpleStore(Store, unittest.TestCase):
 
     initstring = 'simple://'
@@ -159,16 +419,374 @@ class TestMemoryStore(Store, unittest.TestCase):
 
     initstring = 'memory://'
 
+    def test_copy_modes(self):
+        import pickle
+        from shove.store import MemoryStore
+        value = {'list': [1, {'set': set([2])}]}
+        store = MemoryStore('memory://?copy=deep')
+        store['max'] = value
+        self.assertEqual(store['max'], value)
+        self.assertEqual(store['max'] is value, False)
+        store = MemoryStore('memory://', copy='none')
+        store['max'] = value
+        self.assertEqual(store['max'] is value, True)
+        store = MemoryStore('memory://?copy=serialized')
+        store['max'] = value
+        self.assertEqual(isinstance(store._store['max'], bytes), True)
+        self.assertEqual(store.get_many(['max']), {'max': value})
+        self.assertEqual(dict(store.iteritems()), {'max': value})
+        store = MemoryStore('memory://?copy=frozen')
+        store['max'] = value
+        frozen = store['max']
+        self.assertEqual(frozen is store['max'], True)
+        self.assertEqual(frozen['list'], (1, {'set': frozenset([2])}))
+        self.assertRaises(TypeError, frozen.__setitem__, 'min', 1)
+        self.assertRaises(TypeError, frozen['list'][1].update, {})
+        # changing the original does not reach the store
+        value['list'].append(3)
+        self.assertEqual(len(store['max']['list']), 2)
+        self.assertEqual(
+            pickle.loads(pickle.dumps(frozen)),
+            {'list': (1, {'set': frozenset([2])})},
+        )
+        self.assertRaises(ValueError, MemoryStore, 'memory://?copy=shallow')
+
+
+@unittest.skipIf(
+    __import__('shove.base').base.shared_memory is None,
+    'shared memory is not available',
+)
+class TestShmStore(Store, unittest.TestCase):
+
+    initstring = 'shm://shove-test-store'
+
+    def setUp(self):
+        super(TestShmStore, self).setUp()
+        self._shm = self.store._store
+
+    def tearDown(self):
+        super(TestShmStore, self).tearDown()
+        self._shm.unlink()
+
+    def test_processes(self):
+        import os
+        from shove.store import ShmStore
+        pid = os.fork()
+        if not pid:
+            store = ShmStore(self.initstring)
+            store['max'] = 3
+            store.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(self._shm['max'], 3)
+
+    def test_full(self):
+        from shove.store import ShmStore
+        store = ShmStore('shm://shove-test-full?size=8192&slots=16')
+        try:
+            # overwrites reuse the room the old values left behind
+            for i in range(50):
+                store['max'] = 'v' * 1000
+            self.assertEqual(store['max'], 'v' * 1000)
+            self.assertRaises(
+                MemoryError, store.set_many,
+                dict(('k{0}'.format(i), 'v' * 1000) for i in range(20)),
+            )
+        finally:
+            store.unlink()
+
 
 class TestFileStore(PathStore, unittest.TestCase):
 
     initstring = 'file://test'
 
 
+class TestMappedFileStore(PathStore, unittest.TestCase):
+
+    initstring = 'file://test?mmap_threshold=100'
+
+    def test_raw(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring + '&raw=1', sync=0)
+        store = self.store._store
+        store['big'] = b'x' * 1000
+        store['small'] = b'x'
+        self.assertEqual(isinstance(store['big'], memoryview), True)
+        self.assertEqual(store['big'].readonly, True)
+        self.assertEqual(bytes(store['big']), b'x' * 1000)
+        self.assertEqual(store['small'], b'x')
+        # replaced, so a view handed out earlier keeps the old contents
+        view = store['big']
+        store['big'] = b'y' * 1000
+        self.assertEqual(bytes(view), b'x' * 1000)
+        self.assertEqual(bytes(store['big']), b'y' * 1000)
+
+    @unittest.skipIf(
+        __import__('pickle').HIGHEST_PROTOCOL < 5, 'needs pickle protocol 5'
+    )
+    def test_out_of_band(self):
+        import pickle
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring + '&out_of_band=1', sync=0)
+        store = self.store._store
+        store['big'] = {'data': pickle.PickleBuffer(bytearray(b'x' * 1000))}
+        with open(store._key_to_file('big'), 'rb') as item:
+            self.assertEqual(item.read(8), b'SHOVEOB5')
+        value = store['big']['data']
+        self.assertEqual(isinstance(value, memoryview), True)
+        self.assertEqual(bytes(value), b'x' * 1000)
+        store['plain'] = [1, 2]
+        self.assertEqual(store['plain'], [1, 2])
+
+
+class TestIndexedFileStore(PathStore, unittest.TestCase):
+
+    initstring = 'file://test?manifest=1'
+
+    def test_manifest(self):
+        import os
+        from shove import Shove
+        self.store.set_many({'max': 3, 'min': 6})
+        self.store.sync()
+        self.assertEqual(os.path.exists('test/.@shove/dirty'), True)
+        self.store.close()
+        self.assertEqual(os.path.exists('test/.@shove/dirty'), False)
+        # a file the manifest does not know about is not seen
+        with open('test/stray', 'wb'):
+            pass
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(sorted(self.store), ['max', 'min'])
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual('max' in self.store, True)
+
+    def test_manifest_keys(self):
+        from shove import Shove
+        # keys named like the manifest files do not overwrite them
+        self.store.set_many({'.manifest': 1, '.dirty': 2, 'max': 3})
+        self.store.close()
+        # reopened from the manifest, which has all three
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store['.dirty'], 2)
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(self.store['.dirty'], 2)
+        self.assertEqual(self.store['.manifest'], 1)
+
+    def test_rebuild_dirty(self):
+        from shove import Shove
+        self.store['max'] = 3
+        self.store.sync()
+        # not closed, as after a crash
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(sorted(self.store), ['max'])
+
+
+class TestFanoutFileStore(PathStore, unittest.TestCase):
+
+    initstring = 'file://test?fanout=2'
+
+    def test_layout(self):
+        import os
+        from shove import Shove
+        self.store['max'] = 3
+        self.store.sync()
+        names = sorted(os.listdir('test'))
+        self.assertEqual(names[0], '.@shove')
+        self.assertEqual(len(names), 2)
+        self.assertEqual(len(os.listdir(os.path.join('test', names[1]))), 1)
+        self.store.close()
+        # the layout is picked up on reopen
+        self.store = Shove('file://test', sync=0)
+        self.assertEqual(self.store['max'], 3)
+        self.assertEqual(self.store._store._fanout, 2)
+        self.assertRaises(ValueError, Shove, 'file://test?fanout=1')
+
+    def test_layout_key(self):
+        from shove import Shove
+        # a key named like the layout file does not overwrite it
+        for key in ('.layout', '.@shove', 'layout'):
+            self.store[key] = 3
+        self.store.sync()
+        self.store.close()
+        self.store = Shove('file://test', sync=0)
+        self.assertEqual(self.store._store._fanout, 2)
+        self.assertEqual(self.store['.layout'], 3)
+        self.assertEqual(self.store['.@shove'], 3)
+
+    def test_migrate_layout(self):
+        import os
+        from shove import Shove
+        from shove.base import migrate_layout
+        self.store.close()
+        self.store = Shove('file://flat', sync=0)
+        self.store.set_many(('key{0}'.format(i), i) for i in range(20))
+        self.store.close()
+        self.assertEqual(len(os.listdir('flat')), 20)
+        migrate_layout('flat', 1)
+        self.assertEqual(
+            [
+                name for name in os.listdir('flat')
+                if not os.path.isdir(os.path.join('flat', name))
+            ],
+            [],
+        )
+        self.assertEqual(os.listdir('flat/.@shove'), ['layout'])
+        self.store = Shove('file://flat', sync=0)
+        self.assertEqual(len(self.store), 20)
+        self.assertEqual(self.store['key7'], 7)
+        self.store.close()
+        migrate_layout('flat', 0)
+        self.assertEqual(len(os.listdir('flat')), 20)
+        self.store = Shove('file://flat', sync=0)
+        self.assertEqual(sorted(self.store.values()), list(range(20)))
+
+
+class TestLogStore(PathStore, unittest.TestCase):
+
+    initstring = 'log://test'
+
+    def test_reopen(self):
+        import os
+        from shove import Shove
+        self.store.set_many({'max': 3, 'min': 6, 'mid': 4})
+        del self.store['mid']
+        self.store.sync()
+        self.store.close()
+        self.assertEqual(
+            sorted(os.listdir('test')), ['0000000000.hint', '0000000000.log']
+        )
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(sorted(self.store), ['max', 'min'])
+        self.assertEqual(self.store['max'], 3)
+
+    def test_torn_tail(self):
+        import os
+        from shove import Shove
+        self.store['max'] = 3
+        self.store.sync()
+        size = os.path.getsize('test/0000000000.log')
+        # not closed, and half of a record made it to disk
+        with open('test/0000000000.log', 'ab') as segment:
+            segment.write(b'\x01\x02\x03')
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(self.store['max'], 3)
+        self.assertEqual(os.path.getsize('test/0000000000.log'), size)
+        self.store['min'] = 6
+        self.store.sync()
+        self.assertEqual(self.store['min'], 6)
+
+    def test_compact(self):
+        import os
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring + '?segment_bytes=200&compact_interval=0', sync=0
+        )
+        for i in range(20):
+            self.store.set_many({'max': i, 'min': -i})
+        self.store['gone'] = 1
+        del self.store['gone']
+        self.store.sync()
+        before = len(os.listdir('test'))
+        self.store._store.compact()
+        self.assertEqual(len(os.listdir('test')) < before, True)
+        self.assertEqual(self.store['max'], 19)
+        self.assertEqual(self.store['min'], -19)
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(sorted(self.store), ['max', 'min'])
+        self.assertEqual(self.store['max'], 19)
+
+
 class TestDBMStore(PathStore, unittest.TestCase):
 
     initstring = 'dbm://test.dbm'
 
+    def _syncs(self, initstring):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(initstring, sync=0)
+        store = self.store._store
+        syncs = []
+        sync = store._store.sync
+        store._store.sync = lambda: (syncs.append(1), sync())
+        return store, syncs
+
+    def test_sync_every(self):
+        store, syncs = self._syncs(self.initstring + '?sync_every=3')
+        for i in range(5):
+            store[i] = i
+        self.assertEqual(len(syncs), 1)
+        store.set_many({'max': 3})
+        self.assertEqual(len(syncs), 2)
+        store.sync()
+        store.sync()
+        self.assertEqual(len(syncs), 2)
+        store['min'] = 6
+        store.sync()
+        self.assertEqual(len(syncs), 3)
+        self.assertEqual(store['max'], 3)
+
+    def test_sync_interval(self):
+        import time
+        store, syncs = self._syncs(
+            self.initstring + '?sync_every=1000&sync_interval=0.05'
+        )
+        store['max'] = 3
+        self.assertEqual(len(syncs), 0)
+        time.sleep(0.5)
+        self.assertEqual(len(syncs), 1)
+
+    def test_len(self):
+        store = self.store._store
+        store.set_many({'max': 3, 'min': 6})
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store._length, 2)
+        store['max'] = 4
+        store['mid'] = 5
+        del store['min']
+        store.delete_many(['mid', 'nope'])
+        self.assertEqual(store._length, 1)
+        self.assertEqual(len(store._store), 1)
+
+    def test_key_chain(self):
+        # a database with gdbm's firstkey/nextkey is walked in chunks
+        class Chain(dict):
+
+            def firstkey(self):
+                return min(self) if self else None
+
+            def nextkey(self, key):
+                later = [other for other in self if other > key]
+                return min(later) if later else None
+
+            def keys(self):
+                raise AssertionError('keys() materializes every key')
+
+        store = self.store._store
+        store.set_many(('key{0:04d}'.format(i), i) for i in range(1200))
+        store._store.close()
+        store._store = Chain(
+            (store.dumps('key{0:04d}'.format(i)), store.dumps(i))
+            for i in range(1200)
+        )
+        store._store.close = lambda: None
+        self.assertEqual(len(list(store._key_chunks())), 3)
+        self.assertEqual(len(list(store)), 1200)
+        self.assertEqual(dict(store.iteritems())['key0007'], 7)
+
+    def test_close_syncs(self):
+        from shove import Shove
+        store, syncs = self._syncs(self.initstring + '?sync_every=1000')
+        store['max'] = 3
+        self.store.close()
+        self.assertEqual(len(syncs), 1)
+        self.store = Shove(self.initstring, sync=0)
+        self.assertEqual(self.store['max'], 3)
+
 
 class TestSQLiteMemoryStore(Store, unittest.TestCase):
 
@@ -177,4 +795,231 @@ class TestSQLiteMemoryStore(Store, unittest.TestCase):
 
 class TestSQLiteDiskStore(PathStore, unittest.TestCase):
 
+    initstring = 'lite://test.db'
+
+    def _committed(self):
+        # what another connection sees
+        import sqlite3
+        other = sqlite3.connect('test.db')
+        try:
+            return other.execute('SELECT COUNT(*) FROM shove').fetchone()[0]
+        finally:
+            other.close()
+
+    def test_commit_every(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring + '?commit_every=3', sync=0)
+        self.store['max'] = 3
+        self.store['min'] = 6
+        self.assertEqual(self._committed(), 0)
+        self.assertEqual(len(self.store), 2)
+        self.store['pow'] = 7
+        self.assertEqual(self._committed(), 3)
+        self.store['abs'] = 1
+        self.store.close()
+        self.assertEqual(self._committed(), 4)
+
+    def test_commit_interval(self):
+        import time
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring, sync=0, commit_every=100, commit_interval=0.05
+        )
+        self.store['max'] = 3
+        self.assertEqual(self._committed(), 0)
+        # committed by the timer without waiting for another write
+        time.sleep(0.3)
+        self.assertEqual(self._committed(), 1)
+        self.store['min'] = 6
+        time.sleep(0.3)
+        self.assertEqual(self._committed(), 2)
+
+    def test_transaction(self):
+        store = self.store._store
+        with store.transaction():
+            store['max'] = 3
+            store['min'] = 6
+            self.assertEqual(self._committed(), 0)
+        self.assertEqual(self._committed(), 2)
+        try:
+            with store.transaction():
+                store['pow'] = 7
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual('pow' in store, False)
+        self.assertEqual(len(store), 2)
+
+    def test_pool(self):
+        import time
+        from threading import Event, Thread, current_thread
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring + '?pool=1', sync=0)
+        store = self.store._store
+        self.assertEqual(store.concurrency, None)
+        execute = store._store.execute
+        self.assertEqual(execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        store.set_many(('key{0}'.format(i), i) for i in range(10))
+        found, release = [], Event()
+
+        def read():
+            found.append(store.get_many('key{0}'.format(i) for i in range(10)))
+            found.append(store['key1'])
+            # alive until every thread has its connection
+            release.wait(5)
+        threads = [Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        deadline = time.time() + 5
+        while len(found) < 8 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(store._readers), 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(found.count(1), 4)
+        self.assertEqual(len(found), 8)
+        # a new reader closes the connections of threads that exited
+        self.assertEqual(store['key2'], 2)
+        self.assertEqual(list(store._readers), [current_thread()])
+        # uncommitted writes are read through the writer
+        with store.transaction():
+            store['max'] = 3
+            self.assertEqual(store['max'], 3)
+            self.assertEqual(len(store), 11)
+
+    def test_pool_commit_every(self):
+        import time
+        from threading import Thread
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring + '?pool=1&commit_every=100&commit_interval=0.05',
+            sync=0,
+        )
+        store = self.store._store
+        store.set_many(('key{0}'.format(i), i) for i in range(10))
+        # uncommitted, so read through the writer
+        self.assertEqual(store._reader(), None)
+        self.assertEqual(store['key1'], 1)
+        deadline = time.time() + 5
+        while store._dirty and time.time() < deadline:
+            time.sleep(0.01)
+        # committed by the timer, so reads go back to the pool
+        pooled, found = [], []
+
+        def read():
+            pooled.append(store._reader() is not None)
+            found.append(store['key1'])
+        threads = [Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(pooled, [True] * 4)
+        self.assertEqual(found, [1] * 4)
+
+    def test_raw_keys(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring + '?raw_keys=1', sync=0)
+        store = self.store._store
+        store.set_many(('key{0}'.format(i), i) for i in range(20))
+        self.assertEqual(
+            store._store.execute('SELECT MIN(key) FROM shove').fetchone()[0],
+            'key0',
+        )
+        plan = store._store.execute(
+            'EXPLAIN QUERY PLAN SELECT key, value FROM shove '
+            'WHERE key >= ? AND key < ? ORDER BY key', ('key1', 'key2'),
+        ).fetchall()
+        self.assertEqual('INDEX' in str(plan), True)
+        self.assertEqual(
+            list(store.scan(prefix='key1', limit=3)),
+            [('key1', 1), ('key10', 10), ('key11', 11)],
+        )
+        self.assertEqual(sorted(store)[:2], ['key0', 'key1'])
+        self.assertRaises(TypeError, store.__setitem__, 1, 1)
+        self.assertRaises(TypeError, store.set_many, {1: 1})
+        # a key that cannot be stored is missing
+        self.assertEqual(1 in store, False)
+        self.assertEqual(store.get(1), None)
+        self.assertEqual(store.get_many([1, 'key1']), {'key1': 1})
+        self.assertRaises(KeyError, store.__delitem__, 1)
+        store.delete_many([1, 'key1'])
+        self.assertEqual('key1' in store, False)
+        self.assertEqual(self.store.get(1), None)
+
+    def test_blob_values(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(self.initstring, sync=0, blob_threshold=1000)
+        store = self.store._store
+        big = b'x' * 100000
+        store['big'] = big
+        store.set_many({'bigger': big * 2, 'small': 1})
+        self.assertEqual(store['big'], big)
+        self.assertEqual(store.get_many(['bigger'])['bigger'], big * 2)
+        self.assertEqual(store['small'], 1)
+        self.assertEqual(
+            store._store.execute(
+                'SELECT DISTINCT typeof(value) FROM shove'
+            ).fetchall(),
+            [('blob',)],
+        )
+
+    def test_migrate_text_values(self):
+        import sqlite3
+        from stuf.six import pickle
+        from shove import Shove
+        self.store.close()
+        old = sqlite3.connect('old.db')
+        old.execute(
+            'CREATE TABLE shove (key TEXT PRIMARY KEY NOT NULL, '
+            'value TEXT NOT NULL)'
+        )
+        old.execute(
+            'INSERT INTO shove VALUES (?, ?)',
+            (pickle.dumps('max'), pickle.dumps(3)),
+        )
+        old.commit()
+        old.close()
+        self.store = Shove('lite://old.db', sync=0)
+        columns = self.store._store._store.execute(
+            'PRAGMA table_info(shove)'
+        ).fetchall()
+        self.assertEqual(columns[1][2], 'BLOB')
+        self.assertEqual(self.store['max'], 3)
+
+    def test_pragmas(self):
+        from shove import Shove
+        self.store.close()
+        self.store = Shove(
+            self.initstring + '?journal_mode=wal', sync=0,
+            journal_mode='delete', synchronous='normal', cache_size=-4000,
+        )
+        execute = self.store._store._store.execute
+        self.assertEqual(execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(execute('PRAGMA synchronous').fetchone()[0], 1)
+        self.assertEqual(execute('PRAGMA cache_size').fetchone()[0], -4000)
+        self.assertRaises(
+            ValueError, Shove, self.initstring + '?journal_mode=bogus'
+        )
+        self.assertRaises(
+            ValueError, Shove, self.initstring + '?foreign_keys=on'
+        )
+
+
+class TestWriteBehindMemoryStore(WriteBehindStore, unittest.TestCase):
+
+    initstring = 'memory://'
+
+
+class TestWriteBehindSQLiteDiskStore(
+    PathStore, WriteBehindStore, unittest.TestCase
+):
+
     initstring = 'lite://test.db'
\ No newline at end of file